@@ -0,0 +1,442 @@
+from __future__ import annotations
+
+import argparse
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from sqlite3_cache import Cache
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+__all__ = [
+    "BASELINE",
+    "LAYOUTS",
+    "OPERATIONS",
+    "PRAGMA_VARIANTS",
+    "Scenario",
+    "compare",
+    "main",
+    "run_scenario",
+]
+
+
+COUNTERS = 1_000
+# Largest amount of prefilled data, value size times key count, in a scenario.
+# Scenarios over the limit are skipped, unless it's raised with `--max-data-size`.
+MAX_DATA_SIZE = 2**30
+
+PRAGMA_VARIANTS: dict[str, dict[str, int | str]] = {
+    "default": {},
+    "synchronous-normal": {"synchronous": "normal"},
+    "no-mmap": {"mmap_size": 0},
+    "large-page-cache": {"cache_size": -65536},
+}
+
+LAYOUTS = ["rowid", "without_rowid"]
+
+# Matrix dimensions, and the scenario fields they set.
+DIMENSIONS = {
+    "value_sizes": "value_size",
+    "key_counts": "key_count",
+    "threads": "threads",
+    "processes": "processes",
+    "storage": "storage",
+    "pragmas": "pragma",
+    "layouts": "layout",
+}
+
+# The quick matrix runs every combination of its dimensions.
+QUICK = {
+    "value_sizes": [64, 4096],
+    "key_counts": [1_000],
+    "threads": [1, 4],
+    "processes": [1],
+    "storage": ["memory", "file"],
+    "pragmas": ["default"],
+    "layouts": ["rowid"],
+    "iterations": 500,
+}
+
+# The full matrix varies one dimension at a time around the baseline, since every combination
+# would be thousands of scenarios.
+BASELINE = {
+    "value_size": 1024,
+    "key_count": 1_000,
+    "threads": 1,
+    "processes": 1,
+    "storage": "file",
+    "pragma": "default",
+    "layout": "rowid",
+}
+
+FULL = {
+    "value_sizes": [16, 1024, 65_536, 1_048_576],
+    "key_counts": [1_000, 100_000],
+    "threads": [1, 4, 16],
+    "processes": [1, 4],
+    "storage": ["memory", "file"],
+    "pragmas": list(PRAGMA_VARIANTS),
+    "layouts": LAYOUTS,
+    "iterations": 2_000,
+}
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """A single point in the benchmark matrix."""
+
+    operation: str
+    value_size: int
+    key_count: int
+    threads: int = 1
+    processes: int = 1
+    storage: str = "memory"
+    pragma: str = "default"
+    layout: str = "rowid"
+    iterations: int = 1_000
+    batch_size: int = 100
+    seed: int = 0
+
+    @property
+    def name(self) -> str:
+        # The default layout is left out, so that names match results from before layouts were added.
+        layout = "" if self.layout == "rowid" else f",layout={self.layout}"
+        return (
+            f"{self.operation}[size={self.value_size},keys={self.key_count},threads={self.threads},"
+            f"processes={self.processes},storage={self.storage},pragma={self.pragma}{layout}]"
+        )
+
+
+def _key(i: int) -> str:
+    return f"key:{i:08d}"
+
+
+def _open_cache(scenario: Scenario, directory: str) -> Cache:
+    return Cache(
+        filename="bench.sqlite",
+        path=directory,
+        in_memory=scenario.storage == "memory",
+        layout=scenario.layout,
+        **PRAGMA_VARIANTS[scenario.pragma],
+    )
+
+
+def _prefill(cache: Cache, scenario: Scenario) -> None:
+    payload = random.Random(scenario.seed).randbytes(scenario.value_size)
+    for start in range(0, scenario.key_count, scenario.batch_size):
+        stop = min(start + scenario.batch_size, scenario.key_count)
+        cache.set_many({_key(i): payload for i in range(start, stop)}, timeout=-1)
+    cache.set_many({f"counter:{i:04d}": 0 for i in range(min(scenario.key_count, COUNTERS))}, timeout=-1)
+
+
+def _get(cache: Cache, scenario: Scenario, rng: random.Random, payload: bytes) -> Callable[[], Any]:
+    return lambda: cache.get(_key(rng.randrange(scenario.key_count)))
+
+
+def _set(cache: Cache, scenario: Scenario, rng: random.Random, payload: bytes) -> Callable[[], Any]:
+    return lambda: cache.set(_key(rng.randrange(scenario.key_count)), payload, timeout=-1)
+
+
+def _get_many(cache: Cache, scenario: Scenario, rng: random.Random, payload: bytes) -> Callable[[], Any]:
+    batch = min(scenario.batch_size, scenario.key_count)
+    return lambda: cache.get_many([_key(i) for i in rng.sample(range(scenario.key_count), batch)])
+
+
+def _set_many(cache: Cache, scenario: Scenario, rng: random.Random, payload: bytes) -> Callable[[], Any]:
+    batch = min(scenario.batch_size, scenario.key_count)
+    return lambda: cache.set_many({_key(i): payload for i in rng.sample(range(scenario.key_count), batch)}, timeout=-1)
+
+
+def _memoize(cache: Cache, scenario: Scenario, rng: random.Random, payload: bytes) -> Callable[[], Any]:
+    @cache.memoize(timeout=-1)
+    def compute(_i: int) -> bytes:
+        return payload
+
+    return lambda: compute(rng.randrange(scenario.key_count))
+
+
+def _incr(cache: Cache, scenario: Scenario, rng: random.Random, payload: bytes) -> Callable[[], Any]:
+    counters = min(scenario.key_count, COUNTERS)
+    return lambda: cache.incr(f"counter:{rng.randrange(counters):04d}")
+
+
+def _find_keys(cache: Cache, scenario: Scenario, rng: random.Random, payload: bytes) -> Callable[[], Any]:
+    # Strip the last two digits so that each prefix matches up to a hundred keys.
+    return lambda: cache.find_keys_starting_with(_key(rng.randrange(scenario.key_count))[:-2])
+
+
+OPERATIONS: dict[str, Callable[[Cache, Scenario, random.Random, bytes], Callable[[], Any]]] = {
+    "get": _get,
+    "set": _set,
+    "get_many": _get_many,
+    "set_many": _set_many,
+    "memoize": _memoize,
+    "incr": _incr,
+    "find_keys": _find_keys,
+}
+
+
+def _thread_worker(
+    cache: Cache,
+    scenario: Scenario,
+    seed: int,
+    barrier: threading.Barrier,
+    samples: list[int],
+) -> None:
+    rng = random.Random(seed)
+    operation = OPERATIONS[scenario.operation](cache, scenario, rng, rng.randbytes(scenario.value_size))
+    local_samples: list[int] = []
+    barrier.wait()
+    for _ in range(scenario.iterations):
+        start = time.perf_counter_ns()
+        operation()
+        local_samples.append(time.perf_counter_ns() - start)
+    samples.extend(local_samples)
+
+
+def _process_worker(
+    scenario: Scenario,
+    directory: str,
+    process_index: int,
+    barrier: threading.Barrier | None = None,
+) -> tuple[list[int], int, int]:
+    cache = _open_cache(scenario, directory)
+    samples: list[int] = []
+    thread_barrier = threading.Barrier(scenario.threads)
+    threads = [
+        threading.Thread(
+            target=_thread_worker,
+            args=(cache, scenario, scenario.seed + process_index * scenario.threads + n, thread_barrier, samples),
+        )
+        for n in range(scenario.threads)
+    ]
+    if barrier is not None:
+        barrier.wait()
+
+    # The monotonic clock is system-wide, so windows from different processes can be compared.
+    start = time.monotonic_ns()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    end = time.monotonic_ns()
+
+    cache.close()
+    return samples, start, end
+
+
+def _percentile(ordered: list[int], fraction: float) -> float:
+    index = min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))
+    return ordered[index] / 1_000
+
+
+def run_scenario(scenario: Scenario) -> dict[str, Any]:
+    """
+    Run a single benchmark scenario in a fresh database, and return its statistics.
+
+    :param scenario: The scenario to run.
+    :return: Scenario parameters together with throughput and latency percentiles (in microseconds).
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        cache = _open_cache(scenario, directory)
+        _prefill(cache, scenario)
+
+        if scenario.processes == 1:
+            results = [_process_worker(scenario, directory, 0)]
+        else:
+            context = multiprocessing.get_context("spawn")
+            with context.Manager() as manager, context.Pool(scenario.processes) as pool:
+                barrier = manager.Barrier(scenario.processes)
+                results = pool.starmap(
+                    _process_worker,
+                    [(scenario, directory, n, barrier) for n in range(scenario.processes)],
+                )
+
+        cache.close()
+
+    samples = sorted(itertools.chain.from_iterable(result[0] for result in results))
+    elapsed = (max(result[2] for result in results) - min(result[1] for result in results)) / 1_000_000_000
+    return {
+        "name": scenario.name,
+        **asdict(scenario),
+        "operations": len(samples),
+        "elapsed_s": elapsed,
+        "ops_per_s": len(samples) / elapsed,
+        "mean_us": sum(samples) / len(samples) / 1_000,
+        "p50_us": _percentile(samples, 0.50),
+        "p90_us": _percentile(samples, 0.90),
+        "p99_us": _percentile(samples, 0.99),
+        "max_us": samples[-1] / 1_000,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],  # noqa: S607
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def _metadata(seed: int) -> dict[str, Any]:
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+    }
+
+
+def compare(base: dict[str, Any], head: dict[str, Any], threshold: float) -> list[dict[str, Any]]:
+    """
+    Compare two benchmark runs scenario by scenario.
+
+    :param base: Results of the baseline run.
+    :param head: Results of the run to compare against the baseline.
+    :param threshold: Relative throughput loss, or p99 latency increase, counted as a regression.
+    :return: One row per scenario present in both runs.
+    """
+    base_results = {result["name"]: result for result in base["results"]}
+    rows: list[dict[str, Any]] = []
+    for result in head["results"]:
+        previous = base_results.get(result["name"])
+        if previous is None:
+            continue
+
+        throughput = result["ops_per_s"] / previous["ops_per_s"]
+        p99 = result["p99_us"] / previous["p99_us"]
+        rows.append(
+            {
+                "name": result["name"],
+                "throughput_ratio": throughput,
+                "p99_ratio": p99,
+                "regression": throughput < 1 - threshold or p99 > 1 + threshold,
+            }
+        )
+    return rows
+
+
+def _every_combination(matrix: dict[str, list[Any]]) -> list[dict[str, Any]]:
+    return [
+        dict(zip(DIMENSIONS.values(), values, strict=True))
+        for values in itertools.product(*(matrix[dimension] for dimension in DIMENSIONS))
+    ]
+
+
+def _one_at_a_time(matrix: dict[str, list[Any]]) -> list[dict[str, Any]]:
+    combinations = [BASELINE]
+    for dimension, field in DIMENSIONS.items():
+        for value in matrix[dimension]:
+            combination = {**BASELINE, field: value}
+            if combination not in combinations:
+                combinations.append(combination)
+    return combinations
+
+
+def _run_command(args: argparse.Namespace) -> int:
+    preset = FULL if args.full else QUICK
+    matrix = {dimension: getattr(args, dimension) or preset[dimension] for dimension in DIMENSIONS}
+    iterations = args.iterations or preset["iterations"]
+
+    combinations = _one_at_a_time(matrix) if args.full else _every_combination(matrix)
+    too_large = [
+        combination
+        for combination in combinations
+        if combination["value_size"] * combination["key_count"] > args.max_data_size
+    ]
+    if too_large:
+        sys.stderr.write(f"Skipping {len(too_large)} combinations with more than {args.max_data_size} bytes of data.\n")
+
+    scenarios = [
+        Scenario(operation=operation, **combination, iterations=iterations, seed=args.seed)
+        for operation in args.operations or list(OPERATIONS)
+        for combination in combinations
+        if combination not in too_large
+    ]
+
+    results = []
+    for n, scenario in enumerate(scenarios, start=1):
+        result = run_scenario(scenario)
+        results.append(result)
+        sys.stderr.write(
+            f"[{n}/{len(scenarios)}] {scenario.name}: {result['ops_per_s']:,.0f} ops/s, "
+            f"p50 {result['p50_us']:.1f}us, p99 {result['p99_us']:.1f}us\n",
+        )
+
+    output = json.dumps({"meta": _metadata(args.seed), "results": results}, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+    else:
+        sys.stdout.write(output + "\n")
+    return 0
+
+
+def _compare_command(args: argparse.Namespace) -> int:
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+    head = json.loads(Path(args.head).read_text(encoding="utf-8"))
+    rows = compare(base, head, args.threshold)
+    sys.stdout.write(json.dumps(rows, indent=2) + "\n")
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="sqlite3-cache benchmark suite.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Run the benchmark matrix and output the results as JSON.")
+    run.add_argument("--operations", nargs="+", choices=list(OPERATIONS))
+    run.add_argument("--value-sizes", nargs="+", type=int)
+    run.add_argument("--key-counts", nargs="+", type=int)
+    run.add_argument("--threads", nargs="+", type=int)
+    run.add_argument("--processes", nargs="+", type=int)
+    run.add_argument("--storage", nargs="+", choices=["memory", "file"])
+    run.add_argument("--pragmas", nargs="+", choices=list(PRAGMA_VARIANTS))
+    run.add_argument("--layouts", nargs="+", choices=LAYOUTS)
+    run.add_argument("--iterations", type=int, help="Operations per worker thread.")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument(
+        "--max-data-size",
+        type=int,
+        default=MAX_DATA_SIZE,
+        help="Skip scenarios where value size times key count is larger than this many bytes.",
+    )
+    run.add_argument(
+        "--full",
+        action="store_true",
+        help="Vary each dimension of the full matrix around a baseline scenario, instead of running the quick one.",
+    )
+    run.add_argument("--output", help="Write results to this file instead of stdout.")
+    run.set_defaults(handler=_run_command)
+
+    cmp = subparsers.add_parser("compare", help="Compare two result files. Exits with 1 on regressions.")
+    cmp.add_argument("base")
+    cmp.add_argument("head")
+    cmp.add_argument("--threshold", type=float, default=0.1)
+    cmp.set_defaults(handler=_compare_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
@@ -1,3 +1,10 @@
-from .cache import Cache
+from .bloom import BloomFilter
+from .cache import ABSENT, Cache
+from .sketch import CountMinSketch
 
-__all__ = ["Cache"]
+__all__ = [
+    "ABSENT",
+    "BloomFilter",
+    "Cache",
+    "CountMinSketch",
+]
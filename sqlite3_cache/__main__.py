@@ -0,0 +1,5 @@
+import sys
+
+from sqlite3_cache.cli import main
+
+sys.exit(main())
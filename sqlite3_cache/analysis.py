@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import datetime
+import heapq
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .cache import Cache
+    from .typing import KeyReport, PrefixStats
+
+
+__all__ = [
+    "analyze_keys",
+]
+
+
+# Upper bounds of the TTL histogram buckets in seconds, by bucket name.
+TTL_BUCKETS: dict[str, float] = {
+    "<1m": 60,
+    "<1h": 60 * 60,
+    "<1d": 24 * 60 * 60,
+    "<1w": 7 * 24 * 60 * 60,
+    ">=1w": float("inf"),
+}
+
+
+def analyze_keys(cache: Cache, *, top: int = 10, separator: str = ":", batch_size: int = 1000) -> KeyReport:
+    """
+    Scan all keys in the cache, and report how the values are distributed by size, prefix and TTL.
+    Keys are read in small batches, each in its own read transaction, so that the scan can run on a cache
+    that is in use without holding back checkpoints of its WAL file. Values themselves are never read.
+
+    :param cache: Cache to scan. Opening it with `read_only=True` makes sure the scan never writes.
+    :param top: Number of largest values to report.
+    :param separator: Keys are grouped by the part before the first occurrence of this separator.
+                      Keys without the separator are grouped under an empty prefix.
+    :param batch_size: Number of keys to read at a time.
+    """
+    now = datetime.datetime.now(tz=datetime.timezone.utc).timestamp()
+    report: KeyReport = {
+        "count": 0,
+        "bytes": 0,
+        "expired": 0,
+        "expired_share": 0.0,
+        "sizes": {},
+        "largest": [],
+        "prefixes": {},
+        "ttls": {"expired": 0, "none": 0, **dict.fromkeys(TTL_BUCKETS, 0)},
+    }
+    largest: list[tuple[int, str]] = []
+
+    last: str = ""
+    operator = ">="
+    while True:
+        data = {"last": last, "limit": batch_size}
+        rows: list[tuple[str, int, float]] = cache._con.execute(cache._scan_sql.format(operator), data).fetchall()
+        for key, size, exp in rows:
+            report["count"] += 1
+            report["bytes"] += size
+
+            bucket = 1 << max(size - 1, 0).bit_length()
+            report["sizes"][bucket] = report["sizes"].get(bucket, 0) + 1
+
+            if len(largest) < top:
+                heapq.heappush(largest, (size, key))
+            elif top > 0 and size > largest[0][0]:
+                heapq.heapreplace(largest, (size, key))
+
+            prefix = key.split(separator, 1)[0] if separator in key else ""
+            stats: PrefixStats = report["prefixes"].setdefault(prefix, {"count": 0, "bytes": 0})
+            stats["count"] += 1
+            stats["bytes"] += size
+
+            report["ttls"][_ttl_bucket(exp, now)] += 1
+
+        if len(rows) < batch_size:
+            break
+        last = rows[-1][0]
+        operator = ">"
+
+    report["expired"] = report["ttls"]["expired"]
+    report["expired_share"] = report["expired"] / report["count"] if report["count"] else 0.0
+    report["sizes"] = dict(sorted(report["sizes"].items()))
+    report["largest"] = [(key, size) for size, key in sorted(largest, reverse=True)]
+    return report
+
+
+def _ttl_bucket(exp: float, now: float) -> str:
+    if exp == -1.0:
+        return "none"
+    if exp <= now:
+        return "expired"
+    return next(name for name, limit in TTL_BUCKETS.items() if exp - now < limit)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import math
+from threading import Lock
+from typing import TYPE_CHECKING
+
+from .hashing import hash_positions
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+
+__all__ = ["BloomFilter"]
+
+
+class BloomFilter:
+    """
+    Probabilistic set of strings. Never gives false negatives, and gives false positives
+    at about the given error rate, as long as no more than `capacity` keys have been added.
+    Keys cannot be removed, only the whole filter can be cleared.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        """
+        Create an empty filter.
+
+        :param capacity: Number of keys the filter is sized for.
+        :param error_rate: Wanted false positive rate when the filter is at capacity.
+        :raises ValueError: Capacity is not positive, or error rate is not between 0 and 1.
+        """
+        if capacity <= 0:
+            msg = f"Capacity must be a positive integer, got {capacity!r}."
+            raise ValueError(msg)
+
+        if not 0 < error_rate < 1:
+            msg = f"Error rate must be between 0 and 1, got {error_rate!r}."
+            raise ValueError(msg)
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # https://en.wikipedia.org/wiki/Bloom_filter#Optimal_number_of_hash_functions
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in hash_positions(key, self.hashes, self.size))
+
+    def add(self, key: str) -> None:
+        """
+        Add a key to the filter.
+
+        :param key: Key to add.
+        """
+        positions = list(hash_positions(key, self.hashes, self.size))
+        # Setting a bit is a read-modify-write, so concurrent adds could lose bits without the lock.
+        with self._lock:
+            for pos in positions:
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def update(self, keys: Iterable[str]) -> None:
+        """
+        Add all the given keys to the filter.
+
+        :param keys: Keys to add.
+        """
+        for key in keys:
+            self.add(key)
+
+    def clear(self) -> None:
+        """Remove all keys from the filter."""
+        with self._lock:
+            self._bits = bytearray(len(self._bits))
@@ -1,16 +1,31 @@
 from __future__ import annotations
 
 import datetime
+import logging
+import math
+import os
 import pickle
+import random
+import re
 import sqlite3
-from contextlib import suppress
+import time
+import uuid
+from collections.abc import Mapping
+from contextlib import contextmanager, suppress
 from functools import wraps
 from pathlib import Path
-from threading import local
-from typing import TYPE_CHECKING, Any, ClassVar, Literal
+from threading import Event, Lock, Thread, local
+from typing import TYPE_CHECKING, Any, ClassVar, Literal, get_args
+from weakref import WeakSet
+
+from .bloom import BloomFilter
+from .sketch import CountMinSketch
+from .typing import CacheStats, Change, CheckpointMode, CheckpointResult, ContentionStats, RateLimit
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
+    from collections.abc import Callable, Iterable, Iterator
+
+    from .typing import ChangeOp, CollectionType, Layout, RateLimitAlgorithm, Timeouts
 
 try:
     from typing import Self
@@ -18,7 +33,118 @@
     from typing_extensions import Self
 
 
-__all__ = ["Cache"]
+__all__ = [
+    "ABSENT",
+    "Cache",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Absent:
+    """Marker for a value that is known not to exist, as opposed to not being cached."""
+
+    _instance: ClassVar[_Absent | None] = None
+
+    def __new__(cls) -> _Absent:  # noqa: PYI034
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __repr__(self) -> str:
+        return "ABSENT"
+
+    def __bool__(self) -> bool:
+        return False
+
+    def __reduce__(self) -> str:
+        # Unpickles to the module level singleton.
+        return "ABSENT"
+
+
+ABSENT = _Absent()
+
+# Caches created in this process, so that they can be reset in a child process after a fork.
+_instances: WeakSet[Cache] = WeakSet()
+# Connections inherited from the parent process in a fork. These are kept referenced so that they are
+# never closed or garbage collected, since closing them could checkpoint or remove the parent's WAL file.
+_inherited_connections: list[sqlite3.Connection] = []
+
+
+def _busy_retried(fallback: Callable[..., Any] | None = None) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Retry the decorated cache method while the database is locked, until the deadline of the cache.
+    If the cache fails open, return what the fallback returns for the same arguments instead of raising.
+    Only reads have a fallback, which returns what the read returns for missing keys.
+    Writes always raise, since skipping them could leave stale values in the cache.
+    """
+
+    def decorator(method: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(method)
+        def wrapper(self: Cache, *args: Any, **kwargs: Any) -> Any:
+            return self._retry_busy(method, fallback, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _return_default(_cache: Cache, _key: str, default: Any = None) -> Any:
+    return default
+
+
+def _return_touched_default(_cache: Cache, _key: str, _timeout: int | None = None, default: Any = None) -> Any:
+    return default
+
+
+def _return_default_version(_cache: Cache, _key: str, default: Any = None) -> tuple[Any, None]:
+    return default, None
+
+
+def _return_field_default(_cache: Cache, _key: str, _field: str, default: Any = None) -> Any:
+    return default
+
+
+def _return_empty(*_args: Any, **_kwargs: Any) -> dict[str, Any]:
+    return {}
+
+
+def _return_empty_set(*_args: Any, **_kwargs: Any) -> set[str]:
+    return set()
+
+
+def _return_empty_list(*_args: Any, **_kwargs: Any) -> list[Any]:
+    return []
+
+
+def _return_false(*_args: Any, **_kwargs: Any) -> bool:
+    return False
+
+
+def _return_none(*_args: Any, **_kwargs: Any) -> None:
+    return None
+
+
+def _after_fork_in_child() -> None:
+    # Locks might have been held by other threads of the parent during the fork.
+    Cache._initialized_lock = Lock()
+    # Logical caches share their connections, so they are reset together.
+    reset: set[int] = set()
+    for cache in list(_instances):
+        if id(cache._logical) not in reset:
+            reset.add(id(cache._logical))
+            cache._reset_after_fork()
+
+
+class _ThreadConnection:
+    """Connection owned by a single thread, but reachable from other threads for closing it."""
+
+    __slots__ = ("__weakref__", "con", "uses")
+
+    def __init__(self, con: sqlite3.Connection) -> None:
+        self.con: sqlite3.Connection | None = con
+        self.uses = 0
 
 
 class Cache:
@@ -26,43 +152,217 @@ class Cache:
 
     PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
     DEFAULT_TIMEOUT = 300
+    DEFAULT_ABSENT_TIMEOUT = 60
+    # Run 'PRAGMA optimize' after a connection has been used this many times. Zero disables.
+    OPTIMIZE_EVERY = 10_000
     DEFAULT_PRAGMA: ClassVar[dict[str, int | str]] = {
         "mmap_size": 2**26,  # https://www.sqlite.org/pragma.html#pragma_mmap_size
         "cache_size": 8192,  # https://www.sqlite.org/pragma.html#pragma_cache_size
         "wal_autocheckpoint": 1000,  # https://www.sqlite.org/pragma.html#pragma_wal_autocheckpoint
-        "auto_vacuum": "none",  # https://www.sqlite.org/pragma.html#pragma_auto_vacuum
+        "journal_size_limit": 2**26,  # https://www.sqlite.org/pragma.html#pragma_journal_size_limit
+        "auto_vacuum": "incremental",  # https://www.sqlite.org/pragma.html#pragma_auto_vacuum
         "synchronous": "off",  # https://www.sqlite.org/pragma.html#pragma_synchronous
         "journal_mode": "wal",  # https://www.sqlite.org/pragma.html#pragma_journal_mode
         "temp_store": "memory",  # https://www.sqlite.org/pragma.html#pragma_temp_store
+        "analysis_limit": 400,  # https://www.sqlite.org/pragma.html#pragma_analysis_limit
     }
-
-    _transaction_sql = "BEGIN EXCLUSIVE TRANSACTION; {} COMMIT TRANSACTION;"
-
-    _create_sql = "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, exp FLOAT);"
-    _create_index_sql = "CREATE UNIQUE INDEX IF NOT EXISTS cache_key ON cache(key);"
+    PRAGMA_PROFILES: ClassVar[dict[str, dict[str, int | str]]] = {
+        "throughput": {
+            "mmap_size": 2**28,
+            "cache_size": -65536,  # 64 MiB
+            "page_size": 8192,
+            "wal_autocheckpoint": 10000,
+            "journal_size_limit": 2**27,
+        },
+        "durable": {
+            "mmap_size": 2**26,
+            "cache_size": 8192,
+            "page_size": 4096,
+            "wal_autocheckpoint": 1000,
+            "journal_size_limit": 2**26,
+            "synchronous": "full",
+        },
+        "low-memory": {
+            "mmap_size": 0,
+            "cache_size": -2048,  # 2 MiB
+            "page_size": 4096,
+            "wal_autocheckpoint": 250,
+            "journal_size_limit": 2**22,
+            "temp_store": "file",
+        },
+    }
+    # Pragmas that are stored in the database file instead of the connection.
+    # These are applied once per file, in this order, before any tables are created.
+    # Only the WAL journal mode is stored in the file, so other modes are also applied to each connection.
+    DATABASE_PRAGMA: ClassVar[tuple[str, ...]] = ("page_size", "auto_vacuum", "journal_mode")
+    # Pickled values larger than this many bytes are split into chunks in a separate table,
+    # so that they don't fill the cache table with overflow pages. None disables.
+    LARGE_VALUE_THRESHOLD: int | None = 2**20
+    CHUNK_SIZE = 2**18
+    # Reads that extend the expiration of a value only rewrite it once this fraction
+    # of the timeout has passed since the last extension, to avoid a write on every read.
+    TOUCH_THRESHOLD = 0.1
+    # With a deadline, operations on a locked database are retried after a random delay of up to
+    # BUSY_BACKOFF_BASE seconds, doubling on each retry up to BUSY_BACKOFF_MAX seconds.
+    BUSY_BACKOFF_BASE = 0.001
+    BUSY_BACKOFF_MAX = 0.1
+    # With admission control, the number of values in the cache is counted again after this many new keys,
+    # instead of on every write. Deletes and expirations in between are only noticed then.
+    ADMISSION_RECOUNT = 1000
+
+    # Tables whose schema has been set up in this process, and whether the change log was enabled for them.
+    _initialized: ClassVar[set[tuple[str, str, bool]]] = set()
+    _initialized_lock: ClassVar[Lock] = Lock()
+
+    _create_sql = "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, exp FLOAT){table_options};"
+    _table_options: ClassVar[dict[str, str]] = {"rowid": "", "without_rowid": " WITHOUT ROWID"}
+    # Tables and indexes of a cache are named after its table, so other caches can't use names that end like them.
+    _auxiliary_suffixes: ClassVar[tuple[str, ...]] = (
+        "_chunk",
+        "_changelog",
+        "_exp",
+        "_hit",
+        "_hit_key",
+        "_item",
+        "_sketch",
+    )
+    _table_sql = "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'cache';"
+    # Chunked values have a NULL value in the cache table.
+    # The triggers remove the chunks when the value is deleted or replaced.
+    _create_chunk_sql = (
+        "CREATE TABLE IF NOT EXISTS cache_chunk "
+        "(key TEXT NOT NULL, seq INTEGER NOT NULL, data BLOB, PRIMARY KEY (key, seq));"
+    )
+    _create_chunk_delete_trigger_sql = (
+        "CREATE TRIGGER IF NOT EXISTS cache_chunk_delete AFTER DELETE ON cache WHEN old.value IS NULL "
+        "BEGIN DELETE FROM cache_chunk WHERE key = old.key; END;"
+    )
+    _create_chunk_update_trigger_sql = (
+        "CREATE TRIGGER IF NOT EXISTS cache_chunk_update AFTER UPDATE OF value ON cache WHEN old.value IS NULL "
+        "BEGIN DELETE FROM cache_chunk WHERE key = old.key; END;"
+    )
+    # Every change to the cache table is logged by these triggers, when the change log is enabled.
+    _create_changelog_sql = (
+        "CREATE TABLE IF NOT EXISTS cache_changelog "
+        "(seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, op TEXT NOT NULL, exp FLOAT);"
+    )
+    _create_changelog_insert_trigger_sql = (
+        "CREATE TRIGGER IF NOT EXISTS cache_changelog_insert AFTER INSERT ON cache "
+        "BEGIN INSERT INTO cache_changelog (key, op, exp) VALUES (new.key, 'set', new.exp); END;"
+    )
+    _create_changelog_update_trigger_sql = (
+        "CREATE TRIGGER IF NOT EXISTS cache_changelog_set AFTER UPDATE OF value ON cache "
+        "BEGIN INSERT INTO cache_changelog (key, op, exp) VALUES (new.key, 'set', new.exp); END;"
+    )
+    # Updates that only extend the expiration, like 'touch', are logged without sending the value again.
+    # Writes of values always change their version.
+    _create_changelog_touch_trigger_sql = (
+        "CREATE TRIGGER IF NOT EXISTS cache_changelog_touch AFTER UPDATE OF exp ON cache "
+        "WHEN new.version IS old.version AND new.value IS old.value "
+        "BEGIN INSERT INTO cache_changelog (key, op, exp) VALUES (new.key, 'touch', new.exp); END;"
+    )
+    # Older versions logged every update as a set.
+    _drop_changelog_old_update_trigger_sql = "DROP TRIGGER IF EXISTS cache_changelog_update;"
+    _create_changelog_delete_trigger_sql = (
+        "CREATE TRIGGER IF NOT EXISTS cache_changelog_delete AFTER DELETE ON cache "
+        "BEGIN INSERT INTO cache_changelog (key, op, exp) VALUES (old.key, 'delete', old.exp); END;"
+    )
+    # Hits of sliding window rate limits. The cache row of the limit holds the number of hits as an integer,
+    # and expires when the latest hit leaves the window. The trigger removes the hits with the row.
+    _create_hit_sql = "CREATE TABLE IF NOT EXISTS cache_hit (key TEXT NOT NULL, ts FLOAT NOT NULL);"
+    _create_hit_index_sql = "CREATE INDEX IF NOT EXISTS cache_hit_key ON cache_hit (key, ts);"
+    _create_hit_delete_trigger_sql = (
+        "CREATE TRIGGER IF NOT EXISTS cache_hit_delete AFTER DELETE ON cache WHEN typeof(old.value) = 'integer' "
+        "BEGIN DELETE FROM cache_hit WHERE key = old.key; END;"
+    )
+    # Fields of hashes, members of sets, and items of lists. The cache row of a collection holds its type
+    # as text, and its expiration time. The triggers remove the items when the row is deleted or replaced.
+    # Fields are hash field names, set members, or integer list positions, so the column has no type.
+    _create_item_sql = (
+        "CREATE TABLE IF NOT EXISTS cache_item "
+        "(key TEXT NOT NULL, field NOT NULL, value BLOB, PRIMARY KEY (key, field)) WITHOUT ROWID;"
+    )
+    _create_item_delete_trigger_sql = (
+        "CREATE TRIGGER IF NOT EXISTS cache_item_delete AFTER DELETE ON cache WHEN typeof(old.value) = 'text' "
+        "BEGIN DELETE FROM cache_item WHERE key = old.key; END;"
+    )
+    _create_item_update_trigger_sql = (
+        "CREATE TRIGGER IF NOT EXISTS cache_item_update AFTER UPDATE OF value ON cache "
+        "WHEN typeof(old.value) = 'text' "
+        "BEGIN DELETE FROM cache_item WHERE key = old.key; END;"
+    )
+    # Every write gives the value a new random version, so that compare-and-swap can detect
+    # changes made since the value was read, even if the key was deleted and set again.
+    _add_version_sql = "ALTER TABLE cache ADD COLUMN version INTEGER NOT NULL DEFAULT 0;"
+    # Saved counters of the count-min sketches used for admission control.
+    _create_sketch_sql = (
+        "CREATE TABLE IF NOT EXISTS cache_sketch "
+        "(name TEXT PRIMARY KEY, width INTEGER NOT NULL, depth INTEGER NOT NULL, data BLOB NOT NULL);"
+    )
+    # Orders values like eviction does, so that deleting expired values, evicting, and counting
+    # the values (with the smaller index) don't need to scan and sort the whole table.
+    _create_exp_index_sql = "CREATE INDEX IF NOT EXISTS cache_exp ON cache (exp = -1.0, exp);"
     _set_pragma = "PRAGMA {};"
     _set_pragma_equal = "PRAGMA {}={};"
+    _begin_immediate_sql = "BEGIN IMMEDIATE;"
+    # Schema versions of tables other than 'cache', whose version is kept in 'PRAGMA user_version'.
+    _create_schema_sql = (
+        "CREATE TABLE IF NOT EXISTS sqlite3_cache_schema (name TEXT PRIMARY KEY, version INTEGER NOT NULL);"
+    )
+    _get_schema_version_sql = "SELECT version FROM sqlite3_cache_schema WHERE name = :name;"
+    _set_schema_version_sql = "INSERT OR REPLACE INTO sqlite3_cache_schema (name, version) VALUES (:name, :version);"
+
+    # Statements that migrate the schema from version N to N+1 are at index N.
+    # The schema version of a database file is stored in 'PRAGMA user_version'.
+    # '{table_options}' is replaced with the options for the chosen layout.
+    _migrations: ClassVar[tuple[tuple[str, ...], ...]] = (
+        (
+            _create_sql,
+            # Older versions created an index that duplicated the primary key.
+            "DROP INDEX IF EXISTS cache_key;",
+            _create_chunk_sql,
+            _create_chunk_delete_trigger_sql,
+            _create_chunk_update_trigger_sql,
+        ),
+        (
+            _create_hit_sql,
+            _create_hit_index_sql,
+            _create_hit_delete_trigger_sql,
+        ),
+        (
+            _create_item_sql,
+            _create_item_delete_trigger_sql,
+            _create_item_update_trigger_sql,
+        ),
+        (_add_version_sql,),
+        (_create_sketch_sql,),
+        (_create_exp_index_sql,),
+    )
 
     _add_sql = (
-        "INSERT INTO cache (key, value, exp) VALUES (:key, :value, :exp) "
-        "ON CONFLICT(key) DO UPDATE SET value = :value, exp = :exp "
+        "INSERT INTO cache (key, value, exp, version) VALUES (:key, :value, :exp, RANDOM()) "
+        "ON CONFLICT(key) DO UPDATE SET value = :value, exp = :exp, version = excluded.version "
         "WHERE (exp <> -1.0 AND DATETIME(exp, 'unixepoch') <= DATETIME('now'));"
     )
     _get_sql = "SELECT value, exp FROM cache WHERE key = :key;"
     _set_sql = (
-        "INSERT INTO cache (key, value, exp) VALUES (:key, :value, :exp) "
-        "ON CONFLICT(key) DO UPDATE SET value = :value, exp = :exp;"
+        "INSERT INTO cache (key, value, exp, version) VALUES (:key, :value, :exp, RANDOM()) "
+        "ON CONFLICT(key) DO UPDATE SET value = :value, exp = :exp, version = excluded.version;"
     )
     _check_sql = (
         "SELECT value, exp FROM cache WHERE key = :key "
         "AND (exp = -1.0 OR DATETIME(exp, 'unixepoch') > DATETIME('now'));"
     )
     _update_sql = (
-        "UPDATE cache SET value = :value WHERE key = :key "
+        "UPDATE cache SET value = :value, version = RANDOM() WHERE key = :key "
+        "AND (exp = -1.0 OR DATETIME(exp, 'unixepoch') > DATETIME('now'));"
+    )
+    _gets_sql = "SELECT value, exp, version FROM cache WHERE key = :key;"
+    _cas_sql = (
+        "UPDATE cache SET value = :value, exp = :exp, version = RANDOM() WHERE key = :key AND version = :version "
         "AND (exp = -1.0 OR DATETIME(exp, 'unixepoch') > DATETIME('now'));"
     )
 
-    # TODO: add 'RETURNING COUNT(*)!=0' to these when sqlite3 version >=3.35.0
     _delete_sql = "DELETE FROM cache WHERE key = :key;"
     _touch_sql = (
         "UPDATE cache SET exp = :exp WHERE key = :key AND (exp = -1.0 OR DATETIME(exp, 'unixepoch') > DATETIME('now'));"
@@ -70,21 +370,118 @@ class Cache:
     _clear_sql = "DELETE FROM cache;"
 
     _add_many_sql = (
-        "INSERT INTO cache (key, value, exp) VALUES {}"
-        "ON CONFLICT(key) DO UPDATE SET value = excluded.value, exp = excluded.exp "
+        "INSERT INTO cache (key, value, exp, version) VALUES {}"
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value, exp = excluded.exp, version = excluded.version "
         "WHERE (exp <> -1.0 AND DATETIME(exp, 'unixepoch') <= DATETIME('now'));"
     )
     _get_many_sql = "SELECT key, value, exp FROM cache WHERE key IN ({});"
+    _gets_many_sql = "SELECT key, value, exp, version FROM cache WHERE key IN ({});"
     _set_many_sql = (
-        "INSERT INTO cache (key, value, exp) VALUES {}"
-        "ON CONFLICT(key) DO UPDATE SET value = excluded.value, exp = excluded.exp;"
+        "INSERT INTO cache (key, value, exp, version) VALUES {}"
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value, exp = excluded.exp, version = excluded.version;"
     )
     _delete_many_sql = "DELETE FROM cache WHERE key IN ({});"
+    _get_chunks_sql = "SELECT data FROM cache_chunk WHERE key = :key ORDER BY seq ASC;"
+    _set_chunk_sql = "INSERT OR REPLACE INTO cache_chunk (key, seq, data) VALUES (:key, :seq, :data);"
+    # Only pickled or raw values can be read as bytes, not the integers of rate limit counters
+    # or the types of collections.
+    _get_blob_sql = (
+        "SELECT rowid, LENGTH(value), exp FROM cache WHERE key = :key AND typeof(value) IN ('blob', 'null');"
+    )
+    _get_blob_without_rowid_sql = (
+        "SELECT NULL, LENGTH(value), exp FROM cache WHERE key = :key AND typeof(value) IN ('blob', 'null');"
+    )
+    _read_value_slice_sql = "SELECT SUBSTR(value, :start, :length) FROM cache WHERE key = :key;"
+    _get_chunk_blobs_sql = "SELECT rowid, LENGTH(data) FROM cache_chunk WHERE key = :key ORDER BY seq ASC;"
+    _read_blob_sql = "SELECT SUBSTR({column}, :start, :length) FROM {table} WHERE rowid = :rowid;"
+    _delete_orphan_chunks_sql = "DELETE FROM cache_chunk WHERE key NOT IN (SELECT key FROM cache);"
     _get_keys_sql = "SELECT key, exp FROM cache ORDER BY key ASC;"
+    _all_keys_sql = "SELECT key FROM cache;"
     _find_matching_keys_sql = "SELECT key, exp FROM cache WHERE key LIKE :pattern ORDER BY key ASC;"
     _clear_keys_matching_sql = "DELETE FROM cache WHERE key LIKE :pattern;"
 
-    def __init__(
+    _changes_since_sql = (
+        "SELECT log.seq, log.key, log.op, COALESCE(cache.exp, log.exp), cache.value, cache.key IS NOT NULL "
+        "FROM cache_changelog AS log LEFT JOIN cache ON log.op = 'set' AND cache.key = log.key "
+        "WHERE log.seq > :seq ORDER BY log.seq ASC LIMIT :limit;"
+    )
+    _set_exp_sql = "UPDATE cache SET exp = :exp WHERE key = :key;"
+    _trim_changelog_sql = "DELETE FROM cache_changelog WHERE seq <= :seq;"
+    _count_sql = "SELECT COUNT(*) FROM cache;"
+    # Keys with the size of their values and expiration times, a batch at a time in key order.
+    # '{}' is '>=' for the first batch and '>' for the following ones.
+    _scan_sql = (
+        "SELECT key, COALESCE(LENGTH(value), (SELECT SUM(LENGTH(data)) FROM cache_chunk WHERE key = cache.key), 0), "
+        "exp FROM cache WHERE key {} :last ORDER BY key ASC LIMIT :limit;"
+    )
+    # Rate limit counters are stored as integers instead of pickled values, so that SQLite can update them.
+    # Denied hits don't update the row, so they return nothing.
+    _hit_fixed_window_sql = (
+        "INSERT INTO cache (key, value, exp) VALUES (:key, 1, :now + :window) "
+        "ON CONFLICT(key) DO UPDATE SET "
+        "value = CASE WHEN exp <> -1.0 AND exp <= :now THEN 1 ELSE value + 1 END, "
+        "exp = CASE WHEN exp <> -1.0 AND exp <= :now THEN :now + :window ELSE exp END "
+        "WHERE (exp <> -1.0 AND exp <= :now) OR value < :limit "
+        "RETURNING value, exp;"
+    )
+    # Token buckets use the generic cell rate algorithm, where the expiration time is the theoretical
+    # arrival time of the next hit. The bucket is full again when the row expires.
+    _hit_token_bucket_sql = (
+        "INSERT INTO cache (key, value, exp) VALUES (:key, 0, :now + :interval) "  # noqa: S105
+        "ON CONFLICT(key) DO UPDATE SET exp = MAX(exp, :now) + :interval "
+        "WHERE MAX(exp, :now) + :interval <= :max_exp "
+        "RETURNING exp;"
+    )
+    _delete_old_hits_sql = "DELETE FROM cache_hit WHERE key = :key AND ts <= :start;"
+    _get_hits_sql = "SELECT COUNT(*), MIN(ts), MAX(ts) FROM cache_hit WHERE key = :key;"
+    _add_hit_sql = "INSERT INTO cache_hit (key, ts) VALUES (:key, :now);"
+    _get_item_sql = "SELECT value FROM cache_item WHERE key = :key AND field = :field;"
+    _get_items_sql = "SELECT field, value FROM cache_item WHERE key = :key ORDER BY field ASC;"
+    _get_item_range_sql = (
+        "SELECT value FROM cache_item WHERE key = :key ORDER BY field ASC LIMIT :limit OFFSET :offset;"
+    )
+    _get_item_bounds_sql = "SELECT COUNT(*), MIN(field), MAX(field) FROM cache_item WHERE key = :key;"
+    _add_item_sql = "INSERT INTO cache_item (key, field, value) VALUES (:key, :field, :value) ON CONFLICT DO NOTHING;"
+    _set_item_sql = (
+        "INSERT INTO cache_item (key, field, value) VALUES (:key, :field, :value) "
+        "ON CONFLICT(key, field) DO UPDATE SET value = :value;"
+    )
+    _delete_item_sql = "DELETE FROM cache_item WHERE key = :key AND field = :field;"
+    _delete_empty_collection_sql = (
+        "DELETE FROM cache WHERE key = :key AND NOT EXISTS (SELECT 1 FROM cache_item WHERE key = :key);"
+    )
+    _delete_orphan_items_sql = "DELETE FROM cache_item WHERE key NOT IN (SELECT key FROM cache);"
+    # Memoized streams are lists whose items are at positions 0 to count - 1.
+    _get_stream_sql = (
+        "SELECT version, exp, (SELECT COUNT(*) FROM cache_item WHERE key = :key) "
+        "FROM cache WHERE key = :key AND value = 'list';"
+    )
+    _get_stream_items_sql = (
+        "SELECT item.field, item.value FROM cache_item AS item JOIN cache ON cache.key = item.key "
+        "WHERE item.key = :key AND cache.version = :version AND item.field >= :start "
+        "ORDER BY item.field ASC LIMIT :limit;"
+    )
+    # Items of a stream that is still being written have no cache row, so that they are not listed as keys.
+    # Items left by a stream that was abandoned are removed by 'compact', like other orphaned items.
+    _rename_items_sql = "UPDATE cache_item SET key = :key WHERE key = :temp_key;"
+    _delete_items_sql = "DELETE FROM cache_item WHERE key = :key;"
+    _delete_orphan_hits_sql = "DELETE FROM cache_hit WHERE key NOT IN (SELECT key FROM cache);"
+    _get_sketch_sql = "SELECT width, depth, data FROM cache_sketch WHERE name = :name;"
+    _set_sketch_sql = (
+        "INSERT OR REPLACE INTO cache_sketch (name, width, depth, data) VALUES (:name, :width, :depth, :data);"
+    )
+    _existing_keys_sql = "SELECT key FROM cache WHERE key IN ({});"
+    # Values that expire soonest are evicted first, and values that never expire last.
+    _evict_sql = "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY exp = -1.0 ASC, exp ASC LIMIT :count);"
+    _eviction_candidates_sql = "SELECT key FROM cache ORDER BY exp = -1.0 ASC, exp ASC LIMIT :count;"
+    # Compares the expression of the 'cache_exp' index, so that SQLite can search the index for expired values.
+    _delete_expired_sql = "DELETE FROM cache WHERE (exp = -1.0) = FALSE AND exp <= :now;"
+    _checkpoint_sql = "PRAGMA wal_checkpoint({});"
+    _incremental_vacuum_sql = "PRAGMA incremental_vacuum({});"
+    _vacuum_sql = "VACUUM;"
+    _analyze_sql = "ANALYZE;"
+
+    def __init__(  # noqa: PLR0913, PLR0915
         self,
         *,
         filename: str = ".cache",
@@ -92,6 +489,16 @@ def __init__(
         in_memory: bool = True,
         timeout: int = 5,
         isolation_level: Literal["DEFERRED", "IMMEDIATE", "EXCLUSIVE"] | None = "DEFERRED",
+        profile: str | None = None,
+        ttl_jitter: float = 0.0,
+        changelog: bool = False,
+        layout: Layout = "rowid",
+        sliding: bool = False,
+        read_only: bool = False,
+        table: str = "cache",
+        default_timeout: int = DEFAULT_TIMEOUT,
+        deadline: float | None = None,
+        fail_open: bool = False,
         **kwargs: Any,
     ) -> None:
         """
@@ -104,40 +511,188 @@ def __init__(
         :param isolation_level: Controls the transaction handling performed by sqlite3.
                                 If set to None, transactions are never implicitly opened.
                                 https://www.sqlite.org/lang_transaction.html
+        :param profile: Name of a pragma profile in `PRAGMA_PROFILES` to use on top of `DEFAULT_PRAGMA`.
+        :param ttl_jitter: Shorten the timeouts of set values by a random fraction up to this much,
+                           so that values set at the same time don't all expire at the same time.
+        :param changelog: Log all changes to the cache file, so that they can be replicated to
+                          other caches with `changes_since` and `apply_changes`.
+                          Once enabled, all instances using the same file log their changes.
+        :param layout: Storage layout of the cache table. "without_rowid" stores the values in the
+                       primary key B-tree, so that lookups only need to search one B-tree.
+                       Only has an effect when the database file is created.
+        :param sliding: Extend the expiration of values by the default timeout whenever they are read.
+        :param read_only: Only read the cache, which another cache instance writes to. The database file
+                          is opened in read-only mode, is not set up or migrated, and expired values are
+                          skipped instead of deleted when found, so that readers never take the write lock.
+                          Until the writer has created the cache, `get`, `get_many` and `in` miss,
+                          and other methods raise `sqlite3.OperationalError`.
+        :param table: Name of the table that holds this cache. Caches in different tables of the same
+                      database file are separate. The names of the cache's other tables start with it,
+                      so names that end like those tables, for example "_chunk" or "_item", are invalid.
+        :param default_timeout: Timeout for values when a method is not given one.
+        :param deadline: Seconds an operation can spend retrying while the database is locked by other
+                         connections, with jittered exponential backoff. SQLite then fails immediately on
+                         a locked database instead of waiting for the connection timeout. None disables retries.
+        :param fail_open: When a read can't get to a locked database, return what it returns for missing keys,
+                          instead of raising `sqlite3.OperationalError`. Writes still raise.
         :param kwargs: Pragma settings. https://www.sqlite.org/pragma.html
+                       These override both `DEFAULT_PRAGMA` and the chosen profile.
+        :raises ValueError: Unknown profile, invalid pragma settings, invalid TTL jitter, unknown layout,
+                            a read-only cache that is sliding, an invalid table name, or a negative deadline.
         """
+        if not 0 <= ttl_jitter < 1:
+            msg = f"TTL jitter must be at least 0 and less than 1, got {ttl_jitter!r}."
+            raise ValueError(msg)
+
+        if layout not in self._table_options:
+            msg = f"Unknown layout {layout!r}. Choices are: {', '.join(self._table_options)}."
+            raise ValueError(msg)
+
+        if read_only and sliding:
+            msg = "A read-only cache cannot extend the expiration of values on read."
+            raise ValueError(msg)
+
+        if (
+            not (table.isidentifier() and table.isascii())
+            or table.lower().startswith("sqlite")
+            or table.lower().endswith(self._auxiliary_suffixes)
+        ):
+            msg = f"Invalid table name: {table!r}."
+            raise ValueError(msg)
+
+        if deadline is not None and deadline < 0:
+            msg = f"Deadline must be at least 0, got {deadline!r}."
+            raise ValueError(msg)
+
+        self.pragma = self._resolve_pragma(profile, kwargs)
+        self.ttl_jitter = ttl_jitter
+        self.changelog = changelog
+        self.layout = layout
+        self.sliding = sliding
+        self.read_only = read_only
+        self.table = table
+        self.default_timeout = default_timeout
+        self.deadline = deadline
+        self.fail_open = fail_open
+        if table != "cache":
+            self._use_table(table)
+        # Whether the tables of this cache have been set up. Logical caches share connections,
+        # so this can't be done only when connecting.
+        self._prepared = False
+        # Whether the cache table of the file has rowids. Checked when connecting, since the file decides.
+        self._has_rowid = True
         filepath = filename if path is None else str(Path(path) / filename)
         suffix = ":?mode=memory&cache=shared" if in_memory else ""
         self.connection_string = f"{filepath}{suffix}"
-        self.pragma = {**kwargs, **self.DEFAULT_PRAGMA}
         self.timeout = timeout
         self.isolation_level = isolation_level
         self.local = local()
         self.local.instances = getattr(self.local, "instances", 0) + 1
+        self._maintenance: tuple[Thread, Event] | None = None
+        self._connections: WeakSet[_ThreadConnection] = WeakSet()
+        self._connections_lock = Lock()
+        self._loading: dict[str, Event] = {}
+        self._loading_lock = Lock()
+        self._key_filter: BloomFilter | None = None
+        self._key_filter_ready = False
+        # Maximum number of values, and the sketches of key frequencies and recompute costs for admission control.
+        self._admission: tuple[int, CountMinSketch, CountMinSketch] | None = None
+        self._entry_count: int | None = None
+        self._new_keys_since_count = 0
+        self._contention = ContentionStats(busy=0, retries=0, wait=0.0, failed=0, dropped=0)
+        self._contention_lock = Lock()
+        self._logical: WeakSet[Cache] = WeakSet([self])
+        _instances.add(self)
+
+    def _use_table(self, table: str) -> None:
+        """Rewrite the statements of this instance to use tables with the given name instead of 'cache'."""
+        for name in dir(self):
+            value = getattr(type(self), name, None)
+            if name.endswith("_sql") and isinstance(value, str):
+                setattr(self, name, re.sub(r"\bcache(?=_|\b)", table, value))
+        self._migrations = tuple(
+            tuple(re.sub(r"\bcache(?=_|\b)", table, statement) for statement in statements)
+            for statements in self._migrations
+        )
+
+    def logical(self, table: str, **options: Any) -> Cache:
+        """
+        Create a cache in another table of the same database file, which shares the connections of this cache.
+        This avoids opening a connection, page cache, and memory map per thread for each cache.
 
-        self._con.execute(self._create_sql)
-        self._con.execute(self._create_index_sql)
-        self._con.commit()
+        :param table: Name of the table that holds the new cache.
+        :param options: Options for the new cache, like `default_timeout`, `sliding` or `ttl_jitter`.
+                        Connection options, like the file, pragma, timeout and deadline, come from this cache.
+        :raises ValueError: Invalid options.
+        """
+        options = {
+            "read_only": self.read_only,
+            "changelog": self.changelog,
+            "layout": self.layout,
+            "fail_open": self.fail_open,
+            **options,
+        }
+        cache = type(self)(
+            timeout=self.timeout,
+            isolation_level=self.isolation_level,
+            deadline=self.deadline,
+            table=table,
+            **options,
+        )
+        cache.pragma = self.pragma
+        cache.connection_string = self.connection_string
+        cache.local = self.local
+        cache.local.instances = getattr(cache.local, "instances", 0) + 1
+        cache._connections = self._connections
+        cache._connections_lock = self._connections_lock
+        cache._logical = self._logical
+        self._logical.add(cache)
+        return cache
 
     @property
     def _con(self) -> sqlite3.Connection:
-        try:
-            return self.local.con
-        except AttributeError:
-            self.local.con = sqlite3.connect(
-                self.connection_string,
-                timeout=self.timeout,
-                isolation_level=self.isolation_level,
-            )
-            self._apply_pragma()
-            return self.local.con
-
+        thread_con: _ThreadConnection | None = getattr(self.local, "thread_con", None)
+        if thread_con is None or thread_con.con is None:
+            thread_con = self._connect()
+        if not self._prepared:
+            self._prepare(thread_con.con)
+
+        thread_con.uses += 1
+        if thread_con.uses >= self.OPTIMIZE_EVERY > 0 and not thread_con.con.in_transaction and not self.read_only:
+            thread_con.uses = 0
+            thread_con.con.execute(self._set_pragma.format("optimize"))
+        return thread_con.con
+
+    def _connect(self) -> _ThreadConnection:
+        # Connections are only used by the thread that opened them,
+        # but 'close_all' needs to be able to close them from any thread.
+        con = sqlite3.connect(
+            self._read_only_uri() if self.read_only else self.connection_string,
+            timeout=self.timeout if self.deadline is None else 0,
+            isolation_level=self.isolation_level,
+            check_same_thread=False,
+            uri=self.read_only,
+        )
+        self._apply_pragma(con)
+        if self.read_only:
+            con.execute(self._set_pragma_equal.format("query_only", 1))
+        thread_con = _ThreadConnection(con)
+        self.local.thread_con = thread_con
+        with self._connections_lock:
+            self._connections.add(thread_con)
+        return thread_con
+
+    def _read_only_uri(self) -> str:
+        # https://www.sqlite.org/uri.html
+        return f"{Path(self.connection_string).absolute().as_uri()}?mode=ro"
+
+    @_busy_retried()
     def __getitem__(self, item: str) -> Any:
-        value = self.get(item)
-        if value is None:
+        payload = self._get_payload(item)
+        if payload is None:
             msg = "Key not in cache."
             raise KeyError(msg)
-        return value
+        return self._unstream(payload)
 
     def __setitem__(self, item: str, value: Any) -> None:
         self.set(item, value)
@@ -145,9 +700,13 @@ def __setitem__(self, item: str, value: Any) -> None:
     def __delitem__(self, key: str) -> None:
         self.delete(key)
 
+    @_busy_retried(_return_false)
     def __contains__(self, key: str) -> bool:
+        if not self._may_contain(key):
+            return False
         return self._con.execute(self._check_sql, {"key": key}).fetchone() is not None
 
+    @_busy_retried()
     def __enter__(self) -> Self:
         self._con  # noqa: B018
         return self
@@ -156,40 +715,361 @@ def __exit__(self, *args: object) -> None:
         self.close()
 
     def __del__(self) -> None:
+        if not hasattr(self, "local"):  # __init__ failed
+            return
         self.local.instances = getattr(self.local, "instances", 0) - 1
         if self.local.instances <= 0:
             self.close()
 
     def close(self) -> None:
-        """Closes the cache."""
-        self._con.execute(self._set_pragma.format("optimize"))  # https://www.sqlite.org/pragma.html#pragma_optimize
-        self._con.close()
-        with suppress(AttributeError):
-            delattr(self.local, "con")
+        """Closes the cache connection of the current thread. Does nothing if the connection is already closed."""
+        thread_con: _ThreadConnection | None = getattr(self.local, "thread_con", None)
+        if thread_con is None or thread_con.con is None:
+            return
+
+        con, thread_con.con = thread_con.con, None
+        with self._connections_lock:
+            self._connections.discard(thread_con)
+
+        # Closing should not fail just because statistics could not be refreshed.
+        with suppress(sqlite3.OperationalError):
+            if not self.read_only:
+                con.execute(self._set_pragma.format("optimize"))  # https://www.sqlite.org/pragma.html#pragma_optimize
+        con.close()
+
+    def close_all(self) -> None:
+        """
+        Close the cache connections of all threads, and stop background maintenance.
+        Counts for admission control are saved first, see `use_admission`.
+        Other threads should not be using the cache while this runs.
+        If they use it afterwards, new connections are opened for them.
+        """
+        self.stop_maintenance()
+        self._save_admission()
+        self.close()
+        with self._connections_lock:
+            thread_cons = list(self._connections)
+            self._connections.clear()
 
-    def _apply_pragma(self) -> None:
+        for thread_con in thread_cons:
+            con, thread_con.con = thread_con.con, None
+            if con is not None:
+                con.close()
+
+    def _reset_after_fork(self) -> None:
+        """
+        Drop state inherited from the parent process, so that the cache is safe to use in a forked child.
+        Logical caches sharing the connections of this cache are reset as well, and keep sharing them.
+        """
+        for thread_con in list(self._connections):
+            if thread_con.con is not None:
+                _inherited_connections.append(thread_con.con)
+                thread_con.con = None
+
+        shared_local = local()
+        connections: WeakSet[_ThreadConnection] = WeakSet()
+        connections_lock = Lock()
+        for cache in list(self._logical):
+            cache.local = shared_local
+            cache._connections = connections
+            cache._connections_lock = connections_lock
+            cache._loading = {}
+            cache._loading_lock = Lock()
+            # Locks held by other threads in the parent would never be released in the child.
+            cache._contention_lock = Lock()
+            if cache._admission is not None:
+                for sketch in cache._admission[1:]:
+                    sketch._lock = Lock()
+            # Threads are not copied to the child, so background maintenance needs to be started again.
+            cache._maintenance = None
+            # The filter would miss keys written by the parent and other children from now on.
+            cache._key_filter = None
+            cache._key_filter_ready = False
+
+    @classmethod
+    def _resolve_pragma(cls, profile: str | None, overrides: dict[str, Any]) -> dict[str, int | str]:
+        if profile is not None and profile not in cls.PRAGMA_PROFILES:
+            msg = f"Unknown pragma profile {profile!r}. Choices are: {', '.join(cls.PRAGMA_PROFILES)}."
+            raise ValueError(msg)
+
+        pragma = {**cls.DEFAULT_PRAGMA, **cls.PRAGMA_PROFILES.get(profile, {}), **overrides}
+        for key, value in pragma.items():
+            cls._validate_pragma(key, value)
+        return pragma
+
+    @staticmethod
+    def _validate_pragma(key: str, value: Any) -> None:
+        # Pragmas cannot be parametrized, so names and values are formatted into the statement.
+        if not key.isidentifier():
+            msg = f"Invalid pragma name: {key!r}."
+            raise ValueError(msg)
+
+        if isinstance(value, bool) or not isinstance(value, int | str) or not re.fullmatch(r"-?\w+", str(value)):
+            msg = f"Invalid value for pragma {key!r}: {value!r}."
+            raise ValueError(msg)
+
+        if key == "page_size" and not (isinstance(value, int) and 512 <= value <= 65536 and value & (value - 1) == 0):  # noqa: PLR2004
+            msg = f"Pragma 'page_size' must be a power of two between 512 and 65536, got {value!r}."
+            raise ValueError(msg)
+
+        if key in {"mmap_size", "wal_autocheckpoint"} and not (isinstance(value, int) and value >= 0):
+            msg = f"Pragma {key!r} must be a non-negative integer, got {value!r}."
+            raise ValueError(msg)
+
+        if key in {"cache_size", "journal_size_limit"} and not isinstance(value, int):
+            msg = f"Pragma {key!r} must be an integer, got {value!r}."
+            raise ValueError(msg)
+
+    def _prepare(self, con: sqlite3.Connection) -> None:
+        table: tuple[str] | None = con.execute(self._table_sql).fetchone()
+        # The file might have been removed and created again since it was set up in this process.
+        setup_key = (self.connection_string, self.table, self.changelog)
+        if not self.read_only and (table is None or setup_key not in self._initialized):
+            self._setup(con)
+            table = con.execute(self._table_sql).fetchone()
+        if table is None:
+            # A read-only cache can be opened before the writer has created the table. Check again on the next use.
+            return
+        self._has_rowid = "WITHOUT ROWID" not in table[0].upper()
+        self._prepared = True
+
+    def _setup(self, con: sqlite3.Connection) -> None:
+        """Set up the tables of this cache, and remember that the database file has been set up in this process."""
+        with self._initialized_lock:
+            self._apply_database_pragma(con)
+            self._migrate(con)
+            if self.changelog:
+                con.execute(self._create_changelog_sql)
+                con.execute(self._create_changelog_insert_trigger_sql)
+                con.execute(self._drop_changelog_old_update_trigger_sql)
+                con.execute(self._create_changelog_update_trigger_sql)
+                con.execute(self._create_changelog_touch_trigger_sql)
+                con.execute(self._create_changelog_delete_trigger_sql)
+                con.commit()
+            self._initialized.add((self.connection_string, self.table, self.changelog))
+
+    def _apply_database_pragma(self, con: sqlite3.Connection) -> None:
+        for key in self.DATABASE_PRAGMA:
+            if key in self.pragma:
+                con.execute(self._set_pragma_equal.format(key, self.pragma[key]))
+
+    def _migrate(self, con: sqlite3.Connection) -> None:
+        if self.table != "cache":
+            con.execute(self._create_schema_sql)
+            con.commit()
+        if self._schema_version(con) >= len(self._migrations):
+            return
+
+        con.execute(self._begin_immediate_sql)
+        try:
+            # Another process might have migrated the file while this one was waiting for the lock.
+            version = self._schema_version(con)
+            for statements in self._migrations[version:]:
+                for statement in statements:
+                    con.execute(statement.format(table_options=self._table_options[self.layout]))
+            self._set_schema_version(con, max(version, len(self._migrations)))
+        except BaseException:
+            con.rollback()
+            raise
+        con.commit()
+
+    def _schema_version(self, con: sqlite3.Connection) -> int:
+        if self.table == "cache":
+            return con.execute(self._set_pragma.format("user_version")).fetchone()[0]
+        result: tuple[int] | None = con.execute(self._get_schema_version_sql, {"name": self.table}).fetchone()
+        return 0 if result is None else result[0]
+
+    def _set_schema_version(self, con: sqlite3.Connection, version: int) -> None:
+        if self.table == "cache":
+            con.execute(self._set_pragma_equal.format("user_version", version))
+        else:
+            con.execute(self._set_schema_version_sql, {"name": self.table, "version": version})
+
+    def _apply_pragma(self, con: sqlite3.Connection) -> None:
         for key, value in self.pragma.items():
-            self._con.execute(self._set_pragma_equal.format(key, value))
+            if key not in self.DATABASE_PRAGMA:
+                con.execute(self._set_pragma_equal.format(key, value))
+
+        # Leaving WAL mode changes the file, which is only done once per file, see `DATABASE_PRAGMA`.
+        journal_mode = self.pragma.get("journal_mode")
+        if journal_mode is not None and str(journal_mode).lower() != "wal":
+            current: str = con.execute(self._set_pragma.format("journal_mode")).fetchone()[0]
+            if current != "wal":
+                con.execute(self._set_pragma_equal.format("journal_mode", journal_mode))
+
+    @contextmanager
+    def _write_transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Run statements in a transaction that takes the write lock before reading, so that concurrent
+        read-modify-writes are serialized instead of failing to upgrade a stale read transaction.
+        """
+        con = self._con
+        con.execute(self._begin_immediate_sql)
+        try:
+            yield con
+        except BaseException:
+            con.rollback()
+            raise
+        con.commit()
+
+    def _retry_busy(
+        self, method: Callable[..., Any], fallback: Callable[..., Any] | None, *args: Any, **kwargs: Any
+    ) -> Any:
+        """Call the method, retrying while the database is locked. See `_busy_retried`."""
+        # Methods called by other retried methods are retried as a part of the outermost call,
+        # so that the deadline applies to the whole operation, and not to each step separately.
+        if getattr(self.local, "retrying", False):
+            return method(self, *args, **kwargs)
+
+        self.local.retrying = True
+        try:
+            return self._retry_busy_loop(method, fallback, *args, **kwargs)
+        finally:
+            self.local.retrying = False
+
+    def _retry_busy_loop(
+        self, method: Callable[..., Any], fallback: Callable[..., Any] | None, *args: Any, **kwargs: Any
+    ) -> Any:
+        deadline = None if self.deadline is None else time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return method(self, *args, **kwargs)
+            except sqlite3.OperationalError as error:  # noqa: PERF203
+                # Until the writer has created the table of a read-only cache, reads miss.
+                if self.read_only and not self._prepared and fallback is not None:
+                    return fallback(self, *args, **kwargs)
+                # SQLITE_BUSY and SQLITE_LOCKED: https://www.sqlite.org/rescode.html#busy
+                if "locked" not in str(error):
+                    raise
+                # Undo what the method wrote before it was blocked, so that it can be run again from the start.
+                with suppress(sqlite3.Error):
+                    self._con.rollback()
+
+                # Full jitter: https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+                delay = random.uniform(0, min(self.BUSY_BACKOFF_MAX, self.BUSY_BACKOFF_BASE * 2**attempt))  # noqa: S311
+                retry = deadline is not None and time.monotonic() + delay < deadline
+                outcome = "retries" if retry else "dropped" if self.fail_open and fallback is not None else "failed"
+                with self._contention_lock:
+                    self._contention["busy"] += 1
+                    self._contention[outcome] += 1
+                    if retry:
+                        self._contention["wait"] += delay
+
+                if outcome == "failed":
+                    raise
+                if outcome == "dropped":
+                    return fallback(self, *args, **kwargs)
+                time.sleep(delay)
+                attempt += 1
+
+    def contention_stats(self) -> ContentionStats:
+        """Counts of operations that found the database locked by other connections, and what happened to them."""
+        with self._contention_lock:
+            return ContentionStats(**self._contention)
 
     @staticmethod
-    def _exp_timestamp(timeout: int = DEFAULT_TIMEOUT) -> float:
+    def _exp_timestamp(timeout: float = DEFAULT_TIMEOUT) -> float:
         if timeout < 0:
             return -1.0
         return (datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(seconds=timeout)).timestamp()
 
+    def _expiry(self, timeout: int | None) -> float:
+        """Expiration timestamp for a value set now, with jitter applied. None uses the default timeout."""
+        if timeout is None:
+            timeout = self.default_timeout
+        if timeout > 0 and self.ttl_jitter:
+            return self._exp_timestamp(timeout * (1 - random.uniform(0, self.ttl_jitter)))  # noqa: S311
+        return self._exp_timestamp(timeout)
+
+    def _expiries(self, keys: Iterable[str], timeout: Timeouts | None) -> dict[str, float]:
+        """Expiration timestamps for values set now under the given keys. None uses the default timeout."""
+        if timeout is None:
+            timeout = self.default_timeout
+        if callable(timeout):
+            return {key: self._expiry(timeout(key)) for key in keys}
+        if isinstance(timeout, Mapping):
+            return {key: self._expiry(timeout.get(key, self.default_timeout)) for key in keys}
+        if self.ttl_jitter:
+            return {key: self._expiry(timeout) for key in keys}
+        return dict.fromkeys(keys, self._exp_timestamp(timeout))
+
+    def _purge(self, keys: list[str]) -> None:
+        """Delete expired values found while reading. Read-only caches leave them for a writer to delete."""
+        if not keys or self.read_only:
+            return
+        self._con.execute(self._delete_many_sql.format(self._placeholders(keys)), keys)
+        self._con.commit()
+
+    def _touch_expiry(self, exp: float, timeout: int | None) -> float | None:
+        """
+        New expiration timestamp for a value that was read now, or None if it should be kept.
+        Values that don't expire are kept, and so are values that were extended recently enough.
+        Without a timeout, values are extended by the default timeout if the cache is sliding.
+        """
+        if timeout is None:
+            if not self.sliding:
+                return None
+            timeout = self.default_timeout
+        if exp == -1.0:
+            return None
+        if timeout < 0:
+            return -1.0
+        new_exp = self._expiry(timeout)
+        if new_exp - exp <= timeout * self.TOUCH_THRESHOLD:
+            return None
+        return new_exp
+
     @staticmethod
     def _exp_datetime(exp: float) -> datetime.datetime | None:
         if exp == -1.0:
             return None
         return datetime.datetime.fromtimestamp(exp, tz=datetime.timezone.utc)
 
+    @staticmethod
+    def _placeholders(keys: list[str]) -> str:
+        return ", ".join(["?"] * len(keys))
+
     def _stream(self, value: Any) -> bytes:
         return pickle.dumps(value, protocol=self.PICKLE_PROTOCOL)
 
     def _unstream(self, value: bytes) -> Any:
         return pickle.loads(value)  # noqa: S301
 
-    def add(self, key: str, value: Any, timeout: int = DEFAULT_TIMEOUT) -> None:
+    def _is_large(self, payload: bytes) -> bool:
+        return self.LARGE_VALUE_THRESHOLD is not None and len(payload) > self.LARGE_VALUE_THRESHOLD
+
+    def _inline(self, payload: bytes) -> bytes | None:
+        """Value to store in the cache table. Large values are replaced with NULL, and stored as chunks instead."""
+        return None if self._is_large(payload) else payload
+
+    def _write_chunks(self, key: str, payload: bytes) -> None:
+        """Store a large value as chunks. Should be called after its cache row has been written."""
+        if not self._is_large(payload):
+            return
+        view = memoryview(payload)
+        seq = [
+            {"key": key, "seq": n, "data": view[start : start + self.CHUNK_SIZE]}
+            for n, start in enumerate(range(0, len(view), self.CHUNK_SIZE))
+        ]
+        self._con.executemany(self._set_chunk_sql, seq)
+
+    def _read_value(self, key: str, value: bytes | int | str | None) -> bytes | None:
+        """
+        Pickled value from a cache row. Returns None if the value was chunked, but the chunks are gone,
+        or if the row holds a rate limit counter (an integer) or a collection (its type as text).
+        """
+        if isinstance(value, int | str):
+            return None
+        if value is not None:
+            return value
+        chunks: list[tuple[bytes]] = self._con.execute(self._get_chunks_sql, {"key": key}).fetchall()
+        if not chunks:
+            return None
+        return b"".join(chunk for (chunk,) in chunks)
+
+    @_busy_retried()
+    def add(self, key: str, value: Any, timeout: int | None = None) -> bool:
         """
         Set the value to the cache only if the key is not already in the cache,
         or the found value has expired.
@@ -198,11 +1078,18 @@ def add(self, key: str, value: Any, timeout: int = DEFAULT_TIMEOUT) -> None:
         :param value: Picklable object to store.
         :param timeout: How long the value is valid in the cache.
                         Negative numbers will keep the key in cache until manually removed.
+        :return: Whether the value was added.
         """
-        data = {"key": key, "value": self._stream(value), "exp": self._exp_timestamp(timeout)}
-        self._con.execute(self._add_sql, data)
+        self._remember_keys([key])
+        payload = self._stream(value)
+        data = {"key": key, "value": self._inline(payload), "exp": self._expiry(timeout)}
+        added = self._con.execute(self._add_sql, data).rowcount > 0
+        if added:
+            self._write_chunks(key, payload)
         self._con.commit()
+        return added
 
+    @_busy_retried(_return_default)
     def get(self, key: str, default: Any = None) -> Any:
         """
         Get the value under some key. Return `default` if key not in the cache or expired.
@@ -210,20 +1097,65 @@ def get(self, key: str, default: Any = None) -> Any:
         :param key: Cache key.
         :param default: Value to return if key not in the cache.
         """
-        result: tuple[bytes, float] | None = self._con.execute(self._get_sql, {"key": key}).fetchone()
+        payload = self._get_payload(key)
+        if payload is None:
+            return default
+        return self._unstream(payload)
+
+    def _get_payload(self, key: str, touch: int | None = None) -> bytes | None:
+        """Pickled value under the key, extending its expiration by `touch` seconds if given, or if sliding."""
+        self._record_uses([key])
+        if not self._may_contain(key):
+            return None
+
+        result: tuple[bytes | None, float] | None = self._con.execute(self._get_sql, {"key": key}).fetchone()
 
         if result is None:
-            return default
+            return None
 
         exp = self._exp_datetime(result[1])
         if exp is not None and datetime.datetime.now(tz=datetime.timezone.utc) >= exp:
-            self._con.execute(self._delete_sql, {"key": key})
+            self._purge([key])
+            return None
+
+        new_exp = self._touch_expiry(result[1], touch)
+        if new_exp is not None:
+            self._con.execute(self._touch_sql, {"key": key, "exp": new_exp})
             self._con.commit()
+
+        return self._read_value(key, result[0])
+
+    @_busy_retried(_return_touched_default)
+    def get_and_touch(self, key: str, timeout: int | None = None, default: Any = None) -> Any:
+        """
+        Get the value under some key, and extend its lifetime. Return `default` if key not in the cache or expired.
+        The expiration is only rewritten once `TOUCH_THRESHOLD` of the timeout has passed since the last extension.
+        Values that don't expire are kept that way.
+
+        :param key: Cache key.
+        :param timeout: How long the value is valid in the cache from now.
+                        Negative numbers will keep the key in cache until manually removed.
+        :param default: Value to return if key not in the cache.
+        """
+        payload = self._get_payload(key, touch=self.default_timeout if timeout is None else timeout)
+        if payload is None:
             return default
+        return self._unstream(payload)
 
-        return self._unstream(result[0])
+    @_busy_retried(_return_empty)
+    def get_many_and_touch(self, keys: list[str], timeout: int | None = None) -> dict[str, Any]:
+        """
+        Get all values for the given keys, and extend their lifetime. See `get_and_touch`.
+
+        :param keys: List of cache keys.
+        :param timeout: How long the values are valid in the cache from now.
+                        Negative numbers will keep the keys in cache until manually removed.
+        """
+        payloads = self._get_many_payloads(keys, touch=self.default_timeout if timeout is None else timeout)
+        return {key: self._unstream(payload) for key, payload in payloads.items()}
 
-    def set(self, key: str, value: Any, timeout: int = DEFAULT_TIMEOUT) -> None:
+    @_busy_retried()
+    def set(self, key: str, value: Any, timeout: int | None = None) -> None:
         """
         Set a value in cache under some key.
 
@@ -232,10 +1164,17 @@ def set(self, key: str, value: Any, timeout: int = DEFAULT_TIMEOUT) -> None:
         :param timeout: How long the value is valid in the cache.
                         Negative numbers will keep the key in cache until manually removed.
         """
-        data = {"key": key, "value": self._stream(value), "exp": self._exp_timestamp(timeout)}
+        if self._admit([key]):
+            self._set_payload(key, self._stream(value), timeout)
+
+    def _set_payload(self, key: str, payload: bytes, timeout: int | None) -> None:
+        self._remember_keys([key])
+        data = {"key": key, "value": self._inline(payload), "exp": self._expiry(timeout)}
         self._con.execute(self._set_sql, data)
+        self._write_chunks(key, payload)
         self._con.commit()
 
+    @_busy_retried()
     def update(self, key: str, value: Any) -> None:
         """
         Update value in the cache. Does nothing if key not in the cache or expired.
@@ -243,32 +1182,139 @@ def update(self, key: str, value: Any) -> None:
         :param key: Cache key.
         :param value: Picklable object to store.
         """
-        data = {"key": key, "value": self._stream(value)}
-        self._con.execute(self._update_sql, data)
+        payload = self._stream(value)
+        data = {"key": key, "value": self._inline(payload)}
+        if self._con.execute(self._update_sql, data).rowcount:
+            self._write_chunks(key, payload)
         self._con.commit()
 
-    def touch(self, key: str, timeout: int = DEFAULT_TIMEOUT) -> None:
+    @_busy_retried()
+    def touch(self, key: str, timeout: int | None = None) -> bool:
         """
         Extend the lifetime of an object in cache. Does nothing if key is not in the cache or is expired.
 
         :param key: Cache key.
         :param timeout: How long the value is valid in the cache.
                         Negative numbers will keep the key in cache until manually removed.
+        :return: Whether the key was in the cache.
         """
-        data = {"exp": self._exp_timestamp(timeout), "key": key}
-        self._con.execute(self._touch_sql, data)
+        data = {"exp": self._expiry(timeout), "key": key}
+        touched = self._con.execute(self._touch_sql, data).rowcount > 0
         self._con.commit()
+        return touched
 
-    def delete(self, key: str) -> None:
+    @_busy_retried()
+    def delete(self, key: str) -> bool:
         """
         Remove the value under the given key from the cache. Does nothing if key is not in the cache.
 
         :param key: Cache key.
+        :return: Whether the key was in the cache.
         """
-        self._con.execute(self._delete_sql, {"key": key})
+        deleted = self._con.execute(self._delete_sql, {"key": key}).rowcount > 0
         self._con.commit()
+        return deleted
+
+    @_busy_retried(_return_default_version)
+    def gets(self, key: str, default: Any = None) -> tuple[Any, int | None]:
+        """
+        Get the value under some key with its version, for updating it with `cas`.
+        Return `default` and None if key not in the cache or expired.
 
-    def add_many(self, dict_: dict[str, Any], timeout: int = DEFAULT_TIMEOUT) -> None:
+        :param key: Cache key.
+        :param default: Value to return if key not in the cache.
+        :return: The value and its version.
+        """
+        if not self._may_contain(key):
+            return default, None
+
+        result: tuple[bytes | None, float, int] | None = self._con.execute(self._gets_sql, {"key": key}).fetchone()
+        if result is None:
+            return default, None
+
+        exp = self._exp_datetime(result[1])
+        payload = None
+        if exp is None or datetime.datetime.now(tz=datetime.timezone.utc) < exp:
+            payload = self._read_value(key, result[0])
+        if payload is None:
+            return default, None
+        return self._unstream(payload), result[2]
+
+    @_busy_retried(_return_empty)
+    def gets_many(self, keys: list[str]) -> dict[str, tuple[Any, int]]:
+        """
+        Get values with their versions for all the given keys, for updating them with `cas_many`.
+        Keys that are not in the cache or have expired are not included.
+
+        :param keys: List of cache keys.
+        """
+        keys = [key for key in keys if self._may_contain(key)]
+        if not keys:
+            return {}
+
+        command = self._gets_many_sql.format(self._placeholders(keys))
+        fetched: list[tuple[str, bytes | None, float, int]] = self._con.execute(command, keys).fetchall()
+
+        results: dict[str, tuple[Any, int]] = {}
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        for key, value, exp, version in fetched:
+            exp_datetime = self._exp_datetime(exp)
+            if exp_datetime is not None and now >= exp_datetime:
+                continue
+            payload = self._read_value(key, value)
+            if payload is not None:
+                results[key] = (self._unstream(payload), version)
+        return results
+
+    @_busy_retried()
+    def cas(self, key: str, value: Any, version: int | None, timeout: int | None = None) -> bool:
+        """
+        Compare-and-swap: set the value only if it has not been written since it was read with `gets`.
+        If the value has changed, read it again and retry.
+
+        :param key: Cache key.
+        :param value: Picklable object to store.
+        :param version: Version from `gets`. None sets the value only if the key is not in the cache, like `add`.
+        :param timeout: How long the value is valid in the cache.
+                        Negative numbers will keep the key in cache until manually removed.
+        :return: Whether the value was set.
+        """
+        with self._write_transaction():
+            return self._cas_payload(key, self._stream(value), version, self._expiry(timeout))
+
+    @_busy_retried()
+    def cas_many(
+        self,
+        dict_: dict[str, tuple[Any, int | None]],
+        timeout: Timeouts | None = None,
+    ) -> dict[str, bool]:
+        """
+        Compare-and-swap for all keys in the given dict in a single transaction. See `cas`.
+
+        :param dict_: Cache keys with values to set, and their versions from `gets_many`.
+        :param timeout: How long the value is valid in the cache.
+                        Negative numbers will keep the key in cache until manually removed.
+                        Can also be a mapping of keys to timeouts, or a function that takes
+                        a key and returns its timeout. Keys missing from a mapping use the default timeout.
+        :return: Whether the value was set for each key.
+        """
+        exps = self._expiries(dict_, timeout)
+        payloads = {key: (self._stream(value), version) for key, (value, version) in dict_.items()}
+        with self._write_transaction():
+            return {
+                key: self._cas_payload(key, payload, version, exps[key]) for key, (payload, version) in payloads.items()
+            }
+
+    def _cas_payload(self, key: str, payload: bytes, version: int | None, exp: float) -> bool:
+        self._remember_keys([key])
+        data = {"key": key, "value": self._inline(payload), "exp": exp, "version": version}
+        swapped = self._con.execute(self._add_sql if version is None else self._cas_sql, data).rowcount > 0
+        if swapped:
+            self._write_chunks(key, payload)
+        return swapped
+
+    @_busy_retried()
+    def add_many(self, dict_: dict[str, Any], timeout: Timeouts | None = None) -> None:
         """
         For all keys in the given dict, add the value to the cache only if the key is not
         already in the cache, or the found value has expired.
@@ -276,78 +1322,132 @@ def add_many(self, dict_: dict[str, Any], timeout: int = DEFAULT_TIMEOUT) -> Non
         :param dict_: Cache keys with values to add.
         :param timeout: How long the value is valid in the cache.
                         Negative numbers will keep the key in cache until manually removed.
+                        Can also be a mapping of keys to timeouts, or a function that takes
+                        a key and returns its timeout. Keys missing from a mapping use the default timeout.
         """
-        command = self._add_many_sql.format(", ".join([f"(:key{n}, :value{n}, :exp{n})" for n in range(len(dict_))]))
+        self._remember_keys(dict_)
+        exps = self._expiries(dict_, timeout)
+        payloads = {key: self._stream(value) for key, value in dict_.items()}
+        small = {key: payload for key, payload in payloads.items() if not self._is_large(payload)}
+
+        # Chunks can only be written for the large values that were actually added.
+        for key, payload in payloads.items():
+            if key in small:
+                continue
+            if self._con.execute(self._add_sql, {"key": key, "value": None, "exp": exps[key]}).rowcount:
+                self._write_chunks(key, payload)
 
-        data = {}
-        exp = self._exp_timestamp(timeout)
-        for i, (key, value) in enumerate(dict_.items()):
-            data[f"key{i}"] = key
-            data[f"value{i}"] = self._stream(value)
-            data[f"exp{i}"] = exp
+        if small:
+            values = ", ".join([f"(:key{n}, :value{n}, :exp{n}, RANDOM())" for n in range(len(small))])
+            command = self._add_many_sql.format(values)
 
-        self._con.execute(command, data)
+            data = {}
+            for i, (key, payload) in enumerate(small.items()):
+                data[f"key{i}"] = key
+                data[f"value{i}"] = payload
+                data[f"exp{i}"] = exps[key]
+
+            self._con.execute(command, data)
         self._con.commit()
 
+    @_busy_retried(_return_empty)
     def get_many(self, keys: list[str]) -> dict[str, Any]:
         """
         Get all values that exist and aren't expired from the given cache keys, and return a dict.
 
         :param keys: List of cache keys.
         """
-        seq = ", ".join([f"'{value}'" for value in keys])
-        fetched: list[tuple[str, Any, float]] = self._con.execute(self._get_many_sql.format(seq)).fetchall()
+        return {key: self._unstream(payload) for key, payload in self._get_many_payloads(keys).items()}
+
+    def _get_many_payloads(self, keys: list[str], touch: int | None = None) -> dict[str, bytes]:
+        """Pickled values under the keys, extending their expiration by `touch` seconds if given, or if sliding."""
+        self._record_uses(keys)
+        keys = [key for key in keys if self._may_contain(key)]
+        if not keys:
+            return {}
+
+        command = self._get_many_sql.format(self._placeholders(keys))
+        fetched: list[tuple[str, bytes | None, float]] = self._con.execute(command, keys).fetchall()
 
         if not fetched:
             return {}
 
-        results: dict[str, Any] = {}
+        results: dict[str, bytes] = {}
         to_delete: list[str] = []
+        to_touch: list[dict[str, Any]] = []
         for key, value, exp in fetched:
-            exp = self._exp_datetime(exp)  # noqa: PLW2901
-            if exp is not None and datetime.datetime.now(tz=datetime.timezone.utc) >= exp:
+            exp_datetime = self._exp_datetime(exp)
+            if exp_datetime is not None and datetime.datetime.now(tz=datetime.timezone.utc) >= exp_datetime:
                 to_delete.append(key)
                 continue
 
-            results[key] = self._unstream(value)
+            payload = self._read_value(key, value)
+            if payload is not None:
+                results[key] = payload
 
-        if to_delete:
-            self._con.execute(self._delete_many_sql.format(", ".join([f"'{value}'" for value in to_delete])))
+            new_exp = self._touch_expiry(exp, touch)
+            if new_exp is not None:
+                to_touch.append({"key": key, "exp": new_exp})
+
+        self._purge(to_delete)
+        if to_touch:
+            self._con.executemany(self._touch_sql, to_touch)
             self._con.commit()
 
         return results
 
-    def set_many(self, dict_: dict[str, Any], timeout: int = DEFAULT_TIMEOUT) -> None:
+    @_busy_retried()
+    def set_many(self, dict_: dict[str, Any], timeout: Timeouts | None = None) -> None:
         """
         Set values to the cache for all keys in the given dict.
 
         :param dict_: Cache keys with values to set.
         :param timeout: How long the value is valid in the cache.
                         Negative numbers will keep the key in cache until manually removed.
+                        Can also be a mapping of keys to timeouts, or a function that takes
+                        a key and returns its timeout. Keys missing from a mapping use the default timeout.
         """
-        command = self._set_many_sql.format(", ".join([f"(:key{n}, :value{n}, :exp{n})" for n in range(len(dict_))]))
+        admitted = self._admit(list(dict_))
+        if admitted:
+            self._set_many_payloads({key: self._stream(dict_[key]) for key in admitted}, timeout)
+
+    def _set_many_payloads(self, payloads: dict[str, bytes], timeout: Timeouts | None) -> None:
+        self._remember_keys(payloads)
+        values = ", ".join([f"(:key{n}, :value{n}, :exp{n}, RANDOM())" for n in range(len(payloads))])
+        command = self._set_many_sql.format(values)
 
         data = {}
-        exp = self._exp_timestamp(timeout)
-        for i, (key, value) in enumerate(dict_.items()):
+        exps = self._expiries(payloads, timeout)
+        for i, (key, payload) in enumerate(payloads.items()):
             data[f"key{i}"] = key
-            data[f"value{i}"] = self._stream(value)
-            data[f"exp{i}"] = exp
+            data[f"value{i}"] = self._inline(payload)
+            data[f"exp{i}"] = exps[key]
 
         self._con.execute(command, data)
+        for key, payload in payloads.items():
+            self._write_chunks(key, payload)
         self._con.commit()
 
+    @_busy_retried()
     def update_many(self, dict_: dict[str, Any]) -> None:
         """
         Update values to the cache for all keys in the given dict. Does nothing if key not in cache or expired.
 
         :param dict_:Cache keys with values to update to.
         """
-        seq = [{"key": key, "value": self._stream(value)} for key, value in dict_.items()]
+        payloads = {key: self._stream(value) for key, value in dict_.items()}
+
+        # Chunks can only be written for the large values that were actually updated.
+        for key, payload in payloads.items():
+            if self._is_large(payload) and self._con.execute(self._update_sql, {"key": key, "value": None}).rowcount:
+                self._write_chunks(key, payload)
+
+        seq = [{"key": key, "value": payload} for key, payload in payloads.items() if not self._is_large(payload)]
         self._con.executemany(self._update_sql, seq)
         self._con.commit()
 
-    def touch_many(self, keys: list[str], timeout: int = DEFAULT_TIMEOUT) -> None:
+    @_busy_retried()
+    def touch_many(self, keys: list[str], timeout: Timeouts | None = None) -> None:
         """
         Extend the lifetime for all objects under the given keys in cache.
         Does nothing if a key is not in the cache or is expired.
@@ -355,22 +1455,25 @@ def touch_many(self, keys: list[str], timeout: int = DEFAULT_TIMEOUT) -> None:
         :param keys: List of cache keys.
         :param timeout: How long the value is valid in the cache.
                         Negative numbers will keep the key in cache until manually removed.
+                        Can also be a mapping of keys to timeouts, or a function that takes
+                        a key and returns its timeout. Keys missing from a mapping use the default timeout.
         """
-        exp = self._exp_timestamp(timeout)
-        seq = [{"key": key, "exp": exp} for key in keys]
+        seq = [{"key": key, "exp": exp} for key, exp in self._expiries(keys, timeout).items()]
         self._con.executemany(self._touch_sql, seq)
         self._con.commit()
 
+    @_busy_retried()
     def delete_many(self, keys: list[str]) -> None:
         """
         Remove all the values under the given keys from the cache.
 
         :param keys: List of cache keys.
         """
-        self._con.execute(self._delete_many_sql.format(", ".join([f"'{value}'" for value in keys])))
+        self._con.execute(self._delete_many_sql.format(self._placeholders(keys)), keys)
         self._con.commit()
 
-    def get_or_set(self, key: str, default: Any, timeout: int = DEFAULT_TIMEOUT) -> Any:
+    @_busy_retried()
+    def get_or_set(self, key: str, default: Any, timeout: int | None = None) -> Any:
         """
         Get a value under some key, or set the default if key is not in cache.
 
@@ -379,25 +1482,99 @@ def get_or_set(self, key: str, default: Any, timeout: int = DEFAULT_TIMEOUT) ->
         :param timeout: How long the value is valid in the cache.
                         Negative numbers will keep the key in cache until manually removed.
         """
-        result: tuple[bytes, float] | None = self._con.execute(self._get_sql, {"key": key}).fetchone()
-
-        if result is not None:
-            exp = self._exp_datetime(result[1])
-            if exp is not None and datetime.datetime.now(tz=datetime.timezone.utc) >= exp:
-                self._con.execute(self._delete_sql, {"key": key})
-            else:
-                return self._unstream(result[0])
+        payload = self._get_payload(key)
+        if payload is not None:
+            return self._unstream(payload)
 
-        data = {"key": key, "value": self._stream(default), "exp": self._exp_timestamp(timeout)}
-        self._con.execute(self._set_sql, data)
-        self._con.commit()
+        self._set_payload(key, self._stream(default), timeout)
         return default
 
+    def get_many_or_load(
+        self,
+        keys: list[str],
+        loader: Callable[[list[str]], dict[str, Any]],
+        timeout: Timeouts | None = None,
+    ) -> dict[str, Any]:
+        """
+        Get all values that exist and aren't expired from the given cache keys, and load the rest
+        with the given loader. Loaded values are set to the cache in a single transaction.
+        If another thread is already loading some of the keys, wait for it to finish and use its values
+        instead of loading them again.
+
+        :param keys: List of cache keys.
+        :param loader: Called once with the list of missing keys. Should return a dict of the loaded values.
+                       Keys missing from the returned dict are not cached.
+        :param timeout: How long the loaded values are valid in the cache.
+                        Negative numbers will keep the key in cache until manually removed.
+                        Can also be a mapping or a function, as in `set_many`.
+        """
+        results = self.get_many(keys)
+        missing = [key for key in dict.fromkeys(keys) if key not in results]
+        if not missing:
+            return results
+
+        loading = Event()
+        with self._loading_lock:
+            in_flight = {key: self._loading[key] for key in missing if key in self._loading}
+            claimed = [key for key in missing if key not in in_flight]
+            for key in claimed:
+                self._loading[key] = loading
+
+        try:
+            if claimed:
+                results.update(self._load_many(claimed, loader, timeout))
+        finally:
+            with self._loading_lock:
+                for key in claimed:
+                    del self._loading[key]
+            loading.set()
+
+        if in_flight:
+            for event in set(in_flight.values()):
+                event.wait()
+            results.update(self.get_many(list(in_flight)))
+            # The other loader might have failed, or not returned all keys.
+            still_missing = [key for key in in_flight if key not in results]
+            if still_missing:
+                results.update(self._load_many(still_missing, loader, timeout))
+
+        return results
+
+    def _load_many(
+        self,
+        keys: list[str],
+        loader: Callable[[list[str]], dict[str, Any]],
+        timeout: Timeouts,
+    ) -> dict[str, Any]:
+        loaded = loader(keys)
+        values = {key: loaded[key] for key in keys if key in loaded}
+        if values:
+            self.set_many(values, timeout)
+        return values
+
+    @_busy_retried()
     def clear(self) -> None:
         """Clear the cache from all values."""
+        if self._key_filter is not None:
+            self._key_filter.clear()
+        self._entry_count = None
         self._con.execute(self._clear_sql)
         self._con.commit()
 
+    @_busy_retried()
+    def clear_all(self) -> None:
+        """Clear this cache and all logical caches sharing its connections in a single transaction."""
+        caches = list(self._logical)
+        for cache in caches:
+            cache._con  # noqa: B018  # Set up the tables of each cache before clearing them.
+        with self._write_transaction() as con:
+            for cache in caches:
+                if cache._key_filter is not None:
+                    cache._key_filter.clear()
+                cache._entry_count = None
+                con.execute(cache._clear_sql)
+
+    @_busy_retried()
     def incr(self, key: str, delta: int = 1) -> int:
         """
         Increment the value in cache by the given delta.
@@ -408,12 +1585,13 @@ def incr(self, key: str, delta: int = 1) -> int:
         :raises ValueError: Value cannot be incremented.
         """
         result: tuple[bytes, float] | None = self._con.execute(self._check_sql, {"key": key}).fetchone()
+        payload = None if result is None else self._read_value(key, result[0])
 
-        if result is None:
+        if payload is None:
             msg = "Nonexistent or expired cache key."
             raise ValueError(msg)
 
-        value = self._unstream(result[0])
+        value = self._unstream(payload)
         if not isinstance(value, int):
             msg = "Value is not a number."
             raise ValueError(msg)  # noqa: TRY004
@@ -423,6 +1601,7 @@ def incr(self, key: str, delta: int = 1) -> int:
         self._con.commit()
         return new_value
 
+    @_busy_retried()
     def decr(self, key: str, delta: int = 1) -> int:
         """
         Decrement the value in cache by the given delta.
@@ -433,12 +1612,13 @@ def decr(self, key: str, delta: int = 1) -> int:
         :raises ValueError: Value cannot be decremented.
         """
         result: tuple[bytes, float] | None = self._con.execute(self._check_sql, {"key": key}).fetchone()
+        payload = None if result is None else self._read_value(key, result[0])
 
-        if result is None:
+        if payload is None:
             msg = "Nonexistent or expired cache key."
             raise ValueError(msg)
 
-        value = self._unstream(result[0])
+        value = self._unstream(payload)
         if not isinstance(value, int):
             msg = "Value is not a number."
             raise ValueError(msg)  # noqa: TRY004
@@ -448,10 +1628,299 @@ def decr(self, key: str, delta: int = 1) -> int:
         self._con.commit()
         return new_value
 
-    def memoize(self, timeout: int = DEFAULT_TIMEOUT) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    def hit(
+        self,
+        key: str,
+        limit: int,
+        window: float,
+        algorithm: RateLimitAlgorithm = "fixed_window",
+    ) -> RateLimit:
+        """
+        Count a hit against a rate limit atomically, if the limit allows it.
+        The key should only be used for this rate limit, and expires when the limit is fully available again.
+
+        :param key: Cache key for the rate limit.
+        :param limit: Number of hits allowed in the window.
+        :param window: Length of the window in seconds.
+        :param algorithm: "fixed_window" allows `limit` hits in windows starting from the first hit.
+                          "sliding_window" allows `limit` hits in the last `window` seconds.
+                          "token_bucket" allows bursts of `limit` hits, and one more every `window / limit` seconds.
+        :return: Whether the hit was allowed, and the state of the limit after it.
+        :raises ValueError: Limit or window is not positive, or unknown algorithm.
+        """
+        return self.hit_many([key], limit, window, algorithm)[key]
+
+    @_busy_retried()
+    def hit_many(
+        self,
+        keys: list[str],
+        limit: int,
+        window: float,
+        algorithm: RateLimitAlgorithm = "fixed_window",
+    ) -> dict[str, RateLimit]:
+        """
+        Count a hit against the rate limit of each of the given keys in a single transaction.
+        See `hit` for the arguments.
+
+        :return: The result of the hit for each key.
+        :raises ValueError: Limit or window is not positive, or unknown algorithm.
+        """
+        if limit <= 0:
+            msg = f"Limit must be a positive integer, got {limit!r}."
+            raise ValueError(msg)
+
+        if window <= 0:
+            msg = f"Window must be positive, got {window!r}."
+            raise ValueError(msg)
+
+        hit_funcs = {
+            "fixed_window": self._hit_fixed_window,
+            "sliding_window": self._hit_sliding_window,
+            "token_bucket": self._hit_token_bucket,
+        }
+        if algorithm not in hit_funcs:
+            msg = f"Unknown rate limit algorithm {algorithm!r}. Choices are: {', '.join(hit_funcs)}."
+            raise ValueError(msg)
+
+        self._remember_keys(keys)
+        now = datetime.datetime.now(tz=datetime.timezone.utc).timestamp()
+        with self._write_transaction():
+            return {key: hit_funcs[algorithm](key, limit, window, now) for key in keys}
+
+    def _hit_fixed_window(self, key: str, limit: int, window: float, now: float) -> RateLimit:
+        data = {"key": key, "limit": limit, "window": window, "now": now}
+        result: tuple[int, float] | None = self._con.execute(self._hit_fixed_window_sql, data).fetchone()
+        if result is not None:
+            count, exp = result
+            return RateLimit(allowed=True, remaining=max(limit - count, 0), reset=exp - now, retry_after=0.0)
+
+        exp = self._con.execute(self._get_sql, {"key": key}).fetchone()[1]
+        reset = window if exp == -1.0 else exp - now
+        return RateLimit(allowed=False, remaining=0, reset=reset, retry_after=reset)
+
+    def _hit_sliding_window(self, key: str, limit: int, window: float, now: float) -> RateLimit:
+        self._con.execute(self._delete_old_hits_sql, {"key": key, "start": now - window})
+        count, first, last = self._con.execute(self._get_hits_sql, {"key": key}).fetchone()
+        if count >= limit:
+            return RateLimit(allowed=False, remaining=0, reset=last + window - now, retry_after=first + window - now)
+
+        self._con.execute(self._add_hit_sql, {"key": key, "now": now})
+        self._con.execute(self._set_sql, {"key": key, "value": count + 1, "exp": now + window})
+        return RateLimit(allowed=True, remaining=limit - count - 1, reset=window, retry_after=0.0)
+
+    def _hit_token_bucket(self, key: str, limit: int, window: float, now: float) -> RateLimit:
+        interval = window / limit
+        # Allow for rounding errors, so that a full burst is not denied on the last hit.
+        data = {"key": key, "interval": interval, "now": now, "max_exp": now + window + 1e-9 * window}
+        result: tuple[float] | None = self._con.execute(self._hit_token_bucket_sql, data).fetchone()
+        if result is not None:
+            reset = result[0] - now
+            remaining = max(int((window - reset) / interval + 1e-9), 0)
+            return RateLimit(allowed=True, remaining=remaining, reset=reset, retry_after=0.0)
+
+        reset = self._con.execute(self._get_sql, {"key": key}).fetchone()[1] - now
+        return RateLimit(allowed=False, remaining=0, reset=reset, retry_after=reset + interval - window)
+
+    def _collection_exists(self, key: str, kind: CollectionType) -> bool:
+        """Whether the key holds an unexpired collection of the given type."""
+        result: tuple[Any, float] | None = self._con.execute(self._get_sql, {"key": key}).fetchone()
+        if result is None or result[0] != kind:
+            return False
+        exp = self._exp_datetime(result[1])
+        return exp is None or datetime.datetime.now(tz=datetime.timezone.utc) < exp
+
+    def _ensure_collection(self, key: str, kind: CollectionType, timeout: int | None) -> None:
+        """Create a collection of the given type under the key, unless it already exists. Call in a transaction."""
+        if self._collection_exists(key, kind):
+            return
+
+        if key in self:
+            msg = f"Key does not hold a {kind}."
+            raise ValueError(msg)
+
+        self._remember_keys([key])
+        # Deleting the expired row first also removes its items, chunks or hits with the triggers.
+        self._con.execute(self._delete_sql, {"key": key})
+        self._con.execute(self._set_sql, {"key": key, "value": kind, "exp": self._expiry(timeout)})
+
+    @_busy_retried()
+    def hset(self, key: str, field: str, value: Any, timeout: int | None = None) -> None:
+        """
+        Set a field of the hash under the given key, without reading or writing its other fields.
+
+        :param key: Cache key.
+        :param field: Field of the hash.
+        :param value: Picklable object to store.
+        :param timeout: How long the hash is valid in the cache, if it's created by this call.
+                        Negative numbers will keep the key in cache until manually removed.
+        :raises ValueError: Key holds something else than a hash.
+        """
+        with self._write_transaction() as con:
+            self._ensure_collection(key, "hash", timeout)
+            con.execute(self._set_item_sql, {"key": key, "field": field, "value": self._stream(value)})
+
+    @_busy_retried(_return_field_default)
+    def hget(self, key: str, field: str, default: Any = None) -> Any:
+        """
+        Get a field of the hash under the given key. Return `default` if the hash or the field doesn't exist.
+
+        :param key: Cache key.
+        :param field: Field of the hash.
+        :param default: Value to return if the field is not in the cache.
+        """
+        if not self._collection_exists(key, "hash"):
+            return default
+        result: tuple[bytes] | None = self._con.execute(self._get_item_sql, {"key": key, "field": field}).fetchone()
+        if result is None:
+            return default
+        return self._unstream(result[0])
+
+    @_busy_retried(_return_empty)
+    def hgetall(self, key: str) -> dict[str, Any]:
+        """
+        Get all fields of the hash under the given key. Return an empty dict if the hash doesn't exist.
+
+        :param key: Cache key.
+        """
+        if not self._collection_exists(key, "hash"):
+            return {}
+        items: list[tuple[str, bytes]] = self._con.execute(self._get_items_sql, {"key": key}).fetchall()
+        return {field: self._unstream(value) for field, value in items}
+
+    @_busy_retried()
+    def hdel(self, key: str, field: str) -> bool:
+        """
+        Remove a field from the hash under the given key. The hash is removed with its last field.
+
+        :param key: Cache key.
+        :param field: Field of the hash.
+        :return: Whether the field was in the hash.
+        """
+        return self._delete_item(key, "hash", field)
+
+    @_busy_retried()
+    def sadd(self, key: str, member: str, timeout: int | None = None) -> bool:
+        """
+        Add a member to the set under the given key.
+
+        :param key: Cache key.
+        :param member: Member to add.
+        :param timeout: How long the set is valid in the cache, if it's created by this call.
+                        Negative numbers will keep the key in cache until manually removed.
+        :return: Whether the member was added, i.e. it was not already in the set.
+        :raises ValueError: Key holds something else than a set.
+        """
+        with self._write_transaction() as con:
+            self._ensure_collection(key, "set", timeout)
+            return con.execute(self._add_item_sql, {"key": key, "field": member, "value": None}).rowcount > 0
+
+    @_busy_retried(_return_false)
+    def sismember(self, key: str, member: str) -> bool:
+        """
+        Check whether the set under the given key contains the given member.
+
+        :param key: Cache key.
+        :param member: Member to look for.
+        """
+        if not self._collection_exists(key, "set"):
+            return False
+        return self._con.execute(self._get_item_sql, {"key": key, "field": member}).fetchone() is not None
+
+    @_busy_retried(_return_empty_set)
+    def smembers(self, key: str) -> set[str]:
+        """
+        Get all members of the set under the given key. Return an empty set if the set doesn't exist.
+
+        :param key: Cache key.
+        """
+        if not self._collection_exists(key, "set"):
+            return set()
+        items: list[tuple[str, None]] = self._con.execute(self._get_items_sql, {"key": key}).fetchall()
+        return {member for member, _ in items}
+
+    @_busy_retried()
+    def srem(self, key: str, member: str) -> bool:
+        """
+        Remove a member from the set under the given key. The set is removed with its last member.
+
+        :param key: Cache key.
+        :param member: Member to remove.
+        :return: Whether the member was in the set.
+        """
+        return self._delete_item(key, "set", member)
+
+    def _delete_item(self, key: str, kind: CollectionType, field: str) -> bool:
+        with self._write_transaction() as con:
+            if not self._collection_exists(key, kind):
+                return False
+            deleted = con.execute(self._delete_item_sql, {"key": key, "field": field}).rowcount > 0
+            con.execute(self._delete_empty_collection_sql, {"key": key})
+            return deleted
+
+    @_busy_retried()
+    def lpush(self, key: str, value: Any, timeout: int | None = None) -> int:
+        """
+        Add a value to the beginning of the list under the given key.
+
+        :param key: Cache key.
+        :param value: Picklable object to add.
+        :param timeout: How long the list is valid in the cache, if it's created by this call.
+                        Negative numbers will keep the key in cache until manually removed.
+        :return: Length of the list after the push.
+        :raises ValueError: Key holds something else than a list.
+        """
+        return self._push(key, value, timeout, head=True)
+
+    @_busy_retried()
+    def rpush(self, key: str, value: Any, timeout: int | None = None) -> int:
+        """
+        Add a value to the end of the list under the given key.
+
+        :param key: Cache key.
+        :param value: Picklable object to add.
+        :param timeout: How long the list is valid in the cache, if it's created by this call.
+                        Negative numbers will keep the key in cache until manually removed.
+        :return: Length of the list after the push.
+        :raises ValueError: Key holds something else than a list.
+        """
+        return self._push(key, value, timeout, head=False)
+
+    def _push(self, key: str, value: Any, timeout: int | None, *, head: bool) -> int:
+        with self._write_transaction() as con:
+            self._ensure_collection(key, "list", timeout)
+            count, first, last = con.execute(self._get_item_bounds_sql, {"key": key}).fetchone()
+            position = 0 if count == 0 else first - 1 if head else last + 1
+            con.execute(self._set_item_sql, {"key": key, "field": position, "value": self._stream(value)})
+            return count + 1
+
+    @_busy_retried(_return_empty_list)
+    def lrange(self, key: str, start: int = 0, stop: int = -1) -> list[Any]:
+        """
+        Get a range of values from the list under the given key. Return an empty list if the list doesn't exist.
+
+        :param key: Cache key.
+        :param start: Index of the first value. Negative indexes count from the end of the list.
+        :param stop: Index of the last value, inclusive. Negative indexes count from the end of the list.
+        """
+        if not self._collection_exists(key, "list"):
+            return []
+
+        if start < 0 or stop < 0:
+            count: int = self._con.execute(self._get_item_bounds_sql, {"key": key}).fetchone()[0]
+            start = max(count + start, 0) if start < 0 else start
+            stop = count + stop if stop < 0 else stop
+        if start > stop:
+            return []
+
+        data = {"key": key, "limit": stop - start + 1, "offset": start}
+        items: list[tuple[bytes]] = self._con.execute(self._get_item_range_sql, data).fetchall()
+        return [self._unstream(value) for (value,) in items]
+
+    def memoize(self, timeout: int | None = None) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
         """
         Save the result of the decorated function in cache. Calls with different
-        arguments are saved under different keys.
+        arguments are saved under different keys. With admission control, the time
+        the function takes is used as the cost of recomputing the result.
 
         :param timeout: How long the value is valid in the cache.
                         Negative numbers will keep the key in cache until manually removed.
@@ -462,7 +1931,9 @@ def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
             def wrapper(*args: Any, **kwargs: Any) -> Callable[..., Any]:
                 result = self.get(f"{func}-{args}-{kwargs}", obj)
                 if result == obj:
+                    start = time.perf_counter()
                     result = func(*args, **kwargs)
+                    self._record_cost(f"{func}-{args}-{kwargs}", time.perf_counter() - start)
                     self.set(f"{func}-{args}-{kwargs}", result, timeout)
                 return result
 
@@ -473,6 +1944,523 @@ def wrapper(*args: Any, **kwargs: Any) -> Callable[..., Any]:
 
     memorize = memoize  # for backwards compatibility
 
+    def memoize_many(
+        self,
+        timeout: int | None = None,
+    ) -> Callable[[Callable[..., dict[Any, Any]]], Callable[..., dict[Any, Any]]]:
+        """
+        Save the results of the decorated batch function in cache. The decorated function
+        should take a list of arguments, and return a dict of results for them.
+        The function is only called with the arguments that are not already in the cache.
+        See `get_many_or_load` for details.
+
+        :param timeout: How long the values are valid in the cache.
+                        Negative numbers will keep the key in cache until manually removed.
+        """
+
+        def decorator(func: Callable[..., dict[Any, Any]]) -> Callable[..., dict[Any, Any]]:
+            @wraps(func)
+            def wrapper(args: Iterable[Any]) -> dict[Any, Any]:
+                args_by_key = {f"{func}-{arg}": arg for arg in args}
+
+                def loader(keys: list[str]) -> dict[str, Any]:
+                    loaded = func([args_by_key[key] for key in keys])
+                    return {f"{func}-{arg}": value for arg, value in loaded.items()}
+
+                results = self.get_many_or_load(list(args_by_key), loader, timeout)
+                return {args_by_key[key]: value for key, value in results.items()}
+
+            return wrapper
+
+        return decorator
+
+    def memoize_stream(
+        self,
+        timeout: int | None = None,
+        batch_size: int = 100,
+    ) -> Callable[[Callable[..., Iterable[Any]]], Callable[..., Iterator[Any]]]:
+        """
+        Save the items yielded by the decorated generator function in cache while they are yielded,
+        and replay them from the cache on later calls with the same arguments, a batch at a time,
+        so that not all items need to fit in memory. The items are stored as a list, see `lrange`.
+        Items are written under a temporary key that only replaces the saved items once the generator
+        is exhausted, so generators that raise or are not consumed to the end don't save partial results.
+        Read-only caches replay saved items, but don't save new ones.
+
+        :param timeout: How long the items are valid in the cache.
+                        Negative numbers will keep the key in cache until manually removed.
+        :param batch_size: Number of items to write or read at a time.
+        """
+
+        def decorator(func: Callable[..., Iterable[Any]]) -> Callable[..., Iterator[Any]]:
+            @wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Iterator[Any]:
+                key = f"{func}-{args}-{kwargs}"
+                saved = self._get_stream(key)
+                if saved is not None:
+                    yield from self._read_stream(key, *saved, batch_size)
+                elif self.read_only:
+                    yield from func(*args, **kwargs)
+                else:
+                    yield from self._write_stream(key, func(*args, **kwargs), timeout, batch_size)
+
+            return wrapper
+
+        return decorator
+
+    @_busy_retried(_return_none)
+    def _get_stream(self, key: str) -> tuple[int, int] | None:
+        """Version and number of items of the memoized stream under the key, or None if it's not in the cache."""
+        if not self._may_contain(key):
+            return None
+
+        saved: tuple[int, float, int] | None = self._con.execute(self._get_stream_sql, {"key": key}).fetchone()
+        if saved is None:
+            return None
+
+        exp = self._exp_datetime(saved[1])
+        if exp is not None and datetime.datetime.now(tz=datetime.timezone.utc) >= exp:
+            return None
+        return saved[0], saved[2]
+
+    def _read_stream(self, key: str, version: int, count: int, batch_size: int) -> Iterator[Any]:
+        start = 0
+        while start < count:
+            # Each batch is read separately, so that no read transaction is kept open between items.
+            items = self._read_stream_items(key, version, start, batch_size)
+            if not items:
+                msg = "Memoized items were replaced or deleted while they were being read."
+                raise RuntimeError(msg)
+
+            for _, value in items:
+                yield self._unstream(value)
+            start = items[-1][0] + 1
+
+    @_busy_retried()
+    def _read_stream_items(self, key: str, version: int, start: int, limit: int) -> list[tuple[int, bytes]]:
+        data = {"key": key, "version": version, "start": start, "limit": limit}
+        return self._con.execute(self._get_stream_items_sql, data).fetchall()
+
+    def _write_stream(self, key: str, items: Iterable[Any], timeout: int | None, batch_size: int) -> Iterator[Any]:
+        temp_key = f"{key}-{uuid.uuid4().hex}"
+        finished = False
+        try:
+            batch: list[dict[str, Any]] = []
+            count = 0
+            for count, item in enumerate(items, start=1):
+                batch.append({"key": temp_key, "field": count - 1, "value": self._stream(item)})
+                if len(batch) >= batch_size:
+                    self._write_stream_items(batch)
+                    batch = []
+                yield item
+
+            self._finish_stream(key, temp_key, batch, count, timeout)
+            finished = True
+        finally:
+            # Items can't be deleted in the middle of another transaction, for example if the generator
+            # is closed by the garbage collector. Those are left for 'compact' to remove.
+            if not finished and not self._con.in_transaction:
+                with suppress(sqlite3.Error):
+                    self._delete_stream_items(temp_key)
+
+    @_busy_retried()
+    def _write_stream_items(self, batch: list[dict[str, Any]]) -> None:
+        with self._write_transaction() as con:
+            con.executemany(self._set_item_sql, batch)
+
+    @_busy_retried()
+    def _finish_stream(
+        self, key: str, temp_key: str, batch: list[dict[str, Any]], count: int, timeout: int | None
+    ) -> None:
+        """Replace the items under the key with the items written under the temporary key."""
+        with self._write_transaction() as con:
+            con.executemany(self._set_item_sql, batch)
+            # Compacting might have removed the items while they were generated.
+            if con.execute(self._get_item_bounds_sql, {"key": temp_key}).fetchone()[0] != count:
+                con.execute(self._delete_items_sql, {"key": temp_key})
+                return
+
+            self._remember_keys([key])
+            # Deleting the previous row first also removes its items with the triggers.
+            con.execute(self._delete_sql, {"key": key})
+            con.execute(self._set_sql, {"key": key, "value": "list", "exp": self._expiry(timeout)})
+            con.execute(self._rename_items_sql, {"key": key, "temp_key": temp_key})
+
+    @_busy_retried()
+    def _delete_stream_items(self, temp_key: str) -> None:
+        with self._write_transaction() as con:
+            con.execute(self._delete_items_sql, {"key": temp_key})
+
+    @_busy_retried()
+    def set_absent(self, key: str, timeout: int = DEFAULT_ABSENT_TIMEOUT) -> None:
+        """
+        Remember that the value for some key does not exist, so that it doesn't need to be looked up again.
+        Until the timeout, `get` returns `ABSENT` for the key instead of the default.
+
+        :param key: Cache key.
+        :param timeout: How long the key is known to be absent.
+                        Negative numbers will keep the key in cache until manually removed.
+        """
+        self._set_payload(key, self._absent_payload, timeout)
+
+    @_busy_retried()
+    def set_many_absent(self, keys: list[str], timeout: Timeouts = DEFAULT_ABSENT_TIMEOUT) -> None:
+        """
+        Remember that the values for the given keys do not exist. See `set_absent`.
+
+        :param keys: List of cache keys.
+        :param timeout: How long the keys are known to be absent.
+                        Negative numbers will keep the key in cache until manually removed.
+                        Can also be a mapping or a function, as in `set_many`.
+        """
+        self._set_many_payloads(dict.fromkeys(keys, self._absent_payload), timeout)
+
+    @property
+    def _absent_payload(self) -> bytes:
+        return self._stream(ABSENT)
+
+    @_busy_retried()
+    def use_key_filter(self, capacity: int = 1_000_000, error_rate: float = 0.01) -> None:
+        """
+        Keep a Bloom filter of the keys in the cache in memory, so that lookups for keys
+        that are definitely not in the cache don't need to query the database.
+        Keys are never removed from the filter, so call this again from time to time to rebuild it
+        if many keys are deleted or expire. The filter only knows about keys set through this instance,
+        so it should not be used if other instances or processes write to the same cache.
+
+        :param capacity: Number of keys the filter is sized for.
+        :param error_rate: Wanted rate of lookups for missing keys that still need to query the database.
+        """
+        key_filter = BloomFilter(capacity, error_rate)
+        # Keys set while the filter is being filled are added to it,
+        # but it's not used for lookups until it's complete.
+        self._key_filter_ready = False
+        self._key_filter = key_filter
+        for (key,) in self._con.execute(self._all_keys_sql):
+            key_filter.add(key)
+        self._key_filter_ready = True
+
+    def _may_contain(self, key: str) -> bool:
+        return self._key_filter is None or not self._key_filter_ready or key in self._key_filter
+
+    def _remember_keys(self, keys: Iterable[str]) -> None:
+        # Keys must be added before they are written, so that the filter never misses a key in the database.
+        if self._key_filter is not None:
+            self._key_filter.update(keys)
+
+    @_busy_retried()
+    def use_admission(self, max_entries: int, width: int | None = None, depth: int = 4) -> None:
+        """
+        Only write new keys to a full cache if they are likely to be worth more than the values they replace,
+        so that keys written once by scans and batch jobs don't push out frequently used values.
+        Reads and writes of keys through this instance are counted in a count-min sketch in memory.
+        Once the cache has `max_entries` values, `set`, `set_many` and `memoize` only write a new key
+        if it has been used more often than the value `evict` would delete next, or if it took longer
+        to compute in `memoize`. That value is then deleted to make room. Keys already in the cache are always written.
+        The counts are saved to the database by `maintain` and `close_all`, and loaded here if the sketch size matches.
+
+        :param max_entries: Number of values at which the cache is full.
+        :param width: Number of counters in each row of the sketches. Defaults to `max_entries`.
+        :param depth: Number of rows in the sketches.
+        :raises ValueError: Maximum number of entries, width or depth is not positive.
+        """
+        if max_entries <= 0:
+            msg = f"Maximum number of entries must be a positive integer, got {max_entries!r}."
+            raise ValueError(msg)
+
+        width = width or max_entries
+        sketches = {"frequency": CountMinSketch(width, depth), "cost": CountMinSketch(width, depth)}
+        for name, sketch in sketches.items():
+            saved: tuple[int, int, bytes] | None = self._con.execute(self._get_sketch_sql, {"name": name}).fetchone()
+            if saved is not None and saved[:2] == (width, depth):
+                sketch.load(saved[2])
+
+        self._admission = (max_entries, sketches["frequency"], sketches["cost"])
+        self._entry_count = None
+
+    @_busy_retried()
+    def _save_admission(self) -> None:
+        """Save the counts for admission control, so that a restarted process doesn't need to learn them again."""
+        if self._admission is None or self.read_only:
+            return
+
+        _, frequencies, costs = self._admission
+        data = [
+            {"name": name, "width": sketch.width, "depth": sketch.depth, "data": sketch.to_bytes()}
+            for name, sketch in (("frequency", frequencies), ("cost", costs))
+        ]
+        self._con.executemany(self._set_sketch_sql, data)
+        self._con.commit()
+
+    def _record_uses(self, keys: Iterable[str]) -> None:
+        if self._admission is not None:
+            for key in keys:
+                self._admission[1].add(key)
+
+    def _record_cost(self, key: str, seconds: float) -> None:
+        # Costs are kept in milliseconds, so that they fit the integer counters of the sketch.
+        if self._admission is not None:
+            self._admission[2].raise_to(key, math.ceil(seconds * 1000))
+
+    def _admit(self, keys: list[str]) -> list[str]:
+        """
+        Keys that should be written, when admission control is used. For each new key admitted
+        to a full cache, the value that `evict` would delete next is deleted to make room.
+        """
+        if self._admission is None:
+            return keys
+
+        max_entries, frequencies, costs = self._admission
+        self._record_uses(keys)
+        command = self._existing_keys_sql.format(self._placeholders(keys))
+        existing = {key for (key,) in self._con.execute(command, keys)}
+        new_keys = [key for key in keys if key not in existing]
+
+        if self._entry_count is None or self._new_keys_since_count >= self.ADMISSION_RECOUNT:
+            self._entry_count = self._con.execute(self._count_sql).fetchone()[0]
+            self._new_keys_since_count = 0
+        self._new_keys_since_count += len(new_keys)
+
+        room = max(max_entries - self._entry_count, 0)
+        self._entry_count += min(room, len(new_keys))
+        contested = new_keys[room:]
+        if not contested:
+            return keys
+
+        # Keys in the cache are only candidates for eviction if they are not being written now.
+        data = {"count": len(contested) + len(existing)}
+        candidates = [key for (key,) in self._con.execute(self._eviction_candidates_sql, data) if key not in existing]
+
+        rejected: set[str] = set()
+        victims: list[str] = []
+        for i, key in enumerate(contested):
+            victim = candidates[i] if i < len(candidates) else None
+            if victim is not None and (
+                frequencies.estimate(key) > frequencies.estimate(victim) or costs.estimate(key) > costs.estimate(victim)
+            ):
+                victims.append(victim)
+            else:
+                rejected.add(key)
+
+        if victims:
+            self._con.execute(self._delete_many_sql.format(self._placeholders(victims)), victims)
+            self._con.commit()
+        return [key for key in keys if key not in rejected]
+
+    @_busy_retried(_return_default)
+    def get_raw(self, key: str, default: bytes | None = None) -> bytes | None:
+        """
+        Get the bytes under some key as they were stored, without unpickling them.
+        Return `default` if key not in the cache or expired.
+
+        :param key: Cache key.
+        :param default: Value to return if key not in the cache.
+        """
+        payload = self._get_payload(key)
+        if payload is None:
+            return default
+        return payload
+
+    @_busy_retried()
+    def set_raw(self, key: str, value: bytes, timeout: int | None = None) -> None:
+        """
+        Set bytes in cache under some key as they are, without pickling them.
+        Raw values should only be read with the raw methods, since `get` expects a pickled value.
+
+        :param key: Cache key.
+        :param value: Bytes to store.
+        :param timeout: How long the value is valid in the cache.
+                        Negative numbers will keep the key in cache until manually removed.
+        """
+        self._set_payload(key, bytes(value), timeout)
+
+    @_busy_retried(_return_empty)
+    def get_many_raw(self, keys: list[str]) -> dict[str, bytes]:
+        """
+        Get the bytes under the given keys as they were stored, without unpickling them.
+        Keys that don't exist or are expired are not included in the returned dict.
+
+        :param keys: List of cache keys.
+        """
+        return self._get_many_payloads(keys)
+
+    @_busy_retried()
+    def set_many_raw(self, dict_: dict[str, bytes], timeout: Timeouts | None = None) -> None:
+        """
+        Set bytes to the cache for all keys in the given dict as they are, without pickling them.
+
+        :param dict_: Cache keys with bytes to set.
+        :param timeout: How long the values are valid in the cache.
+                        Negative numbers will keep the key in cache until manually removed.
+                        Can also be a mapping or a function, as in `set_many`.
+        """
+        self._set_many_payloads({key: bytes(value) for key, value in dict_.items()}, timeout)
+
+    @_busy_retried(_return_none)
+    def read_into(self, key: str, buffer: bytearray | memoryview, offset: int = 0) -> int | None:
+        """
+        Read the bytes under some key into the given buffer, without loading the whole value into memory.
+        Reads at most `len(buffer)` bytes. Call again with a larger `offset` to read the rest.
+        If the value is replaced while it's being read, the result is undefined.
+
+        :param key: Cache key.
+        :param buffer: Writable buffer to read the bytes into.
+        :param offset: Position in the stored value to start reading from.
+        :return: Number of bytes read, or None if key not in the cache or expired.
+        """
+        segments = self._blob_segments(key)
+        if segments is None:
+            return None
+
+        view = memoryview(buffer).cast("B")
+        read = 0
+        for table, column, rowid, length in segments:
+            if offset >= length:
+                offset -= length
+                continue
+            if read >= len(view):
+                break
+
+            size = min(length - offset, len(view) - read)
+            view[read : read + size] = self._read_blob(key, table, column, rowid, offset, size)
+            read += size
+            offset = 0
+
+        return read
+
+    @_busy_retried(_return_none)
+    def iter_raw(self, key: str, size: int | None = None) -> Iterator[bytes] | None:
+        """
+        Iterate over the bytes under some key in pieces, without loading the whole value into memory.
+        Useful for streaming large values to a file or a socket.
+        If the value is replaced while it's being read, the result is undefined.
+
+        :param key: Cache key.
+        :param size: Maximum size of the pieces. Defaults to `CHUNK_SIZE`.
+        :return: Iterator of bytes, or None if key not in the cache or expired.
+        """
+        segments = self._blob_segments(key)
+        if segments is None:
+            return None
+
+        size = self.CHUNK_SIZE if size is None else size
+        if size <= 0:
+            msg = "Size must be a positive integer."
+            raise ValueError(msg)
+
+        def pieces() -> Iterator[bytes]:
+            for table, column, rowid, length in segments:
+                for start in range(0, length, size):
+                    yield self._read_blob(key, table, column, rowid, start, min(size, length - start))
+
+        return pieces()
+
+    def _blob_segments(self, key: str) -> list[tuple[str, str, int | None, int]] | None:
+        """
+        Table, column, rowid and length of each part of the value under the given key, in order.
+        Rowid is None for values in a cache table without rowids.
+        """
+        if not self._may_contain(key):
+            return None
+
+        command = self._get_blob_sql if self._has_rowid else self._get_blob_without_rowid_sql
+        result: tuple[int | None, int | None, float] | None = self._con.execute(command, {"key": key}).fetchone()
+        if result is None:
+            return None
+
+        rowid, length, exp_ = result
+        exp = self._exp_datetime(exp_)
+        if exp is not None and datetime.datetime.now(tz=datetime.timezone.utc) >= exp:
+            self._purge([key])
+            return None
+
+        if length is not None:
+            return [(self.table, "value", rowid, length)]
+
+        chunks: list[tuple[int, int]] = self._con.execute(self._get_chunk_blobs_sql, {"key": key}).fetchall()
+        if not chunks:
+            return None
+        chunk_table = f"{self.table}_chunk"
+        return [(chunk_table, "data", chunk_rowid, chunk_length) for chunk_rowid, chunk_length in chunks]
+
+    @_busy_retried()
+    def _read_blob(self, key: str, table: str, column: str, rowid: int | None, offset: int, size: int) -> bytes:
+        if rowid is None:
+            data = {"key": key, "start": offset + 1, "length": size}
+            return self._con.execute(self._read_value_slice_sql, data).fetchone()[0]
+
+        # Incremental blob I/O was added in Python 3.11.
+        if hasattr(self._con, "blobopen"):
+            with self._con.blobopen(table, column, rowid, readonly=True) as blob:
+                blob.seek(offset)
+                return blob.read(size)
+
+        command = self._read_blob_sql.format(table=table, column=column)
+        return self._con.execute(command, {"rowid": rowid, "start": offset + 1, "length": size}).fetchone()[0]
+
+    @_busy_retried()
+    def changes_since(self, seq: int = 0, limit: int = 1000) -> list[Change]:
+        """
+        Get changes from the change log in order, for replicating them to another cache with `apply_changes`.
+        Requires the cache to be created with `changelog=True`.
+
+        :param seq: Sequence number of the last change already seen. Zero gets changes from the beginning.
+        :param limit: Maximum number of changes to return.
+        :return: List of changes. The `seq` of the last one should be given on the next call.
+        """
+        data = {"seq": seq, "limit": limit}
+        fetched: list[tuple[int, str, ChangeOp, float, bytes | None, int]]
+        fetched = self._con.execute(self._changes_since_sql, data).fetchall()
+
+        changes: list[Change] = []
+        for seq_, key, op, exp, value, exists in fetched:
+            payload = self._read_value(key, value) if exists else None
+            changes.append(Change(seq=seq_, key=key, op=op, exp=exp, value=payload))
+        return changes
+
+    def apply_changes(self, changes: Iterable[Change]) -> int | None:
+        """
+        Apply changes from another cache's `changes_since` in a single transaction.
+        Values keep their original expiration times.
+
+        :param changes: Changes to apply, in order.
+        :return: Sequence number of the last applied change, or None if there were no changes.
+        """
+        # The changes are collected first, so that they can be applied again if the database is locked.
+        return self._apply_changes(list(changes))
+
+    @_busy_retried()
+    def _apply_changes(self, changes: list[Change]) -> int | None:
+        last_seq: int | None = None
+        with self._write_transaction() as con:
+            for change in changes:
+                last_seq = change.seq
+                if change.op == "touch":
+                    con.execute(self._set_exp_sql, {"key": change.key, "exp": change.exp})
+                # A set without a value has been deleted since, or holds a rate limit or a collection,
+                # which are not replicated. Either way, an older value must not be left behind.
+                elif change.op == "delete" or change.value is None:
+                    con.execute(self._delete_sql, {"key": change.key})
+                else:
+                    self._remember_keys([change.key])
+                    data = {"key": change.key, "value": self._inline(change.value), "exp": change.exp}
+                    con.execute(self._set_sql, data)
+                    self._write_chunks(change.key, change.value)
+        return last_seq
+
+    @_busy_retried()
+    def trim_changelog(self, seq: int) -> int:
+        """
+        Remove changes from the change log, once all replicas have seen them.
+
+        :param seq: Remove changes up to and including this sequence number.
+        :return: Number of removed changes.
+        """
+        deleted = self._con.execute(self._trim_changelog_sql, {"seq": seq}).rowcount
+        self._con.commit()
+        return deleted
+
+    @_busy_retried()
     def ttl(self, key: str) -> int:
         """
         How long the key is still valid in the cache in seconds.
@@ -492,12 +2480,12 @@ def ttl(self, key: str) -> int:
 
         ttl = int((exp - datetime.datetime.now(tz=datetime.timezone.utc)).total_seconds())
         if ttl <= 0:
-            self._con.execute(self._delete_sql, {"key": key})
-            self._con.commit()
+            self._purge([key])
             return -2
 
         return ttl
 
+    @_busy_retried()
     def ttl_many(self, keys: list[str]) -> dict[str, int]:
         """
         How long the given keys are still valid in the cache in seconds.
@@ -506,8 +2494,8 @@ def ttl_many(self, keys: list[str]) -> dict[str, int]:
 
         :param keys: List of cache keys.
         """
-        seq = ", ".join([f"'{value}'" for value in keys])
-        fetched: list[tuple[str, Any, float]] = self._con.execute(self._get_many_sql.format(seq)).fetchall()
+        command = self._get_many_sql.format(self._placeholders(keys))
+        fetched: list[tuple[str, Any, float]] = self._con.execute(command, keys).fetchall()
         exp_by_key: dict[str, float] = {key: exp for key, _, exp in fetched}
 
         results: dict[str, int] = {}
@@ -530,10 +2518,7 @@ def ttl_many(self, keys: list[str]) -> dict[str, int]:
 
             results[key] = int((exp - datetime.datetime.now(tz=datetime.timezone.utc)).total_seconds())
 
-        if to_delete:
-            self._con.execute(self._delete_many_sql.format(", ".join([f"'{value}'" for value in to_delete])))
-            self._con.commit()
-
+        self._purge(to_delete)
         return results
 
     def _filter_key_result_list(self, unfiltered: list[tuple[str, Any]]) -> list[str]:
@@ -554,12 +2539,10 @@ def _filter_key_result_list(self, unfiltered: list[tuple[str, Any]]) -> list[str
 
             results.append(key)
 
-        if to_delete:
-            self._con.execute(self._delete_many_sql.format(", ".join([f"'{key}'" for key in to_delete])))
-            self._con.commit()
-
+        self._purge(to_delete)
         return results
 
+    @_busy_retried()
     def get_all_keys(self) -> list[str]:
         """
         Get all keys that exist in the cache for currently valid cache items.
@@ -573,6 +2556,7 @@ def get_all_keys(self) -> list[str]:
 
         return self._filter_key_result_list(fetched)
 
+    @_busy_retried()
     def find_matching_keys(self, like_match_pattern: str) -> list[str]:
         """
         Find keys that match a SQL `LIKE` pattern.
@@ -624,6 +2608,7 @@ def find_keys_containing(self, pattern: str) -> list[str]:
         """
         return self.find_matching_keys(f"%{pattern}%")
 
+    @_busy_retried()
     def clear_matching_keys(self, like_match_pattern: str) -> None:
         """
         Clear keys that match a SQL `LIKE` pattern.
@@ -665,3 +2650,196 @@ def clear_keys_containing(self, pattern: str) -> None:
         :param pattern: The pattern to find in matching keys.
         """
         return self.clear_matching_keys(f"%{pattern}%")
+
+    @_busy_retried()
+    def optimize(self) -> None:
+        """
+        Refresh query planner statistics that are likely to be out of date.
+        This also runs automatically every `OPTIMIZE_EVERY` uses of a connection,
+        as a part of `maintain`, and when a connection is closed.
+        https://www.sqlite.org/pragma.html#pragma_optimize
+        """
+        self._con.execute(self._set_pragma.format("optimize"))
+
+    @_busy_retried()
+    def analyze(self) -> None:
+        """
+        Gather query planner statistics for all tables and indexes.
+        Usually `optimize` is enough, and much cheaper.
+        https://www.sqlite.org/lang_analyze.html
+        """
+        self._con.execute(self._analyze_sql)
+        self._con.commit()
+
+    @_busy_retried()
+    def delete_expired(self) -> int:
+        """
+        Delete all expired values from the cache.
+
+        :return: Number of deleted values.
+        """
+        now = datetime.datetime.now(tz=datetime.timezone.utc).timestamp()
+        deleted = self._con.execute(self._delete_expired_sql, {"now": now}).rowcount
+        self._con.commit()
+        return deleted
+
+    @_busy_retried()
+    def evict(self, count: int) -> int:
+        """
+        Delete the given number of values from the cache, starting from the ones that expire soonest.
+        Values that never expire are deleted last.
+
+        :param count: Number of values to delete.
+        :return: Number of deleted values.
+        """
+        deleted = self._con.execute(self._evict_sql, {"count": count}).rowcount
+        self._con.commit()
+        return deleted
+
+    @_busy_retried()
+    def cull(self, max_entries: int, cull_frequency: int = 3) -> int:
+        """
+        Delete expired values, and if the cache still has more than `max_entries` values,
+        evict a `1 / cull_frequency` fraction of them with `evict`.
+
+        :param max_entries: Maximum number of values to keep in the cache.
+        :param cull_frequency: Inverse of the fraction of values to evict. Zero clears the whole cache.
+        :return: Number of deleted values.
+        """
+        deleted = self.delete_expired()
+        count: int = self._con.execute(self._count_sql).fetchone()[0]
+        if count <= max_entries:
+            return deleted
+
+        if cull_frequency == 0:
+            self.clear()
+            return deleted + count
+
+        return deleted + self.evict(count // cull_frequency)
+
+    @_busy_retried()
+    def checkpoint(self, mode: CheckpointMode = "PASSIVE") -> CheckpointResult:
+        """
+        Move the contents of the WAL file into the database file.
+        https://www.sqlite.org/pragma.html#pragma_wal_checkpoint
+
+        :param mode: "PASSIVE" checkpoints as much as possible without waiting for other connections.
+                     "FULL" and "RESTART" wait for writers, and "RESTART" also for readers, so that the WAL
+                     can be reused from the beginning. "TRUNCATE" works like "RESTART", but also truncates
+                     the WAL file to zero bytes.
+        :raises ValueError: Unknown checkpoint mode.
+        """
+        # The mode is formatted into the pragma, since pragmas cannot be parametrized.
+        if mode not in get_args(CheckpointMode):
+            msg = f"Unknown checkpoint mode {mode!r}. Choices are: {', '.join(get_args(CheckpointMode))}."
+            raise ValueError(msg)
+
+        busy, wal_frames, checkpointed_frames = self._con.execute(self._checkpoint_sql.format(mode)).fetchone()
+        return CheckpointResult(busy=bool(busy), wal_frames=wal_frames, checkpointed_frames=checkpointed_frames)
+
+    @_busy_retried()
+    def incremental_vacuum(self, pages: int = 0) -> None:
+        """
+        Return free pages from the database file to the filesystem.
+        Only has an effect when the database uses `auto_vacuum=incremental`.
+
+        :param pages: Maximum number of pages to free. Zero frees all of them.
+        """
+        # Each step of the pragma frees one page, and only 'executescript' runs it to completion.
+        self._con.executescript(self._incremental_vacuum_sql.format(int(pages)))
+
+    @_busy_retried()
+    def compact(self) -> None:
+        """
+        Shrink the database files to match the live data in the cache.
+        Deletes expired values and leftover chunks of large values, rate limit hits, and collection items,
+        including the items of abandoned `memoize_stream` generators. Also frees unused pages,
+        and truncates the WAL file.
+        If the database was not created with `auto_vacuum=incremental`, the whole
+        database is rebuilt with `VACUUM`, which also applies the configured `auto_vacuum` mode.
+        """
+        self.delete_expired()
+        self._con.execute(self._delete_orphan_chunks_sql)
+        self._con.execute(self._delete_orphan_hits_sql)
+        self._con.execute(self._delete_orphan_items_sql)
+        self._con.commit()
+        auto_vacuum: int = self._con.execute(self._set_pragma.format("auto_vacuum")).fetchone()[0]
+        if auto_vacuum == 2:  # noqa: PLR2004
+            self.incremental_vacuum()
+        else:
+            if "auto_vacuum" in self.pragma:
+                self._con.execute(self._set_pragma_equal.format("auto_vacuum", self.pragma["auto_vacuum"]))
+            self._con.execute(self._vacuum_sql)
+        self.checkpoint("TRUNCATE")
+
+    @_busy_retried()
+    def stats(self) -> CacheStats:
+        """Size of the database and WAL files, and page usage within the database."""
+        db_path = Path(self.connection_string)
+        wal_path = db_path.with_name(f"{db_path.name}-wal")
+        return CacheStats(
+            file_size=db_path.stat().st_size if db_path.exists() else 0,
+            wal_size=wal_path.stat().st_size if wal_path.exists() else 0,
+            page_size=self._con.execute(self._set_pragma.format("page_size")).fetchone()[0],
+            page_count=self._con.execute(self._set_pragma.format("page_count")).fetchone()[0],
+            freelist_count=self._con.execute(self._set_pragma.format("freelist_count")).fetchone()[0],
+        )
+
+    def maintain(self, wal_size_limit: int = 2**26) -> None:
+        """
+        Run a single round of maintenance: delete expired values, checkpoint the WAL file,
+        return free pages to the filesystem, refresh query planner statistics,
+        and save the counts for admission control.
+
+        :param wal_size_limit: If the WAL file is larger than this many bytes, it is truncated
+                               after checkpointing. Otherwise, a passive checkpoint is made.
+        """
+        self.delete_expired()
+        mode: CheckpointMode = "TRUNCATE" if self.stats()["wal_size"] > wal_size_limit else "PASSIVE"
+        self.checkpoint(mode)
+        self.incremental_vacuum()
+        self.optimize()
+        self._save_admission()
+
+    def start_maintenance(self, interval: float = 60.0, wal_size_limit: int = 2**26) -> None:
+        """
+        Run `maintain` periodically in a background thread until `stop_maintenance` is called.
+        Does nothing if maintenance is already running.
+
+        :param interval: Seconds between maintenance rounds.
+        :param wal_size_limit: Passed to `maintain`.
+        """
+        if self._maintenance is not None:
+            return
+
+        stopped = Event()
+
+        def run() -> None:
+            while not stopped.wait(interval):
+                self._maintenance_round(wal_size_limit)
+            self.close()
+
+        thread = Thread(target=run, name="sqlite3-cache-maintenance", daemon=True)
+        self._maintenance = (thread, stopped)
+        thread.start()
+
+    def _maintenance_round(self, wal_size_limit: int) -> None:
+        try:
+            self.maintain(wal_size_limit=wal_size_limit)
+        except sqlite3.OperationalError:
+            logger.warning("Cache maintenance failed, retrying on the next round.", exc_info=True)
+
+    def stop_maintenance(self) -> None:
+        """Stop background maintenance started with `start_maintenance`, and wait for it to finish."""
+        if self._maintenance is None:
+            return
+
+        thread, stopped = self._maintenance
+        self._maintenance = None
+        stopped.set()
+        thread.join()
+
+
+# Not available on Windows, where processes are never forked.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import sys
+from pathlib import Path
+
+from .analysis import analyze_keys
+from .cache import Cache
+from .server import DEFAULT_ADDRESS, MAX_BODY_SIZE, CacheServer
+
+__all__ = [
+    "main",
+]
+
+
+def _analyze_command(args: argparse.Namespace) -> int:
+    path = Path(args.file)
+    cache = Cache(filename=path.name, path=str(path.parent), in_memory=False, read_only=True, table=args.table)
+    try:
+        report = analyze_keys(cache, top=args.top, separator=args.separator, batch_size=args.batch_size)
+    finally:
+        cache.close()
+
+    report["prefixes"] = dict(sorted(report["prefixes"].items(), key=lambda item: item[1]["bytes"], reverse=True))
+    sys.stdout.write(json.dumps(report, indent=2) + "\n")
+    return 0
+
+
+def _serve_command(args: argparse.Namespace) -> int:
+    path = Path(args.file)
+    cache = Cache(filename=path.name, path=str(path.parent), in_memory=False, table=args.table)
+    address = args.unix or (args.host, args.port)
+    with CacheServer(cache, address, max_body_size=args.max_body_size) as server:
+        sys.stdout.write(f"Serving {path} on {server.address}\n")
+        sys.stdout.flush()
+        with contextlib.suppress(KeyboardInterrupt):
+            server.serve_forever()
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m sqlite3_cache", description="sqlite3-cache tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    analyze = subparsers.add_parser("analyze", help="Report value sizes, prefixes and TTLs of a cache file as JSON.")
+    analyze.add_argument("file", help="Path to the cache file.")
+    analyze.add_argument("--table", default="cache", help="Table of the cache in the file.")
+    analyze.add_argument("--top", type=int, default=10, help="Number of largest values to report.")
+    analyze.add_argument("--separator", default=":", help="Separator that ends the prefix of a key.")
+    analyze.add_argument("--batch-size", type=int, default=1000, help="Number of keys to read at a time.")
+    analyze.set_defaults(handler=_analyze_command)
+
+    serve = subparsers.add_parser("serve", help="Serve a cache file to clients over TCP or a Unix socket.")
+    serve.add_argument("file", help="Path to the cache file.")
+    serve.add_argument("--table", default="cache", help="Table of the cache in the file.")
+    serve.add_argument("--host", default=DEFAULT_ADDRESS[0], help="Host to listen on.")
+    serve.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1], help="Port to listen on.")
+    serve.add_argument("--unix", default=None, help="Path of a Unix socket to listen on instead of a TCP port.")
+    serve.add_argument("--max-body-size", type=int, default=MAX_BODY_SIZE, help="Largest request body in bytes.")
+    serve.set_defaults(handler=_serve_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from pathlib import Path
+from threading import Lock
+from typing import Any, ClassVar
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .cache import Cache
+
+__all__ = ["SQLiteCache"]
+
+
+class SQLiteCache(BaseCache):
+    """
+    Django cache backend that stores values in a `sqlite3_cache.Cache`.
+
+    CACHES = {
+        "default": {
+            "BACKEND": "sqlite3_cache.django_cache.SQLiteCache",
+            "LOCATION": "/var/tmp/django.cache",
+            "OPTIONS": {"MAX_ENTRIES": 10_000, "profile": "throughput"},
+        },
+    }
+    """
+
+    # Check whether the cache needs culling after this many writes.
+    CULL_EVERY = 100
+
+    # Django creates a backend instance for each thread, but they can share the same cache,
+    # since it already keeps a separate connection for each thread.
+    _caches: ClassVar[dict[tuple[str, tuple[tuple[str, Any], ...]], Cache]] = {}
+    _caches_lock: ClassVar[Lock] = Lock()
+
+    def __init__(self, location: str, params: dict[str, Any]) -> None:
+        super().__init__(params)
+        options = {
+            key: value
+            for key, value in params.get("OPTIONS", {}).items()
+            if key not in {"MAX_ENTRIES", "CULL_FREQUENCY"}
+        }
+        self._cache = self._get_cache(location, options)
+        self._writes = 0
+
+    @classmethod
+    def _get_cache(cls, location: str, options: dict[str, Any]) -> Cache:
+        cache_key = (location, tuple(sorted(options.items())))
+        with cls._caches_lock:
+            if cache_key not in cls._caches:
+                path = Path(location)
+                cls._caches[cache_key] = Cache(filename=path.name, path=str(path.parent), in_memory=False, **options)
+            return cls._caches[cache_key]
+
+    def _timeout(self, timeout: Any = DEFAULT_TIMEOUT) -> float:
+        """Convert a Django timeout to a cache timeout."""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return -1
+        # In Django, zero and negative timeouts expire the value immediately.
+        return max(timeout, 0)
+
+    def _wrote(self, count: int = 1) -> None:
+        self._writes += count
+        if self._writes >= self.CULL_EVERY:
+            self._writes = 0
+            self._cache.cull(self._max_entries, self._cull_frequency)
+
+    def add(self, key: str, value: Any, timeout: float | None = DEFAULT_TIMEOUT, version: int | None = None) -> bool:
+        key = self.make_and_validate_key(key, version=version)
+        added = self._cache.add(key, value, self._timeout(timeout))
+        self._wrote()
+        return added
+
+    def get(self, key: str, default: Any = None, version: int | None = None) -> Any:
+        key = self.make_and_validate_key(key, version=version)
+        return self._cache.get(key, default)
+
+    def set(self, key: str, value: Any, timeout: float | None = DEFAULT_TIMEOUT, version: int | None = None) -> None:
+        key = self.make_and_validate_key(key, version=version)
+        self._cache.set(key, value, self._timeout(timeout))
+        self._wrote()
+
+    def touch(self, key: str, timeout: float | None = DEFAULT_TIMEOUT, version: int | None = None) -> bool:
+        key = self.make_and_validate_key(key, version=version)
+        return self._cache.touch(key, self._timeout(timeout))
+
+    def delete(self, key: str, version: int | None = None) -> bool:
+        key = self.make_and_validate_key(key, version=version)
+        return self._cache.delete(key)
+
+    def get_many(self, keys: list[str], version: int | None = None) -> dict[str, Any]:
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        return {key_map[key]: value for key, value in self._cache.get_many(list(key_map)).items()}
+
+    def has_key(self, key: str, version: int | None = None) -> bool:
+        key = self.make_and_validate_key(key, version=version)
+        return key in self._cache
+
+    def incr(self, key: str, delta: int = 1, version: int | None = None) -> int:
+        key = self.make_and_validate_key(key, version=version)
+        return self._cache.incr(key, delta)
+
+    def set_many(
+        self,
+        data: dict[str, Any],
+        timeout: float | None = DEFAULT_TIMEOUT,
+        version: int | None = None,
+    ) -> list[str]:
+        if data:
+            values = {self.make_and_validate_key(key, version=version): value for key, value in data.items()}
+            self._cache.set_many(values, self._timeout(timeout))
+            self._wrote(len(values))
+        return []
+
+    def delete_many(self, keys: list[str], version: int | None = None) -> None:
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if keys:
+            self._cache.delete_many(keys)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def close(self, **kwargs: Any) -> None:
+        # Django closes caches after every request, but connections are kept open for the thread instead.
+        pass
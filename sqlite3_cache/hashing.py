@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import hashlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+
+__all__ = [
+    "hash_positions",
+]
+
+
+def hash_positions(key: str, count: int, size: int) -> Iterator[int]:
+    """
+    Positions of the key for the given number of hash functions, from a single hash of the key.
+    Used by the probabilistic structures of the cache, like `BloomFilter` and `CountMinSketch`.
+
+    :param key: Key to hash.
+    :param count: Number of positions, one for each hash function.
+    :param size: Number of possible positions. Positions are between 0 and `size - 1`.
+    """
+    # Double hashing: https://www.eecs.harvard.edu/~michaelm/postscripts/rsa2008.pdf
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], "little")
+    second = int.from_bytes(digest[8:], "little") | 1
+    for i in range(count):
+        yield (first + i * second) % size
@@ -0,0 +1,519 @@
+from __future__ import annotations
+
+import json
+import pickle
+import socket
+import socketserver
+import struct
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from threading import Lock, Thread
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+    from typing import BinaryIO
+
+    from .cache import Cache
+
+    Decoder = Callable[[Any, list[bytes]], Any]
+    Request = tuple[dict[str, Any], list[bytes], Decoder]
+
+try:
+    from typing import Self
+except ImportError:
+    from typing_extensions import Self
+
+
+__all__ = [
+    "CacheClient",
+    "CacheServer",
+    "Pipeline",
+]
+
+
+# Each frame is the length of a JSON header and the length of a body, followed by both.
+# Values are sent as raw bytes in the body, and their sizes are listed in the header under "sizes".
+# The server never unpickles anything it receives: values are pickled and unpickled by the client,
+# and stored as they are with the raw methods of the cache.
+_FRAME = struct.Struct("!II")
+MAX_HEADER_SIZE = 2**24
+# Default limit for the body of a request, so that a client can't make the server allocate arbitrary amounts
+# of memory. Clients don't limit the responses of the server they chose to connect to.
+MAX_BODY_SIZE = 2**26
+
+DEFAULT_ADDRESS = ("127.0.0.1", 6380)
+
+Address = tuple[str, int] | str
+
+
+def _write_frame(stream: BinaryIO, header: dict[str, Any], blobs: Iterable[bytes] = ()) -> None:
+    blobs = list(blobs)
+    head = json.dumps({**header, "sizes": [len(blob) for blob in blobs]}, separators=(",", ":")).encode()
+    body = b"".join(blobs)
+    stream.write(b"".join([_FRAME.pack(len(head), len(body)), head, body]))
+
+
+def _read_exactly(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        msg = "Connection closed in the middle of a frame."
+        raise ConnectionError(msg)
+    return data
+
+
+def _write_frames(stream: BinaryIO, requests: Iterable[Request]) -> None:
+    for header, blobs, _ in requests:
+        _write_frame(stream, header, blobs)
+    stream.flush()
+
+
+def _read_frame(stream: BinaryIO, max_body_size: int | None = None) -> tuple[dict[str, Any], list[bytes]] | None:
+    """
+    Read a frame from the stream. Returns None if the stream was closed between frames.
+    Raises ValueError if the header or the body is larger than allowed. None allows a body of any size.
+    """
+    prefix = stream.read(_FRAME.size)
+    if not prefix:
+        return None
+    if len(prefix) != _FRAME.size:
+        msg = "Connection closed in the middle of a frame."
+        raise ConnectionError(msg)
+
+    head_size, body_size = _FRAME.unpack(prefix)
+    if head_size > MAX_HEADER_SIZE or (max_body_size is not None and body_size > max_body_size):
+        msg = f"Frame is too large: header {head_size} bytes, body {body_size} bytes."
+        raise ValueError(msg)
+
+    header: dict[str, Any] = json.loads(_read_exactly(stream, head_size))
+    body = memoryview(_read_exactly(stream, body_size))
+    blobs: list[bytes] = []
+    start = 0
+    for size in header.get("sizes", []):
+        blobs.append(bytes(body[start : start + size]))
+        start += size
+    return header, blobs
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Handles the requests of one client connection in order, so that clients can pipeline them."""
+
+    server: _TCPServer | _UnixServer
+
+    def handle(self) -> None:
+        cache = self.server.cache
+        try:
+            while True:
+                try:
+                    frame = _read_frame(self.rfile, self.server.max_body_size)
+                except (ConnectionError, ValueError):
+                    return
+                if frame is None:
+                    return
+
+                header, blobs = frame
+                try:
+                    result, out = _dispatch(cache, header, blobs)
+                    response: dict[str, Any] = {"ok": True, "result": result}
+                except Exception as error:  # noqa: BLE001
+                    response, out = {"ok": False, "error": type(error).__name__, "message": str(error)}, []
+                _write_frame(self.wfile, response, out)
+        finally:
+            # Each connection is handled in its own thread, which has its own connection to the cache.
+            cache.close()
+
+
+def _get(cache: Cache, key: str, **_: Any) -> tuple[Any, list[bytes]]:
+    payload = cache.get_raw(key)
+    return payload is not None, [] if payload is None else [payload]
+
+
+def _get_many(cache: Cache, keys: list[str], **_: Any) -> tuple[Any, list[bytes]]:
+    payloads = cache.get_many_raw(keys)
+    return list(payloads), list(payloads.values())
+
+
+_OPERATIONS: dict[str, Callable[..., tuple[Any, list[bytes]]]] = {
+    "get": _get,
+    "set": lambda cache, key, timeout, blobs, **_: (cache.set_raw(key, blobs[0], timeout), []),
+    "delete": lambda cache, key, **_: (cache.delete(key), []),
+    "touch": lambda cache, key, timeout, **_: (cache.touch(key, timeout), []),
+    "ttl": lambda cache, key, **_: (cache.ttl(key), []),
+    "contains": lambda cache, key, **_: (key in cache, []),
+    "get_many": _get_many,
+    "set_many": lambda cache, keys, timeout, blobs, **_: (
+        cache.set_many_raw(dict(zip(keys, blobs, strict=True)), timeout),
+        [],
+    ),
+    "delete_many": lambda cache, keys, **_: (cache.delete_many(keys), []),
+    "clear": lambda cache, **_: (cache.clear(), []),
+}
+
+
+def _dispatch(cache: Cache, header: dict[str, Any], blobs: list[bytes]) -> tuple[Any, list[bytes]]:
+    """Run the operation of a request. Returns the result for the response header, and the blobs for its body."""
+    operation = _OPERATIONS.get(header.get("op", ""))
+    if operation is None:
+        msg = f"Unknown operation: {header.get('op')!r}."
+        raise ValueError(msg)
+
+    return operation(
+        cache,
+        key=header.get("key", ""),
+        keys=header.get("keys", []),
+        timeout=header.get("timeout"),
+        blobs=blobs,
+    )
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    cache: Cache
+    max_body_size: int
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+        cache: Cache
+        max_body_size: int
+
+else:  # Windows
+    _UnixServer = None  # type: ignore[assignment,misc]
+
+
+class CacheServer:
+    """
+    Serve a cache to `CacheClient`s over TCP or a Unix socket, so that several hosts can share it.
+    The protocol has no authentication or encryption, so only serve on trusted networks.
+    """
+
+    def __init__(self, cache: Cache, address: Address = DEFAULT_ADDRESS, max_body_size: int = MAX_BODY_SIZE) -> None:
+        """
+        Create a server and bind it to the given address. Call `serve_forever` to start serving.
+
+        :param cache: Cache to serve.
+        :param address: Host and port to listen on with TCP, or the path of a Unix socket.
+        :param max_body_size: Largest request body in bytes, for the values of a single request.
+                              Connections that send larger requests are closed.
+        :raises ValueError: Unix sockets are not supported on this platform.
+        """
+        if isinstance(address, str) and _UnixServer is None:
+            msg = "Unix sockets are not supported on this platform."
+            raise ValueError(msg)
+
+        server_class = _UnixServer if isinstance(address, str) else _TCPServer
+        self._server = server_class(address, _Handler)
+        self._server.cache = cache
+        self._server.max_body_size = max_body_size
+
+    @property
+    def address(self) -> Address:
+        """Address the server is listening on. Useful when binding to port 0."""
+        return self._server.server_address
+
+    def serve_forever(self, poll_interval: float = 0.5) -> None:
+        """
+        Handle requests until `shutdown` is called. Each client connection is handled in its own thread.
+
+        :param poll_interval: Seconds between checks for shutdown.
+        """
+        self._server.serve_forever(poll_interval)
+
+    def shutdown(self) -> None:
+        """Stop `serve_forever`. Must be called from another thread."""
+        self._server.shutdown()
+
+    def close(self) -> None:
+        """Stop listening for connections."""
+        self._server.server_close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+
+class _Commands(ABC):
+    """Cache operations that are sent to the server. Subclasses decide when to send them."""
+
+    PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+    @abstractmethod
+    def _send(self, header: dict[str, Any], blobs: list[bytes], decoder: Decoder) -> Any:
+        """Send the operation, and return what the decoder makes of its result, or something standing in for it."""
+
+    def _stream(self, value: Any) -> bytes:
+        return pickle.dumps(value, protocol=self.PICKLE_PROTOCOL)
+
+    def _unstream(self, value: bytes) -> Any:
+        return pickle.loads(value)  # noqa: S301
+
+    @staticmethod
+    def _result(result: Any, _blobs: list[bytes]) -> Any:
+        return result
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Get the value under some key. Return `default` if key not in the cache or expired.
+
+        :param key: Cache key.
+        :param default: Value to return if key not in the cache.
+        """
+        return self._send(
+            {"op": "get", "key": key},
+            [],
+            lambda found, blobs: self._unstream(blobs[0]) if found else default,
+        )
+
+    def set(self, key: str, value: Any, timeout: int | None = None) -> None:
+        """
+        Set a value in cache under some key.
+
+        :param key: Cache key.
+        :param value: Picklable object to store.
+        :param timeout: How long the value is valid in the cache. None uses the default timeout of the served cache.
+                        Negative numbers will keep the key in cache until manually removed.
+        """
+        return self._send({"op": "set", "key": key, "timeout": timeout}, [self._stream(value)], self._result)
+
+    def delete(self, key: str) -> bool:
+        """
+        Remove the value under the given key from the cache.
+
+        :param key: Cache key.
+        :return: Whether the key was in the cache.
+        """
+        return self._send({"op": "delete", "key": key}, [], self._result)
+
+    def touch(self, key: str, timeout: int | None = None) -> bool:
+        """
+        Extend the lifetime of an object in cache.
+
+        :param key: Cache key.
+        :param timeout: How long the value is valid in the cache. None uses the default timeout of the served cache.
+                        Negative numbers will keep the key in cache until manually removed.
+        :return: Whether the key was in the cache.
+        """
+        return self._send({"op": "touch", "key": key, "timeout": timeout}, [], self._result)
+
+    def ttl(self, key: str) -> int:
+        """
+        How long the key is still valid in the cache in seconds.
+        Returns `-1` if the value for the key does not expire, and `-2` if it has expired or has not been set.
+
+        :param key: Cache key.
+        """
+        return self._send({"op": "ttl", "key": key}, [], self._result)
+
+    def contains(self, key: str) -> bool:
+        """
+        Check whether the key is in the cache and has not expired.
+
+        :param key: Cache key.
+        """
+        return self._send({"op": "contains", "key": key}, [], self._result)
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """
+        Get all values for the given keys in one request. Missing or expired keys are not included.
+
+        :param keys: List of cache keys.
+        """
+        return self._send(
+            {"op": "get_many", "keys": list(keys)},
+            [],
+            lambda found, blobs: {key: self._unstream(blob) for key, blob in zip(found, blobs, strict=True)},
+        )
+
+    def set_many(self, dict_: dict[str, Any], timeout: int | None = None) -> None:
+        """
+        Set values to the cache for all keys in the given dict in one request.
+
+        :param dict_: Cache keys with values to set.
+        :param timeout: How long the values are valid in the cache. None uses the default timeout of the served cache.
+                        Negative numbers will keep the keys in cache until manually removed.
+        """
+        blobs = [self._stream(value) for value in dict_.values()]
+        return self._send({"op": "set_many", "keys": list(dict_), "timeout": timeout}, blobs, self._result)
+
+    def delete_many(self, keys: list[str]) -> None:
+        """
+        Remove the values under the given keys from the cache in one request.
+
+        :param keys: List of cache keys.
+        """
+        return self._send({"op": "delete_many", "keys": list(keys)}, [], self._result)
+
+    def clear(self) -> None:
+        """Clear the cache from all values."""
+        return self._send({"op": "clear"}, [], self._result)
+
+
+class CacheClient(_Commands):
+    """
+    Client for a cache served by `CacheServer`, with the same API as `Cache` for the supported operations.
+    Values are pickled by the client, so they are compatible with the raw methods of the served cache.
+    A client can be shared by threads, but requests are sent one at a time. Use `pipeline` to send many at once.
+    """
+
+    def __init__(self, address: Address = DEFAULT_ADDRESS, *, timeout: float | None = 5.0) -> None:
+        """
+        Create a client. The connection is opened on the first request.
+
+        :param address: Host and port of the server, or the path of its Unix socket.
+        :param timeout: Seconds to wait for the server before raising `TimeoutError`. None waits forever.
+        """
+        self.address = address
+        self.timeout = timeout
+        self._socket: socket.socket | None = None
+        self._file: BinaryIO | None = None
+        self._lock = Lock()
+
+    def _connect(self) -> BinaryIO:
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+        else:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket = sock
+        self._file = sock.makefile("rwb")
+        return self._file
+
+    def _send(self, header: dict[str, Any], blobs: list[bytes], decoder: Decoder) -> Any:
+        return self._execute([(header, blobs, decoder)])[0]
+
+    def _execute(self, requests: list[Request]) -> list[Any]:
+        """Send all requests without waiting for each response, and return the decoded results in order."""
+        with self._lock:
+            stream = self._file or self._connect()
+            try:
+                responses = self._exchange(stream, requests)
+            except BaseException:
+                # The connection might be out of sync with the server, so start over with a new one.
+                self.close()
+                raise
+
+        results: list[Any] = []
+        for response, (_, _, decoder) in zip(responses, requests, strict=True):
+            if response is None:
+                self.close()
+                msg = "Server closed the connection."
+                raise ConnectionError(msg)
+
+            header, blobs = response
+            if not header["ok"]:
+                exc_class = ValueError if header["error"] == "ValueError" else RuntimeError
+                msg = f"{header['error']}: {header['message']}"
+                raise exc_class(msg)
+            results.append(decoder(header["result"], blobs))
+        return results
+
+    def _exchange(self, stream: BinaryIO, requests: list[Request]) -> list[tuple[dict[str, Any], list[bytes]] | None]:
+        if len(requests) == 1:
+            _write_frames(stream, requests)
+            return [_read_frame(stream)]
+
+        # The server writes responses while the client is still writing requests. If the client only read them
+        # afterwards, both could block on full socket buffers, so the requests are written in another thread.
+        errors: list[BaseException] = []
+
+        def write() -> None:
+            try:
+                _write_frames(stream, requests)
+            except BaseException as error:  # noqa: BLE001
+                errors.append(error)
+                # Let the server finish, so that reading the responses doesn't wait for the timeout.
+                with suppress(OSError):
+                    self._socket.shutdown(socket.SHUT_WR)
+
+        writer = Thread(target=write, name="sqlite3-cache-pipeline", daemon=True)
+        writer.start()
+        try:
+            responses = [_read_frame(stream) for _ in requests]
+        except BaseException:
+            # Unblock the writer, if it's waiting for the server to read.
+            with suppress(OSError):
+                self._socket.shutdown(socket.SHUT_RDWR)
+            raise
+        finally:
+            writer.join()
+
+        if errors:
+            raise errors[0]
+        return responses
+
+    def pipeline(self) -> Pipeline:
+        """Collect requests, and send them to the server all at once with `Pipeline.execute`."""
+        return Pipeline(self)
+
+    def close(self) -> None:
+        """Close the connection to the server. It's opened again on the next request."""
+        file, sock, self._file, self._socket = self._file, self._socket, None, None
+        if file is not None:
+            file.close()
+        if sock is not None:
+            sock.close()
+
+    def __getitem__(self, key: str) -> Any:
+        found, value = self._send(
+            {"op": "get", "key": key},
+            [],
+            lambda found, blobs: (found, self._unstream(blobs[0]) if found else None),
+        )
+        if not found:
+            msg = "Key not in cache."
+            raise KeyError(msg)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self.delete(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.contains(key)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+
+class Pipeline(_Commands):
+    """
+    Requests collected for sending to the server all at once, without waiting for each response.
+    Methods return None, and the results are returned by `execute` in the order the methods were called.
+    """
+
+    def __init__(self, client: CacheClient) -> None:
+        self._client = client
+        self.PICKLE_PROTOCOL = client.PICKLE_PROTOCOL
+        self._requests: list[Request] = []
+
+    def _send(self, header: dict[str, Any], blobs: list[bytes], decoder: Decoder) -> None:
+        self._requests.append((header, blobs, decoder))
+
+    def execute(self) -> list[Any]:
+        """Send the collected requests, and return their results in order."""
+        requests, self._requests = self._requests, []
+        if not requests:
+            return []
+        return self._client._execute(requests)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        # Requests collected before an error are discarded, like a transaction that is rolled back.
+        if exc_type is None:
+            self.execute()
+        else:
+            self._requests = []
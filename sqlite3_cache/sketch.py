@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from array import array
+from threading import Lock
+from typing import TYPE_CHECKING
+
+from .hashing import hash_positions
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+
+__all__ = ["CountMinSketch"]
+
+
+class CountMinSketch:
+    """
+    Approximate counts of strings in fixed memory. Estimates are never lower than the true count,
+    and collisions with other keys make them higher by a small fraction of all counts.
+    Counts are halved every `sample_size` additions, so that recent activity weighs more than old.
+    """
+
+    MAX_COUNT = 2**32 - 1
+
+    def __init__(self, width: int, depth: int = 4, sample_size: int | None = None) -> None:
+        """
+        Create an empty sketch.
+
+        :param width: Number of counters in each row. Wider sketches have fewer collisions.
+        :param depth: Number of rows, each with its own hash of the key.
+        :param sample_size: Number of additions after which all counts are halved. Defaults to ten times the width.
+        :raises ValueError: Width, depth or sample size is not positive.
+        """
+        for name, value in (
+            ("Width", width),
+            ("Depth", depth),
+            ("Sample size", 1 if sample_size is None else sample_size),
+        ):
+            if value <= 0:
+                msg = f"{name} must be a positive integer, got {value!r}."
+                raise ValueError(msg)
+
+        self.width = width
+        self.depth = depth
+        self.sample_size = sample_size or 10 * width
+        self._counters = array("I", [0]) * (width * depth)
+        self._additions = 0
+        self._lock = Lock()
+
+    def _positions(self, key: str) -> Iterator[int]:
+        for row, column in enumerate(hash_positions(key, self.depth, self.width)):
+            yield row * self.width + column
+
+    def estimate(self, key: str) -> int:
+        """
+        Estimated count of the key.
+
+        :param key: Key to estimate.
+        """
+        return min(self._counters[pos] for pos in self._positions(key))
+
+    def add(self, key: str, count: int = 1) -> None:
+        """
+        Add to the count of the key. Only the smallest counters of the key are increased,
+        which keeps the overestimates of other keys lower.
+
+        :param key: Key to count.
+        :param count: Amount to add.
+        """
+        positions = list(self._positions(key))
+        with self._lock:
+            new = min(min(self._counters[pos] for pos in positions) + count, self.MAX_COUNT)
+            for pos in positions:
+                self._counters[pos] = max(self._counters[pos], new)
+
+            self._additions += count
+            if self._additions >= self.sample_size:
+                self._halve()
+
+    def raise_to(self, key: str, value: int) -> None:
+        """
+        Make the estimate of the key at least the given value. Doesn't count as an addition.
+
+        :param key: Key to raise.
+        :param value: Lowest wanted estimate.
+        """
+        positions = list(self._positions(key))
+        value = min(value, self.MAX_COUNT)
+        with self._lock:
+            for pos in positions:
+                self._counters[pos] = max(self._counters[pos], value)
+
+    def _halve(self) -> None:
+        self._counters = array("I", (counter >> 1 for counter in self._counters))
+        self._additions = 0
+
+    def clear(self) -> None:
+        """Reset all counts to zero."""
+        with self._lock:
+            self._counters = array("I", [0]) * len(self._counters)
+            self._additions = 0
+
+    def to_bytes(self) -> bytes:
+        """Counters of the sketch, for saving them with `load`."""
+        with self._lock:
+            return self._counters.tobytes()
+
+    def load(self, data: bytes) -> None:
+        """
+        Replace the counters of the sketch with ones from `to_bytes`.
+
+        :param data: Counters from a sketch with the same width and depth.
+        :raises ValueError: The counters are for a sketch of a different size.
+        """
+        counters = array("I")
+        if len(data) != len(self._counters) * counters.itemsize:
+            msg = f"Expected counters for a sketch of width {self.width} and depth {self.depth}."
+            raise ValueError(msg)
+
+        counters.frombytes(data)
+        with self._lock:
+            self._counters = counters
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Mapping
+from typing import Literal, NamedTuple, TypeAlias, TypedDict
+
+__all__ = [
+    "CacheStats",
+    "Change",
+    "ChangeOp",
+    "CheckpointMode",
+    "CheckpointResult",
+    "CollectionType",
+    "ContentionStats",
+    "KeyReport",
+    "Layout",
+    "PrefixStats",
+    "RateLimit",
+    "RateLimitAlgorithm",
+    "Timeouts",
+]
+
+
+CheckpointMode = Literal["PASSIVE", "FULL", "RESTART", "TRUNCATE"]
+
+ChangeOp = Literal["set", "touch", "delete"]
+
+CollectionType = Literal["hash", "set", "list"]
+
+Layout = Literal["rowid", "without_rowid"]
+
+RateLimitAlgorithm = Literal["fixed_window", "sliding_window", "token_bucket"]
+
+Timeouts: TypeAlias = int | Mapping[str, int] | Callable[[str], int]
+"""A single timeout for all keys, timeouts by key, or a function that returns the timeout for a key."""
+
+
+class CheckpointResult(NamedTuple):
+    busy: bool
+    """Whether the checkpoint could not complete because of other connections."""
+    wal_frames: int
+    """Number of frames in the WAL file, or -1 if the database is not in WAL mode."""
+    checkpointed_frames: int
+    """Number of frames moved to the database file, or -1 if the database is not in WAL mode."""
+
+
+class CacheStats(TypedDict):
+    file_size: int
+    """Size of the database file in bytes."""
+    wal_size: int
+    """Size of the WAL file in bytes."""
+    page_size: int
+    """Size of a database page in bytes."""
+    page_count: int
+    """Number of pages in the database."""
+    freelist_count: int
+    """Number of unused pages in the database."""
+
+
+class ContentionStats(TypedDict):
+    busy: int
+    """Number of times an operation found the database locked by other connections."""
+    retries: int
+    """Number of times an operation was tried again after backing off."""
+    wait: float
+    """Total seconds spent backing off before retries."""
+    failed: int
+    """Number of times an operation gave up and raised an error."""
+    dropped: int
+    """Number of reads that returned a miss because the cache fails open."""
+
+
+class Change(NamedTuple):
+    seq: int
+    """Position of the change in the change log."""
+    key: str
+    """Cache key that was changed."""
+    op: ChangeOp
+    """Whether the key was set, deleted, or only had its expiration changed."""
+    exp: float
+    """Expiration timestamp of the value, or -1.0 if it doesn't expire."""
+    value: bytes | None
+    """Current pickled value for "set" changes, or None if the key has been deleted since, or isn't a value."""
+
+
+class RateLimit(NamedTuple):
+    allowed: bool
+    """Whether the hit was allowed. Denied hits are not counted against the limit."""
+    remaining: int
+    """Number of hits still allowed in the current window."""
+    reset: float
+    """Seconds until the limit is fully available again."""
+    retry_after: float
+    """Seconds until the next hit would be allowed, or 0.0 if the hit was allowed."""
+
+
+class PrefixStats(TypedDict):
+    count: int
+    """Number of keys with the prefix."""
+    bytes: int
+    """Total size of the values of the keys with the prefix."""
+
+
+class KeyReport(TypedDict):
+    count: int
+    """Number of keys in the cache, including expired ones."""
+    bytes: int
+    """Total size of the values in the cache."""
+    expired: int
+    """Number of keys that have expired, but have not been deleted yet."""
+    expired_share: float
+    """Fraction of keys that have expired, but have not been deleted yet."""
+    sizes: dict[int, int]
+    """Number of values by size, rounded up to the next power of two bytes."""
+    largest: list[tuple[str, int]]
+    """Largest values in the cache by size, largest first."""
+    prefixes: dict[str, PrefixStats]
+    """Number of keys and size of values by the part of the key before the separator."""
+    ttls: dict[str, int]
+    """Number of keys by how long they are still valid in the cache."""
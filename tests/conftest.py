@@ -1,10 +1,23 @@
+import os
+
 import pytest
 
 from sqlite3_cache import Cache
 
 
 @pytest.fixture(scope="session", autouse=True)
-def cache_create():
+def working_directory(tmp_path_factory):
+    # Caches use files in the current directory by default, even in memory, so keep them out of the repository.
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("cwd"))
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_create(working_directory):
     cache = Cache()
     try:
         yield cache
@@ -0,0 +1,40 @@
+import json
+
+from sqlite3_cache import Cache
+from sqlite3_cache.analysis import analyze_keys
+from sqlite3_cache.cli import main
+
+
+def test_analyze_keys(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.LARGE_VALUE_THRESHOLD = 1000
+    cache.set_raw("user:1", b"x" * 100, timeout=30)
+    cache.set_raw("user:2", b"x" * 200, timeout=3000)
+    cache.set_raw("page:1", b"x" * 5000, timeout=-1)
+    cache.set_raw("other", b"x", timeout=0)
+
+    report = analyze_keys(cache, top=2, batch_size=2)
+    assert report["count"] == 4
+    assert report["bytes"] == 5301
+    assert report["expired"] == 1
+    assert report["expired_share"] == 0.25
+    assert report["sizes"] == {1: 1, 128: 1, 256: 1, 8192: 1}
+    assert report["largest"] == [("page:1", 5000), ("user:2", 200)]
+    assert report["prefixes"] == {
+        "": {"count": 1, "bytes": 1},
+        "page": {"count": 1, "bytes": 5000},
+        "user": {"count": 2, "bytes": 300},
+    }
+    assert report["ttls"] == {"expired": 1, "none": 1, "<1m": 1, "<1h": 1, "<1d": 0, "<1w": 0, ">=1w": 0}
+    cache.close()
+
+
+def test_analyze_command(tmp_path, capsys):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.set_raw("user:1", b"x" * 100)
+    cache.close()
+
+    assert main(["analyze", str(tmp_path / ".cache"), "--top", "1"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["count"] == 1
+    assert report["largest"] == [["user:1", 100]]
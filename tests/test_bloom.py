@@ -0,0 +1,34 @@
+import pytest
+
+from sqlite3_cache import BloomFilter
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000)
+    bloom.update(f"key{i}" for i in range(1000))
+
+    assert all(f"key{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other{i}" in bloom for i in range(10_000))
+    assert false_positives < 300
+
+
+def test_bloom_filter__clear():
+    bloom = BloomFilter(capacity=10)
+    bloom.add("foo")
+    assert "foo" in bloom
+
+    bloom.clear()
+    assert "foo" not in bloom
+
+
+@pytest.mark.parametrize(
+    ("capacity", "error_rate", "message"),
+    [
+        (0, 0.01, "Capacity must be a positive integer"),
+        (10, 0, "Error rate must be between 0 and 1"),
+        (10, 1, "Error rate must be between 0 and 1"),
+    ],
+)
+def test_bloom_filter__invalid(capacity, error_rate, message):
+    with pytest.raises(ValueError, match=message):
+        BloomFilter(capacity=capacity, error_rate=error_rate)
@@ -1,11 +1,15 @@
+import os
+import pickle
 import sqlite3
+import threading
+import time
 from time import perf_counter_ns, sleep
 from datetime import datetime, timezone, timedelta
 
 import pytest
 from freezegun import freeze_time
 
-from sqlite3_cache import Cache
+from sqlite3_cache import ABSENT, Cache
 
 
 @freeze_time("2022-01-01T00:00:00+00:00")
@@ -645,3 +649,1284 @@ def test_speed():
     print(f" Get: {get_:.01f}us - Min: {get_min:.01f}us - Max: {get_max:.01f}us")  # noqa
     print(f" Del: {del_:.01f}us - Min: {del_min:.01f}us - Max: {del_max:.01f}us")  # noqa
     print("--------------------------------------------")  # noqa
+
+
+def test_cache_pragma__kwargs_override_defaults(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, cache_size=-1024, synchronous="normal")
+    assert cache._con.execute("PRAGMA cache_size;").fetchone()[0] == -1024
+    assert cache._con.execute("PRAGMA synchronous;").fetchone()[0] == 1
+    cache.close()
+
+
+def test_cache_pragma__profile(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, profile="low-memory", wal_autocheckpoint=100)
+    assert cache._con.execute("PRAGMA mmap_size;").fetchone()[0] == 0
+    assert cache._con.execute("PRAGMA cache_size;").fetchone()[0] == -2048
+    assert cache._con.execute("PRAGMA journal_size_limit;").fetchone()[0] == 2**22
+    assert cache._con.execute("PRAGMA wal_autocheckpoint;").fetchone()[0] == 100
+    cache.close()
+
+
+def test_cache_pragma__unknown_profile():
+    with pytest.raises(ValueError, match="Unknown pragma profile 'fast'"):
+        Cache(profile="fast")
+
+
+@pytest.mark.parametrize(
+    ("pragma", "message"),
+    [
+        ({"page_size": 1000}, "must be a power of two"),
+        ({"mmap_size": -1}, "must be a non-negative integer"),
+        ({"cache_size": "big"}, "must be an integer"),
+        ({"synchronous": "off; DROP TABLE cache"}, "Invalid value for pragma"),
+    ],
+)
+def test_cache_pragma__invalid(pragma, message):
+    with pytest.raises(ValueError, match=message):
+        Cache(**pragma)
+
+
+def test_cache_pragma__database_pragma_applied_once_per_file(tmp_path):
+    cache_1 = Cache(path=str(tmp_path), in_memory=False, journal_mode="wal")
+    cache_1.set("foo", "bar")
+    cache_2 = Cache(path=str(tmp_path), in_memory=False, journal_mode="delete")
+    assert cache_2._con.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+    cache_1.close()
+    cache_2.close()
+
+
+def test_cache_pragma__journal_mode_applied_per_connection(tmp_path):
+    cache_1 = Cache(path=str(tmp_path), in_memory=False, journal_mode="truncate")
+    cache_1.set("foo", "bar")
+    assert cache_1._con.execute("PRAGMA journal_mode;").fetchone()[0] == "truncate"
+
+    modes = []
+    thread = threading.Thread(target=lambda: modes.append(cache_1._con.execute("PRAGMA journal_mode;").fetchone()[0]))
+    thread.start()
+    thread.join()
+    assert modes == ["truncate"]
+
+    cache_2 = Cache(path=str(tmp_path), in_memory=False, journal_mode="truncate")
+    assert cache_2._con.execute("PRAGMA journal_mode;").fetchone()[0] == "truncate"
+    cache_1.close_all()
+    cache_2.close()
+
+
+def test_cache_file_removed_and_created_again(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.set("foo", "bar")
+    cache.close()
+    for path in tmp_path.iterdir():
+        path.unlink()
+
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    assert cache.get("foo") is None
+    cache.set("foo", "baz")
+    assert cache.get("foo") == "baz"
+    cache.close()
+
+
+def test_cache_delete_expired(cache):
+    with freeze_time("2022-01-01T00:00:00+00:00"):
+        cache.set("foo", "bar", timeout=1)
+        cache.set("one", "two", timeout=10)
+        cache.set("three", "four", timeout=-1)
+    with freeze_time("2022-01-01T00:00:05+00:00"):
+        assert cache.delete_expired() == 1
+        assert cache.get_all_keys() == ["one", "three"]
+
+
+def test_cache_checkpoint(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.set_many({f"key{i}": "x" * 1000 for i in range(100)})
+    assert cache.stats()["wal_size"] > 0
+
+    result = cache.checkpoint("TRUNCATE")
+    assert result.busy is False
+    assert cache.stats()["wal_size"] == 0
+    cache.close()
+
+
+@pytest.mark.parametrize("mode", ["truncate", "NONE", "PASSIVE); DROP TABLE cache; --"])
+def test_cache_checkpoint__unknown_mode(tmp_path, mode):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.set("foo", "bar")
+    with pytest.raises(ValueError, match="Unknown checkpoint mode"):
+        cache.checkpoint(mode)
+    assert cache.get("foo") == "bar"
+    cache.close()
+
+
+def test_cache_compact(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.set_many({f"key{i}": "x" * 10_000 for i in range(100)})
+    cache.checkpoint("TRUNCATE")
+    peak_size = cache.stats()["file_size"]
+
+    cache.clear()
+    assert cache.stats()["freelist_count"] > 0
+
+    cache.compact()
+    stats = cache.stats()
+    assert stats["freelist_count"] == 0
+    assert stats["wal_size"] == 0
+    assert stats["file_size"] < peak_size
+    cache.close()
+
+
+def test_cache_compact__auto_vacuum_none(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, auto_vacuum="none")
+    cache.set_many({f"key{i}": "x" * 10_000 for i in range(100)})
+    cache.clear()
+
+    cache.compact()
+    assert cache.stats()["freelist_count"] == 0
+    cache.close()
+
+
+def test_cache_start_maintenance(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.set("foo", "bar", timeout=1)
+    cache.set("one", "two", timeout=-1)
+    sleep(1.1)
+
+    cache.start_maintenance(interval=0.05)
+    sleep(0.3)
+    cache.stop_maintenance()
+
+    assert cache._con.execute("SELECT key FROM cache;").fetchall() == [("one",)]
+    cache.close()
+
+
+def test_cache_close__twice(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    con = cache._con
+    cache.close()
+    cache.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        con.execute("SELECT 1;")
+
+
+def test_cache_close__reopen(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.set("foo", "bar")
+    cache.close()
+    assert cache.get("foo") == "bar"
+    cache.close()
+
+
+def test_cache_close_all(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    connections = []
+    used = threading.Event()
+    done = threading.Event()
+
+    def worker():
+        cache.set("foo", "bar")
+        connections.append(cache._con)
+        used.set()
+        done.wait()
+        connections.append(cache._con)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    used.wait()
+
+    cache.close_all()
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[0].execute("SELECT 1;")
+
+    # Other threads get a new connection after closing.
+    done.set()
+    thread.join()
+    assert connections[1] is not connections[0]
+    assert cache.get("foo") == "bar"
+    cache.close_all()
+
+
+def test_cache_optimize__every_n_uses(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.OPTIMIZE_EVERY = 5
+    statements = []
+    cache._con.set_trace_callback(statements.append)
+
+    for i in range(10):
+        cache.get(f"foo{i}")
+
+    assert statements.count("PRAGMA optimize;") == 2
+    cache.close()
+
+
+def test_cache_analyze(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.set_many({f"foo{i}": i for i in range(10)})
+    cache.analyze()
+    assert cache._con.execute("SELECT COUNT(*) FROM sqlite_stat1;").fetchone()[0] > 0
+    cache.close()
+
+
+def test_cache_get_many__quotes_in_keys(cache):
+    cache.set_many({"it's": "bar", 'say "hi"': "baz"})
+    assert cache.get_many(["it's", 'say "hi"']) == {"it's": "bar", 'say "hi"': "baz"}
+    cache.delete_many(["it's"])
+    assert cache.get_many(["it's", 'say "hi"']) == {'say "hi"': "baz"}
+
+
+def test_cache_get_many_or_load(cache):
+    cache.set("foo", "bar")
+    calls = []
+
+    def loader(keys):
+        calls.append(keys)
+        return {key: key.upper() for key in keys}
+
+    assert cache.get_many_or_load(["foo", "one", "two", "one"], loader) == {"foo": "bar", "one": "ONE", "two": "TWO"}
+    assert calls == [["one", "two"]]
+    assert cache.get_many(["one", "two"]) == {"one": "ONE", "two": "TWO"}
+
+    assert cache.get_many_or_load(["foo", "one", "two"], loader) == {"foo": "bar", "one": "ONE", "two": "TWO"}
+    assert calls == [["one", "two"]]
+
+
+def test_cache_get_many_or_load__loader_skips_keys(cache):
+    assert cache.get_many_or_load(["foo", "one"], lambda keys: {"foo": None}) == {"foo": None}
+    assert cache.get_many(["foo", "one"]) == {"foo": None}
+
+
+def test_cache_get_many_or_load__single_flight(cache):
+    calls = []
+    loading = threading.Event()
+    release = threading.Event()
+    results = {}
+
+    def slow_loader(keys):
+        calls.append(keys)
+        loading.set()
+        release.wait()
+        return {key: key.upper() for key in keys}
+
+    def first():
+        results["first"] = cache.get_many_or_load(["foo", "one"], slow_loader)
+
+    def second():
+        results["second"] = cache.get_many_or_load(["foo", "two"], slow_loader)
+
+    thread_1 = threading.Thread(target=first)
+    thread_1.start()
+    loading.wait()
+    loading.clear()
+    thread_2 = threading.Thread(target=second)
+    thread_2.start()
+    loading.wait()
+    release.set()
+    thread_1.join()
+    thread_2.join()
+
+    assert calls == [["foo", "one"], ["two"]]
+    assert results["first"] == {"foo": "FOO", "one": "ONE"}
+    assert results["second"] == {"foo": "FOO", "two": "TWO"}
+
+
+def test_cache_memoize_many(cache):
+    calls = []
+
+    @cache.memoize_many()
+    def func(ids):
+        calls.append(ids)
+        return {i: i * 2 for i in ids}
+
+    assert func([1, 2]) == {1: 2, 2: 4}
+    assert func([2, 3]) == {2: 4, 3: 6}
+    assert calls == [[1, 2], [3]]
+
+
+def test_cache_memoize_stream(cache):
+    calls = []
+
+    @cache.memoize_stream(batch_size=2)
+    def func(n):
+        calls.append(n)
+        yield from range(n)
+
+    assert list(func(5)) == [0, 1, 2, 3, 4]
+    assert list(func(5)) == [0, 1, 2, 3, 4]
+    assert list(func(0)) == []
+    assert list(func(0)) == []
+    assert calls == [5, 0]
+    assert len(cache.get_all_keys()) == 2
+
+    # Replaying reads the items lazily.
+    items = func(5)
+    assert next(items) == 0
+    cache.clear()
+    assert next(items) == 1
+    with pytest.raises(RuntimeError, match="Memoized items were replaced or deleted"):
+        next(items)
+
+
+def test_cache_memoize_stream__partial(cache):
+    calls = []
+
+    @cache.memoize_stream()
+    def func(n):
+        calls.append(n)
+        for i in range(n):
+            if i == 3:
+                msg = "Oops"
+                raise ValueError(msg)
+            yield i
+
+    items = func(2)
+    assert next(items) == 0
+    items.close()
+    assert cache.get_all_keys() == []
+
+    with pytest.raises(ValueError, match="Oops"):
+        list(func(5))
+    assert cache.get_all_keys() == []
+    assert cache._con.execute("SELECT COUNT(*) FROM cache_item;").fetchone()[0] == 0
+
+    assert list(func(2)) == [0, 1]
+    assert list(func(2)) == [0, 1]
+    assert calls == [2, 5, 2]
+
+
+def test_cache_memoize_stream__in_progress(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+
+    @cache.memoize_stream(timeout=-1, batch_size=1)
+    def func(n):
+        yield from range(n)
+
+    # Items are not listed as keys while they are written.
+    items = func(3)
+    assert next(items) == 0
+    assert next(items) == 1
+    assert cache.get_all_keys() == []
+    assert list(items) == [2]
+    assert len(cache.get_all_keys()) == 1
+
+    # Items of an abandoned stream are removed by compacting, and a stream that loses its items is not saved.
+    items = func(4)
+    next(items)
+    next(items)
+    assert cache._con.execute("SELECT COUNT(*) FROM cache_item;").fetchone()[0] == 5
+    cache.compact()
+    assert cache._con.execute("SELECT COUNT(*) FROM cache_item;").fetchone()[0] == 3
+    assert list(items) == [2, 3]
+    assert len(cache.get_all_keys()) == 1
+    assert cache._con.execute("SELECT COUNT(*) FROM cache_item;").fetchone()[0] == 3
+
+    # Read-only caches replay saved items, but don't save new ones.
+    reader = Cache(path=str(tmp_path), in_memory=False, read_only=True)
+    read_only_func = reader.memoize_stream()(func.__wrapped__)
+    assert list(read_only_func(3)) == [0, 1, 2]
+    assert list(read_only_func(2)) == [0, 1]
+    assert len(cache.get_all_keys()) == 1
+    reader.close()
+    cache.close()
+
+
+def _chunk_count(cache):
+    return cache._con.execute("SELECT COUNT(*) FROM cache_chunk;").fetchone()[0]
+
+
+def test_cache_large_value(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.LARGE_VALUE_THRESHOLD = 1000
+    cache.CHUNK_SIZE = 300
+    value = "x" * 2000
+
+    cache.set("foo", value)
+    assert cache._con.execute("SELECT value FROM cache WHERE key = 'foo';").fetchone() == (None,)
+    assert _chunk_count(cache) > 1
+    assert cache.get("foo") == value
+    assert cache.get_many(["foo"]) == {"foo": value}
+    assert cache.get_or_set("foo", "bar") == value
+
+    cache.add("foo", "bar")
+    assert cache.get("foo") == value
+
+    cache.update("foo", "small")
+    assert cache.get("foo") == "small"
+    assert _chunk_count(cache) == 0
+
+    cache.update_many({"foo": value})
+    assert cache.get("foo") == value
+    cache.delete("foo")
+    assert _chunk_count(cache) == 0
+    cache.close()
+
+
+def test_cache_large_value__many(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.LARGE_VALUE_THRESHOLD = 1000
+    values = {"one": "x" * 2000, "two": "y" * 3000, "three": "z"}
+
+    cache.set_many(values)
+    assert cache.get_many(list(values)) == values
+
+    cache.add_many({"one": "a", "four": "b" * 2000})
+    assert cache.get_many(["one", "four"]) == {"one": values["one"], "four": "b" * 2000}
+
+    cache.clear()
+    assert _chunk_count(cache) == 0
+    cache.close()
+
+
+def test_cache_large_value__expired(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.LARGE_VALUE_THRESHOLD = 1000
+
+    with freeze_time("2022-01-01T00:00:00+00:00"):
+        cache.set("foo", "x" * 2000, timeout=1)
+
+    with freeze_time("2022-01-01T00:00:02+00:00"):
+        assert cache.delete_expired() == 1
+
+    assert _chunk_count(cache) == 0
+    cache.close()
+
+
+def test_cache_raw(cache):
+    cache.set_raw("foo", b"bar")
+    assert cache.get_raw("foo") == b"bar"
+    assert cache.get_raw("one") is None
+    assert cache.get_raw("one", b"default") == b"default"
+
+    cache.set_many_raw({"one": b"1", "two": b"2"})
+    assert cache.get_many_raw(["one", "two", "three"]) == {"one": b"1", "two": b"2"}
+
+
+def test_cache_raw__pickled_value(cache):
+    cache.set("foo", "bar")
+    assert cache.get_raw("foo") == pickle.dumps("bar", protocol=Cache.PICKLE_PROTOCOL)
+
+
+@pytest.mark.parametrize("threshold", [None, 1000])
+def test_cache_read_into(tmp_path, threshold):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.LARGE_VALUE_THRESHOLD = threshold
+    cache.CHUNK_SIZE = 300
+    value = bytes(range(256)) * 10
+    cache.set_raw("foo", value)
+
+    buffer = bytearray(1000)
+    assert cache.read_into("foo", buffer) == 1000
+    assert buffer == value[:1000]
+    assert cache.read_into("foo", buffer, offset=2000) == 560
+    assert buffer[:560] == value[2000:]
+    assert cache.read_into("foo", buffer, offset=3000) == 0
+    assert cache.read_into("bar", buffer) is None
+
+    assert b"".join(cache.iter_raw("foo", size=128)) == value
+    assert all(len(piece) <= 128 for piece in cache.iter_raw("foo", size=128))
+    assert cache.iter_raw("bar") is None
+    cache.close()
+
+
+@freeze_time("2022-01-01T00:00:00+00:00")
+def test_cache_read_into__expired(cache):
+    cache.set_raw("foo", b"bar", timeout=1)
+    with freeze_time("2022-01-01T00:00:02+00:00"):
+        assert cache.read_into("foo", bytearray(10)) is None
+        assert cache.get_raw("foo") is None
+
+
+@freeze_time("2022-01-01T00:00:00+00:00")
+def test_cache_set_many__timeout_by_key(cache):
+    cache.set_many({"foo": 1, "bar": 2, "baz": 3}, timeout={"foo": 10, "bar": -1})
+    assert cache.ttl_many(["foo", "bar", "baz"]) == {"foo": 10, "bar": -1, "baz": Cache.DEFAULT_TIMEOUT}
+
+
+@freeze_time("2022-01-01T00:00:00+00:00")
+def test_cache_add_many__timeout_function(cache):
+    cache.add_many({"a": 1, "bb": 2}, timeout=lambda key: len(key) * 10)
+    assert cache.ttl_many(["a", "bb"]) == {"a": 10, "bb": 20}
+
+
+def test_cache_touch_many__timeout_function(cache):
+    cache.set_many({"a": 1, "bb": 2})
+    cache.touch_many(["a", "bb"], timeout=lambda key: len(key) * 100)
+    ttls = cache.ttl_many(["a", "bb"])
+    assert 99 <= ttls["a"] <= 100
+    assert 199 <= ttls["bb"] <= 200
+
+
+@freeze_time("2022-01-01T00:00:00+00:00")
+def test_cache_ttl_jitter(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, ttl_jitter=0.5)
+    cache.set_many({f"key{i}": i for i in range(100)}, timeout=1000)
+    cache.set("forever", 1, timeout=-1)
+
+    ttls = cache.ttl_many([f"key{i}" for i in range(100)])
+    assert all(500 <= ttl <= 1000 for ttl in ttls.values())
+    assert len(set(ttls.values())) > 1
+    assert cache.ttl("forever") == -1
+    cache.close()
+
+
+@pytest.mark.parametrize("jitter", [-0.1, 1.0])
+def test_cache_ttl_jitter__invalid(jitter):
+    with pytest.raises(ValueError, match="TTL jitter"):
+        Cache(ttl_jitter=jitter)
+
+
+def test_cache_getitem__none(cache):
+    cache["foo"] = None
+    assert cache["foo"] is None
+    with pytest.raises(KeyError):
+        cache["bar"]
+
+
+def test_cache_set_absent(cache):
+    cache.set_absent("foo")
+    assert cache.get("foo", "default") is ABSENT
+    assert cache.get("bar", "default") == "default"
+    assert cache["foo"] is ABSENT
+    assert "foo" in cache
+
+    cache.set_many_absent(["one", "two"])
+    assert cache.get_many(["one", "two", "three"]) == {"one": ABSENT, "two": ABSENT}
+
+
+def test_cache_set_absent__timeout(cache):
+    cache.set_absent("foo")
+    assert Cache.DEFAULT_ABSENT_TIMEOUT - 1 <= cache.ttl("foo") <= Cache.DEFAULT_ABSENT_TIMEOUT
+
+
+def test_absent__pickle():
+    assert pickle.loads(pickle.dumps(ABSENT)) is ABSENT
+    assert not ABSENT
+
+
+def test_cache_use_key_filter(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.set("foo", 1)
+    cache.use_key_filter(capacity=100)
+
+    assert cache.get("foo") == 1
+    cache.set_many({"one": 1, "two": 2})
+    cache.add("three", 3)
+    assert cache.get_many(["one", "two", "three", "four"]) == {"one": 1, "two": 2, "three": 3}
+    assert "four" not in cache
+
+    statements = []
+    cache._con.set_trace_callback(statements.append)
+    assert cache.get("missing") is None
+    assert cache.get_many(["missing"]) == {}
+    assert statements == []
+    cache._con.set_trace_callback(None)
+
+    cache.clear()
+    assert cache.get("foo") is None
+    cache.set("foo", 2)
+    assert cache.get("foo") == 2
+    cache.close()
+
+
+def test_cache_use_admission(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.use_admission(max_entries=2, width=64)
+    cache.set("hot", 1, timeout=10)
+    cache.set("warm", 2, timeout=20)
+    for _ in range(5):
+        cache.get_many(["hot", "warm"])
+
+    # The cache is full, and the key is used less often than the value that expires soonest.
+    cache.set("scan", 3)
+    cache.set_many({"scan1": 3, "scan2": 3})
+    assert cache.get_all_keys() == ["hot", "warm"]
+
+    for _ in range(10):
+        cache.get("new")
+    cache.set_many({"new": 4, "warm": 5})
+    assert cache.get_many(["hot", "warm", "new"]) == {"warm": 5, "new": 4}
+
+    cache.close()
+
+
+def test_cache_use_admission__memoize_cost(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.use_admission(max_entries=1, width=64)
+    cache.set("foo", 1)
+    cache.get("foo")
+
+    @cache.memoize()
+    def func(a):
+        time.sleep(0.01)
+        return a
+
+    assert func(2) == 2
+    assert "foo" not in cache
+    assert len(cache.get_all_keys()) == 1
+    cache.close()
+
+
+def test_cache_use_admission__saved(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.use_admission(max_entries=10)
+    for _ in range(3):
+        cache.get("foo")
+    cache.close_all()
+
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    cache.use_admission(max_entries=10)
+    assert cache._admission[1].estimate("foo") == 3
+    cache.use_admission(max_entries=10, width=20)
+    assert cache._admission[1].estimate("foo") == 0
+    cache.close()
+
+
+def test_cache_deadline__retries_until_unlocked(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, deadline=5)
+    cache.set("foo", 1)
+    other = sqlite3.connect(str(tmp_path / ".cache"), isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE;")
+    threading.Timer(0.05, other.rollback).start()
+
+    cache.set("foo", 2)
+    assert cache.get("foo") == 2
+    stats = cache.contention_stats()
+    assert stats["busy"] == stats["retries"] > 0
+    assert stats["wait"] > 0
+    assert stats["failed"] == stats["dropped"] == 0
+    other.close()
+    cache.close()
+
+
+def test_cache_deadline__fail_open(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, deadline=0.01)
+    cache.set("foo", 1)
+    other = sqlite3.connect(str(tmp_path / ".cache"), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE;")
+
+    with pytest.raises(sqlite3.OperationalError, match="database is locked"):
+        cache.set("foo", 2)
+    assert cache.contention_stats()["failed"] == 1
+
+    cache.fail_open = True
+    with pytest.raises(sqlite3.OperationalError, match="database is locked"):
+        cache.set("foo", 3)
+    with pytest.raises(sqlite3.OperationalError, match="database is locked"):
+        cache.add("bar", 1)
+    with pytest.raises(sqlite3.OperationalError, match="database is locked"):
+        cache.delete("foo")
+    assert cache.get("foo") == 1
+    stats = cache.contention_stats()
+    assert stats["dropped"] == 0
+    assert stats["failed"] == 4
+
+    other.rollback()
+    cache.set("foo", 4)
+    assert cache.get("foo") == 4
+    other.close()
+    cache.close()
+
+
+def test_cache_deadline__fail_open_reads(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, deadline=0.01, fail_open=True, journal_mode="truncate")
+    cache.set("foo", 1)
+    cache.hset("bar", "baz", 2)
+    other = sqlite3.connect(str(tmp_path / ".cache"), isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE;")
+    other.execute("DELETE FROM cache;")
+
+    assert cache.get_and_touch("foo", default="x") == "x"
+    assert cache.gets("foo", "x") == ("x", None)
+    assert cache.hget("bar", "baz", default="x") == "x"
+    assert cache.get_many_and_touch(["foo"]) == {}
+    assert cache.smembers("bar") == set()
+    assert cache.lrange("bar") == []
+    assert cache.contention_stats()["dropped"] == 6
+
+    other.rollback()
+    assert cache.get_and_touch("foo", default="x") == 1
+    assert cache.gets("foo", "x")[0] == 1
+    assert cache.hget("bar", "baz", default="x") == 2
+    other.close()
+    cache.close()
+
+
+def test_cache_deadline__all_operations(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, deadline=5, fail_open=True)
+    logical = cache.logical("other")
+    assert (logical.deadline, logical.fail_open) == (5, True)
+    logical.set_many({"foo": 1, "bar": 2})
+    other = sqlite3.connect(str(tmp_path / ".cache"), isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE;")
+    threading.Timer(0.05, other.rollback).start()
+
+    logical.clear_keys_starting_with("f")
+    assert logical.get_all_keys() == ["bar"]
+    assert logical.contention_stats()["retries"] > 0
+    other.close()
+    cache.close()
+
+
+def test_cache_deadline__nested_operations(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, deadline=0.01)
+    cache.set("foo", 1)
+    other = sqlite3.connect(str(tmp_path / ".cache"), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE;")
+
+    # Compacting calls other retried methods, but the deadline is for the whole operation.
+    with pytest.raises(sqlite3.OperationalError, match="database is locked"):
+        cache.compact()
+    assert cache.contention_stats()["failed"] == 1
+    other.rollback()
+    other.close()
+    cache.close()
+
+
+def test_cache_deadline__invalid():
+    with pytest.raises(ValueError, match="Deadline must be at least 0"):
+        Cache(deadline=-1)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Requires os.fork")
+def test_cache_fork(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    logical = cache.logical("other")
+    cache.set("foo", "parent")
+    parent_con = cache._con
+    parent_lock = cache._contention_lock
+    assert logical._con is parent_con
+
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        ok = False
+        try:
+            ok = cache._con is not parent_con and cache.get("foo") == "parent"
+            ok = ok and logical._con is cache._con and logical._connections is cache._connections
+            ok = ok and cache._contention_lock is not parent_lock
+            cache.set("bar", "child")
+            cache.close()
+        finally:
+            os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert cache._con is parent_con
+    assert cache.get("bar") == "child"
+    cache.close()
+
+
+def test_cache_add_touch_delete__return_value(cache):
+    assert cache.add("foo", 1) is True
+    assert cache.add("foo", 2) is False
+    assert cache.touch("foo") is True
+    assert cache.touch("bar") is False
+    assert cache.delete("foo") is True
+    assert cache.delete("foo") is False
+
+
+def test_cache_evict(cache):
+    cache.set("forever", 1, timeout=-1)
+    cache.set("late", 1, timeout=1000)
+    cache.set("soon", 1, timeout=10)
+
+    assert cache.evict(2) == 2
+    assert cache.get_all_keys() == ["forever"]
+
+
+def test_cache_cull(cache):
+    cache.set_many({f"key{i}": i for i in range(10)})
+    assert cache.cull(max_entries=10) == 0
+    assert cache.cull(max_entries=5, cull_frequency=2) == 5
+    assert len(cache.get_all_keys()) == 5
+    assert cache.cull(max_entries=1, cull_frequency=0) == 5
+    assert cache.get_all_keys() == []
+
+
+def test_cache_changelog(tmp_path):
+    primary = Cache(path=str(tmp_path), filename="primary", in_memory=False, changelog=True)
+    replica = Cache(path=str(tmp_path), filename="replica", in_memory=False)
+    primary.LARGE_VALUE_THRESHOLD = 1000
+
+    primary.set("foo", 1, timeout=-1)
+    primary.set_many({"one": 1, "two": "x" * 2000})
+    primary.delete("one")
+
+    changes = primary.changes_since(0)
+    assert [(change.key, change.op) for change in changes] == [
+        ("foo", "set"),
+        ("one", "set"),
+        ("two", "set"),
+        ("one", "delete"),
+    ]
+    assert changes[1].value is None
+
+    seq = replica.apply_changes(changes)
+    assert seq == changes[-1].seq
+    assert replica.get_many(["foo", "one", "two"]) == {"foo": 1, "two": "x" * 2000}
+    assert replica.ttl("foo") == -1
+    assert replica.ttl("two") == primary.ttl("two")
+
+    primary.touch("foo", 100)
+    assert replica.apply_changes(primary.changes_since(seq, limit=1)) == seq + 1
+    assert 99 <= replica.ttl("foo") <= 100
+
+    primary.clear()
+    replica.apply_changes(primary.changes_since(seq + 1))
+    assert replica.get_all_keys() == []
+    assert replica.apply_changes([]) is None
+
+    assert primary.trim_changelog(seq) == 4
+    assert primary.changes_since(0)[0].seq == seq + 1
+    primary.close()
+    replica.close()
+
+
+def test_cache_changelog__touch(tmp_path):
+    primary = Cache(path=str(tmp_path), filename="primary", in_memory=False, changelog=True)
+    replica = Cache(path=str(tmp_path), filename="replica", in_memory=False)
+    primary.set("foo", "bar", timeout=10)
+    for timeout in (20, 30, 40):
+        primary.touch("foo", timeout)
+
+    changes = primary.changes_since(0)
+    assert [(change.op, change.value is None) for change in changes] == [
+        ("set", False),
+        ("touch", True),
+        ("touch", True),
+        ("touch", True),
+    ]
+    replica.apply_changes(changes)
+    assert replica.get("foo") == "bar"
+    assert 39 <= replica.ttl("foo") <= 40
+    primary.close()
+    replica.close()
+
+
+def test_cache_changelog__apply_changes_rolls_back(tmp_path):
+    primary = Cache(path=str(tmp_path), filename="primary", in_memory=False, changelog=True)
+    replica = Cache(path=str(tmp_path), filename="replica", in_memory=False)
+    primary.set_many({"foo": 1, "bar": 2})
+    changes = primary.changes_since(0)
+
+    broken = changes[1]._replace(key=["not", "a", "string"])
+    with pytest.raises(sqlite3.ProgrammingError):
+        replica.apply_changes([changes[0], broken])
+
+    assert replica._con.in_transaction is False
+    assert replica.get_all_keys() == []
+
+    # A generator can be applied as well.
+    assert replica.apply_changes(change for change in changes) == changes[-1].seq
+    assert replica.get_many(["foo", "bar"]) == {"foo": 1, "bar": 2}
+    primary.close()
+    replica.close()
+
+
+def test_cache_schema__lazy(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    assert not (tmp_path / ".cache").exists()
+
+    cache.set("foo", "bar")
+    assert cache._con.execute("PRAGMA user_version;").fetchone()[0] == len(Cache._migrations)
+    cache.close()
+
+
+def test_cache_schema__migrate_from_unversioned(tmp_path):
+    con = sqlite3.connect(tmp_path / ".cache")
+    con.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value BLOB, exp FLOAT);")
+    con.execute("CREATE UNIQUE INDEX cache_key ON cache(key);")
+    con.execute("INSERT INTO cache VALUES ('foo', ?, -1.0);", [pickle.dumps("bar")])
+    con.commit()
+    con.close()
+
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    assert cache.get("foo") == "bar"
+    indexes = cache._con.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'cache';")
+    assert sorted(name for (name,) in indexes) == ["cache_exp", "sqlite_autoindex_cache_1"]
+    cache.close()
+
+
+@pytest.mark.parametrize("layout", ["rowid", "without_rowid"])
+def test_cache_schema__exp_index(tmp_path, layout):
+    cache = Cache(path=str(tmp_path), in_memory=False, layout=layout)
+    cache.set_many({"foo": 1, "bar": 2})
+    for sql in (cache._eviction_candidates_sql, cache._delete_expired_sql, cache._count_sql):
+        plan = " ".join(row[3] for row in cache._con.execute(f"EXPLAIN QUERY PLAN {sql}", {"count": 1, "now": 0}))
+        assert "cache_exp" in plan
+        assert "TEMP B-TREE" not in plan
+    cache.close()
+
+
+def test_cache_layout__without_rowid(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, layout="without_rowid")
+    cache.LARGE_VALUE_THRESHOLD = 1000
+    cache.set_many({"foo": "bar", "large": "x" * 2000})
+    cache.set_raw("raw", b"0123456789")
+
+    table_sql = cache._con.execute("SELECT sql FROM sqlite_master WHERE name = 'cache';").fetchone()[0]
+    assert table_sql.endswith("WITHOUT ROWID")
+    assert cache.get_many(["foo", "large"]) == {"foo": "bar", "large": "x" * 2000}
+
+    buffer = bytearray(4)
+    assert cache.read_into("raw", buffer, offset=2) == 4
+    assert buffer == b"2345"
+    assert b"".join(cache.iter_raw("raw", size=3)) == b"0123456789"
+    cache.close()
+
+    # The layout of an existing file is kept.
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    assert cache.get("foo") == "bar"
+    assert cache.read_into("raw", buffer) == 4
+    cache.close()
+
+
+def test_cache_layout__unknown():
+    with pytest.raises(ValueError, match="Unknown layout"):
+        Cache(layout="hashed")
+
+
+def test_cache_hit__fixed_window(cache):
+    with freeze_time("2022-01-01T00:00:00+00:00") as frozen:
+        assert cache.hit("foo", limit=2, window=10) == (True, 1, 10.0, 0.0)
+        frozen.tick(4)
+        assert cache.hit("foo", limit=2, window=10) == (True, 0, 6.0, 0.0)
+        assert cache.hit("foo", limit=2, window=10) == (False, 0, 6.0, 6.0)
+        assert cache.ttl("foo") == 6
+
+        frozen.tick(6)
+        assert cache.hit("foo", limit=2, window=10) == (True, 1, 10.0, 0.0)
+
+
+def test_cache_hit__sliding_window(cache):
+    with freeze_time("2022-01-01T00:00:00+00:00") as frozen:
+        assert cache.hit("foo", limit=2, window=10, algorithm="sliding_window").allowed is True
+        frozen.tick(4)
+        assert cache.hit("foo", limit=2, window=10, algorithm="sliding_window") == (True, 0, 10.0, 0.0)
+        assert cache.hit("foo", limit=2, window=10, algorithm="sliding_window") == (False, 0, 10.0, 6.0)
+
+        # The first hit leaves the window, but the second one is still in it.
+        frozen.tick(6)
+        assert cache.hit("foo", limit=2, window=10, algorithm="sliding_window") == (True, 0, 10.0, 0.0)
+        assert cache.hit("foo", limit=2, window=10, algorithm="sliding_window").retry_after == 4.0
+
+    cache.delete("foo")
+    assert cache._con.execute("SELECT COUNT(*) FROM cache_hit;").fetchone()[0] == 0
+
+
+def test_cache_hit__token_bucket(cache):
+    with freeze_time("2022-01-01T00:00:00+00:00") as frozen:
+        results = [cache.hit("foo", limit=4, window=8, algorithm="token_bucket") for _ in range(5)]
+        assert [result.remaining for result in results] == [3, 2, 1, 0, 0]
+        assert results[-1] == (False, 0, 8.0, 2.0)
+
+        # One token is added every two seconds.
+        frozen.tick(2)
+        assert cache.hit("foo", limit=4, window=8, algorithm="token_bucket") == (True, 0, 8.0, 0.0)
+        frozen.tick(8)
+        assert cache.hit("foo", limit=4, window=8, algorithm="token_bucket") == (True, 3, 2.0, 0.0)
+
+
+def test_cache_hit_many(cache):
+    with freeze_time("2022-01-01T00:00:00+00:00"):
+        cache.hit("foo", limit=1, window=10)
+        results = cache.hit_many(["foo", "bar"], limit=1, window=10)
+    assert {key: result.allowed for key, result in results.items()} == {"foo": False, "bar": True}
+
+
+def test_cache_hit__not_a_value(tmp_path):
+    primary = Cache(path=str(tmp_path), filename="primary", in_memory=False, changelog=True)
+    replica = Cache(path=str(tmp_path), filename="replica", in_memory=False)
+    primary.hit("foo", limit=2, window=10)
+    primary.set("bar", 1)
+
+    assert primary.get("foo", "default") == "default"
+    assert primary.get_raw("foo") is None
+    assert primary.get_many(["foo", "bar"]) == {"bar": 1}
+    assert primary.gets("foo") == (None, None)
+    assert primary.read_into("foo", bytearray(4)) is None
+    assert primary.iter_raw("foo") is None
+    with pytest.raises(ValueError, match="Nonexistent or expired cache key"):
+        primary.incr("foo")
+
+    # Rate limits are not replicated.
+    assert replica.apply_changes(primary.changes_since(0)) is not None
+    assert replica.get_all_keys() == ["bar"]
+    primary.close()
+    replica.close()
+
+
+def test_cache_hit__invalid():
+    cache = Cache()
+    with pytest.raises(ValueError, match="Limit must be a positive integer"):
+        cache.hit("foo", limit=0, window=10)
+    with pytest.raises(ValueError, match="Window must be positive"):
+        cache.hit("foo", limit=1, window=0)
+    with pytest.raises(ValueError, match="Unknown rate limit algorithm"):
+        cache.hit("foo", limit=1, window=10, algorithm="leaky_bucket")
+
+
+def test_cache_hash(cache):
+    cache.hset("foo", "a", 1)
+    cache.hset("foo", "b", [2])
+    cache.hset("foo", "a", 3)
+    assert cache.hget("foo", "a") == 3
+    assert cache.hget("foo", "c", "default") == "default"
+    assert cache.hgetall("foo") == {"a": 3, "b": [2]}
+
+    assert cache.hdel("foo", "a") is True
+    assert cache.hdel("foo", "a") is False
+    assert cache.hdel("foo", "b") is True
+    # The hash is removed with its last field.
+    assert "foo" not in cache
+    assert cache.hgetall("foo") == {}
+
+
+def test_cache_set_collection(cache):
+    assert cache.sadd("foo", "a") is True
+    assert cache.sadd("foo", "a") is False
+    assert cache.sadd("foo", "b") is True
+    assert cache.sismember("foo", "a") is True
+    assert cache.sismember("foo", "c") is False
+    assert cache.smembers("foo") == {"a", "b"}
+    assert cache.srem("foo", "a") is True
+    assert cache.smembers("foo") == {"b"}
+
+
+def test_cache_list(cache):
+    assert cache.rpush("foo", "b") == 1
+    assert cache.rpush("foo", "c") == 2
+    assert cache.lpush("foo", "a") == 3
+    assert cache.lrange("foo") == ["a", "b", "c"]
+    assert cache.lrange("foo", 1, 1) == ["b"]
+    assert cache.lrange("foo", -2) == ["b", "c"]
+    assert cache.lrange("foo", 0, -2) == ["a", "b"]
+    assert cache.lrange("foo", 2, 1) == []
+    assert cache.lrange("bar") == []
+
+
+def test_cache_collection__shares_parent_ttl(cache):
+    with freeze_time("2022-01-01T00:00:00+00:00") as frozen:
+        cache.hset("foo", "a", 1, timeout=10)
+        frozen.tick(5)
+        cache.hset("foo", "b", 2, timeout=100)
+        assert cache.ttl("foo") == 5
+
+        frozen.tick(5)
+        assert cache.hgetall("foo") == {}
+        # An expired hash starts over without its old fields.
+        cache.hset("foo", "c", 3)
+        assert cache.hgetall("foo") == {"c": 3}
+
+
+def test_cache_collection__replaced_or_deleted(cache):
+    cache.sadd("foo", "a")
+    cache.set("foo", "bar")
+    assert cache.get("foo") == "bar"
+    assert cache._con.execute("SELECT COUNT(*) FROM cache_item;").fetchone()[0] == 0
+
+    with pytest.raises(ValueError, match="Key does not hold a set"):
+        cache.sadd("foo", "a")
+
+    cache.rpush("bar", 1)
+    cache.delete("bar")
+    assert cache._con.execute("SELECT COUNT(*) FROM cache_item;").fetchone()[0] == 0
+
+
+def test_cache_collection__not_a_value(tmp_path):
+    primary = Cache(path=str(tmp_path), filename="primary", in_memory=False, changelog=True)
+    replica = Cache(path=str(tmp_path), filename="replica", in_memory=False)
+    primary.set_many({"foo": 1, "bar": 2})
+    replica.apply_changes(primary.changes_since(0))
+
+    primary.delete("foo")
+    primary.hset("foo", "a", 1)
+    assert primary.get("foo", "default") == "default"
+    assert primary.get_many(["foo", "bar"]) == {"bar": 2}
+    assert primary.read_into("foo", bytearray(4)) is None
+
+    # Collections are not replicated, and the older value is removed from the replica.
+    changes = primary.changes_since(2)
+    assert [(change.key, change.op, change.value) for change in changes] == [
+        ("foo", "delete", None),
+        ("foo", "set", None),
+    ]
+    replica.apply_changes(changes[1:])
+    assert replica.get_all_keys() == ["bar"]
+    primary.close()
+    replica.close()
+
+
+def test_cache_gets_and_cas(cache):
+    assert cache.gets("foo") == (None, None)
+    assert cache.cas("foo", "bar", None) is True
+    assert cache.cas("foo", "baz", None) is False
+
+    value, version = cache.gets("foo")
+    assert value == "bar"
+    cache.set("foo", "baz")
+    # The value was written after it was read.
+    assert cache.cas("foo", "qux", version) is False
+
+    value, version = cache.gets("foo")
+    assert value == "baz"
+    assert cache.cas("foo", "qux", version) is True
+    assert cache.get("foo") == "qux"
+    assert cache.cas("foo", "quux", version) is False
+
+
+def test_cache_cas__deleted_and_set_again(cache):
+    cache.set("foo", "bar")
+    _, version = cache.gets("foo")
+    cache.delete("foo")
+    cache.set("foo", "bar")
+    assert cache.cas("foo", "baz", version) is False
+
+
+def test_cache_cas_many(cache):
+    cache.set_many({"foo": 1, "bar": 2})
+    versions = cache.gets_many(["foo", "bar", "baz"])
+    assert {key: value for key, (value, _) in versions.items()} == {"foo": 1, "bar": 2}
+
+    cache.update("bar", 3)
+    results = cache.cas_many({"foo": (10, versions["foo"][1]), "bar": (20, versions["bar"][1]), "baz": (30, None)})
+    assert results == {"foo": True, "bar": False, "baz": True}
+    assert cache.get_many(["foo", "bar", "baz"]) == {"foo": 10, "bar": 3, "baz": 30}
+
+
+def test_cache_get_and_touch(cache):
+    cache.set("foo", "bar", timeout=800)
+    assert cache.get_and_touch("foo", timeout=1000) == "bar"
+    assert cache.ttl("foo") in {999, 1000}
+    assert cache.get_and_touch("bar", timeout=1000, default="baz") == "baz"
+
+
+def test_cache_get_and_touch__coalesced(cache):
+    # Less than 'TOUCH_THRESHOLD' of the timeout has passed, so the expiration is not rewritten.
+    cache.set("foo", "bar", timeout=950)
+    assert cache.get_and_touch("foo", timeout=1000) == "bar"
+    assert cache.ttl("foo") in {949, 950}
+
+    # Values are never shortened, and values that don't expire are kept that way.
+    assert cache.get_and_touch("foo", timeout=10) == "bar"
+    assert cache.ttl("foo") in {949, 950}
+    cache.set("baz", "qux", timeout=-1)
+    assert cache.get_and_touch("baz", timeout=1000) == "qux"
+    assert cache.ttl("baz") == -1
+
+
+def test_cache_get_many_and_touch(cache):
+    cache.set_many({"foo": 1, "bar": 2}, timeout=100)
+    assert cache.get_many_and_touch(["foo", "bar", "baz"], timeout=1000) == {"foo": 1, "bar": 2}
+    assert set(cache.ttl_many(["foo", "bar"]).values()) <= {999, 1000}
+
+
+def test_cache_sliding(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False, sliding=True)
+    cache.set_many({"foo": 1, "bar": 2}, timeout=100)
+    assert cache.get("foo") == 1
+    assert cache.get_many(["bar"]) == {"bar": 2}
+    assert set(cache.ttl_many(["foo", "bar"]).values()) <= {Cache.DEFAULT_TIMEOUT - 1, Cache.DEFAULT_TIMEOUT}
+    cache.close()
+
+
+def test_cache_read_only(tmp_path):
+    writer = Cache(path=str(tmp_path), in_memory=False)
+    reader = Cache(path=str(tmp_path), in_memory=False, read_only=True)
+    writer.set("foo", "bar")
+    writer.set("baz", "qux", timeout=1)
+    assert reader.get("foo") == "bar"
+    assert reader.get_many(["foo"]) == {"foo": "bar"}
+
+    with freeze_time(datetime.now(tz=timezone.utc) + timedelta(seconds=2)):
+        assert reader.get("baz") is None
+        assert reader.ttl("baz") == -2
+    # Expired values are left for the writer to delete.
+    assert reader._con.execute("SELECT COUNT(*) FROM cache;").fetchone()[0] == 2
+
+    with pytest.raises(sqlite3.OperationalError, match="readonly"):
+        reader.set("foo", "baz")
+
+    reader.close()
+    writer.close()
+
+
+def test_cache_read_only__before_writer(tmp_path):
+    reader = Cache(path=str(tmp_path), in_memory=False, read_only=True)
+    assert reader.get("foo", "default") == "default"
+
+    sqlite3.connect(str(tmp_path / ".cache")).close()
+    assert reader.get("foo") is None
+    assert reader.get_many(["foo"]) == {}
+    assert "foo" not in reader
+
+    writer = Cache(path=str(tmp_path), in_memory=False)
+    writer.set("foo", "bar")
+    assert reader.get("foo") == "bar"
+    writer.close()
+    reader.close()
+
+
+def test_cache_read_only__sliding():
+    with pytest.raises(ValueError, match="cannot extend the expiration"):
+        Cache(read_only=True, sliding=True)
+
+
+def test_cache_table(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    sessions = Cache(path=str(tmp_path), in_memory=False, table="sessions")
+    sessions.LARGE_VALUE_THRESHOLD = 1000
+    cache.set("foo", "bar")
+    sessions.set_many({"foo": "baz", "large": "x" * 2000})
+
+    assert cache.get("foo") == "bar"
+    assert sessions.get_many(["foo", "large"]) == {"foo": "baz", "large": "x" * 2000}
+    assert b"".join(sessions.iter_raw("large")) == pickle.dumps("x" * 2000, protocol=Cache.PICKLE_PROTOCOL)
+
+    sessions.clear()
+    assert cache.get("foo") == "bar"
+    tables = {name for (name,) in cache._con.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+    assert {"cache", "cache_chunk", "sessions", "sessions_chunk"} <= tables
+    # The schema version of other tables is kept separately.
+    assert cache._con.execute("PRAGMA user_version;").fetchone()[0] == len(Cache._migrations)
+    versions = dict(cache._con.execute("SELECT name, version FROM sqlite3_cache_schema;"))
+    assert versions == {"sessions": len(Cache._migrations)}
+    sessions.close()
+    cache.close()
+
+
+def test_cache_table__invalid():
+    with pytest.raises(ValueError, match="Invalid table name"):
+        Cache(table="cache; DROP TABLE cache")
+    with pytest.raises(ValueError, match="Invalid table name"):
+        Cache(table="sqlite_master")
+
+    # Names of the tables and indexes that hold the chunks, items and other data of another cache.
+    with pytest.raises(ValueError, match="Invalid table name"):
+        Cache(table="foo_item")
+    with pytest.raises(ValueError, match="Invalid table name"):
+        Cache().logical("cache_chunk")
+    with pytest.raises(ValueError, match="Invalid table name"):
+        Cache(table="cache_exp")
+
+
+def test_cache_default_timeout(cache):
+    other = cache.logical("other", default_timeout=10)
+    other.set("foo", "bar")
+    other.set_many({"bar": "baz"}, timeout={"baz": 100})
+    assert other.ttl("foo") in {9, 10}
+    assert other.ttl("bar") in {9, 10}
+    cache.set("foo", "bar")
+    assert cache.ttl("foo") in {Cache.DEFAULT_TIMEOUT - 1, Cache.DEFAULT_TIMEOUT}
+
+
+def test_cache_logical(tmp_path):
+    cache = Cache(path=str(tmp_path), in_memory=False)
+    sessions = cache.logical("sessions")
+    assert sessions._con is cache._con
+
+    cache.set("foo", "bar")
+    sessions.set("foo", "baz")
+    assert cache.get("foo") == "bar"
+    assert sessions.get("foo") == "baz"
+
+    cache.clear_all()
+    assert cache.get("foo") is None
+    assert sessions.get("foo") is None
+    cache.close_all()
@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip("django")
+
+from sqlite3_cache.django_cache import SQLiteCache  # noqa: E402
+
+
+@pytest.fixture
+def django_cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "django.cache"), {"KEY_PREFIX": "prefix"})
+    try:
+        yield cache
+    finally:
+        cache.clear()
+        cache._cache.close()
+
+
+def test_django_cache(django_cache):
+    django_cache.set("foo", "bar")
+    assert django_cache.get("foo") == "bar"
+    assert django_cache.has_key("foo")
+    assert django_cache.add("foo", "baz") is False
+    assert django_cache.touch("foo", 10) is True
+    assert django_cache.delete("foo") is True
+    assert django_cache.delete("foo") is False
+    assert django_cache.get("foo", "default") == "default"
+
+
+def test_django_cache__prefix_and_version(django_cache):
+    django_cache.set("foo", 1, version=1)
+    django_cache.set("foo", 2, version=2)
+    assert django_cache.get("foo", version=1) == 1
+    assert django_cache.get("foo", version=2) == 2
+    assert django_cache._cache.get("prefix:1:foo") == 1
+
+
+def test_django_cache__many(django_cache):
+    assert django_cache.set_many({"one": 1, "two": 2}) == []
+    assert django_cache.get_many(["one", "two", "three"]) == {"one": 1, "two": 2}
+    django_cache.delete_many(["one", "two"])
+    assert django_cache.get_many(["one", "two"]) == {}
+
+
+def test_django_cache__incr(django_cache):
+    django_cache.set("foo", 1)
+    assert django_cache.incr("foo") == 2
+    assert django_cache.decr("foo", 2) == 0
+    with pytest.raises(ValueError, match="Nonexistent"):
+        django_cache.incr("bar")
+
+
+def test_django_cache__timeouts(django_cache):
+    django_cache.set("zero", 1, timeout=0)
+    django_cache.set("forever", 1, timeout=None)
+    assert django_cache.get("zero") is None
+    assert django_cache._cache.ttl("prefix:1:forever") == -1
+
+
+def test_django_cache__cull(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "django.cache"), {"OPTIONS": {"MAX_ENTRIES": 10, "CULL_FREQUENCY": 2}})
+    cache.CULL_EVERY = 1
+    cache.set_many({f"key{i}": i for i in range(20)})
+    assert len(cache._cache.get_all_keys()) == 10
+    cache._cache.close()
@@ -0,0 +1,14 @@
+from sqlite3_cache.hashing import hash_positions
+
+
+def test_hash_positions():
+    positions = list(hash_positions("foo", 5, 1000))
+    assert len(positions) == 5
+    assert all(0 <= pos < 1000 for pos in positions)
+    assert len(set(positions)) == 5
+    assert list(hash_positions("foo", 5, 1000)) == positions
+    assert list(hash_positions("bar", 5, 1000)) != positions
+
+
+def test_hash_positions__prefix_of_more_positions():
+    assert list(hash_positions("foo", 3, 1000)) == list(hash_positions("foo", 5, 1000))[:3]
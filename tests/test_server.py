@@ -0,0 +1,127 @@
+from threading import Thread
+
+import pytest
+
+from sqlite3_cache.server import CacheClient, CacheServer, _Commands
+
+
+@pytest.fixture
+def client(cache):
+    with CacheServer(cache, ("127.0.0.1", 0)) as server:
+        thread = Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+        thread.start()
+        try:
+            with CacheClient(server.address) as client:
+                yield client
+        finally:
+            server.shutdown()
+            thread.join()
+
+
+def test_server__get_and_set(cache, client):
+    client.set("foo", {"bar": [1, 2]})
+    assert client.get("foo") == {"bar": [1, 2]}
+    assert cache.get("foo") == {"bar": [1, 2]}
+    assert client.get("missing", "default") == "default"
+
+    cache.set("baz", 1)
+    assert client["baz"] == 1
+    assert "baz" in client
+    assert "missing" not in client
+    with pytest.raises(KeyError):
+        client["missing"]
+
+
+def test_server__timeouts(client):
+    client.set("foo", 1, timeout=-1)
+    assert client.ttl("foo") == -1
+    assert client.touch("foo", 100) is True
+    assert 0 < client.ttl("foo") <= 100
+    assert client.touch("missing") is False
+    assert client.ttl("missing") == -2
+
+
+def test_server__delete(cache, client):
+    client["foo"] = 1
+    assert client.delete("foo") is True
+    assert client.delete("foo") is False
+
+    client.set_many({"foo": 1, "bar": 2})
+    del client["bar"]
+    assert cache.get_many(["foo", "bar"]) == {"foo": 1}
+
+    client.delete_many(["foo"])
+    assert "foo" not in cache
+
+
+def test_server__many(client):
+    client.set_many({"foo": b"", "bar": 2, "baz": "x" * 100_000})
+    assert client.get_many(["foo", "bar", "baz", "missing"]) == {"foo": b"", "bar": 2, "baz": "x" * 100_000}
+    client.clear()
+    assert client.get_many(["foo", "bar", "baz"]) == {}
+
+
+def test_server__pipeline(cache, client):
+    pipeline = client.pipeline()
+    assert pipeline.set("foo", 1) is None
+    assert pipeline.get("foo") is None
+    assert pipeline.get_many(["foo", "bar"]) is None
+    assert pipeline.delete("foo") is None
+    assert pipeline.execute() == [None, 1, {"foo": 1}, True]
+    assert pipeline.execute() == []
+
+    with client.pipeline() as pipeline:
+        pipeline.set("bar", 2)
+    assert cache.get("bar") == 2
+
+    # Requests are discarded if the block raises.
+    with pytest.raises(RuntimeError), client.pipeline() as pipeline:
+        pipeline.set("baz", 3)
+        raise RuntimeError
+    assert "baz" not in cache
+
+
+def test_server__pipeline_larger_than_socket_buffers(cache, client):
+    value = "x" * 2**18
+    client.set("foo", value)
+    pipeline = client.pipeline()
+    for i in range(64):
+        pipeline.set(f"bar{i}", value)
+        pipeline.get("foo")
+    assert pipeline.execute() == [None, value] * 64
+
+
+def test_server__max_body_size(cache):
+    with CacheServer(cache, ("127.0.0.1", 0), max_body_size=1000) as server:
+        thread = Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+        thread.start()
+        try:
+            with CacheClient(server.address) as client:
+                with pytest.raises(ConnectionError):
+                    client.set("foo", "x" * 2000)
+                # A new connection is opened for the next request.
+                client.set("foo", "x")
+                assert client.get("foo") == "x"
+        finally:
+            server.shutdown()
+            thread.join()
+
+
+def test_server__errors(cache, client):
+    cache.set("foo", "x")
+    pipeline = client.pipeline()
+    pipeline._send({"op": "incr"}, [], pipeline._result)
+    pipeline.set("bar", 1)
+    with pytest.raises(ValueError, match=r"Unknown operation: 'incr'\."):
+        pipeline.execute()
+
+    # Requests after an error are still run, and the connection can be used again.
+    assert client.get("bar") == 1
+
+
+def test_server__commands_need_send():
+    class Commands(_Commands):
+        pass
+
+    with pytest.raises(TypeError, match="abstract method"):
+        Commands()
@@ -0,0 +1,57 @@
+import pytest
+
+from sqlite3_cache import CountMinSketch
+
+
+def test_count_min_sketch():
+    sketch = CountMinSketch(width=1000)
+    for i in range(100):
+        sketch.add(f"key{i}", count=i)
+
+    assert all(sketch.estimate(f"key{i}") >= i for i in range(100))
+    assert sum(sketch.estimate(f"key{i}") - i for i in range(100)) < 100
+    assert sketch.estimate("other") == 0
+
+
+def test_count_min_sketch__halved_after_sample():
+    sketch = CountMinSketch(width=100, sample_size=10)
+    sketch.add("foo", count=9)
+    assert sketch.estimate("foo") == 9
+    sketch.add("bar")
+    assert sketch.estimate("foo") == 4
+    assert sketch.estimate("bar") == 0
+
+
+def test_count_min_sketch__raise_to():
+    sketch = CountMinSketch(width=100)
+    sketch.raise_to("foo", 10)
+    sketch.raise_to("foo", 5)
+    assert sketch.estimate("foo") == 10
+
+
+def test_count_min_sketch__load():
+    sketch = CountMinSketch(width=100)
+    sketch.add("foo", count=3)
+
+    other = CountMinSketch(width=100)
+    other.load(sketch.to_bytes())
+    assert other.estimate("foo") == 3
+
+    other.clear()
+    assert other.estimate("foo") == 0
+
+    with pytest.raises(ValueError, match="Expected counters for a sketch of width 10 and depth 4"):
+        CountMinSketch(width=10).load(sketch.to_bytes())
+
+
+@pytest.mark.parametrize(
+    ("width", "depth", "sample_size", "message"),
+    [
+        (0, 4, None, "Width must be a positive integer"),
+        (10, 0, None, "Depth must be a positive integer"),
+        (10, 4, 0, "Sample size must be a positive integer"),
+    ],
+)
+def test_count_min_sketch__invalid(width, depth, sample_size, message):
+    with pytest.raises(ValueError, match=message):
+        CountMinSketch(width=width, depth=depth, sample_size=sample_size)